@@ -0,0 +1,180 @@
+"""
+async_main.py
+"""
+from startup import STARTUP  # первым, чтобы замерить время импорта остальных модулей
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from telebot import types, util as telebot_util
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware
+from typing import Callable, Coroutine
+from static import *
+from bot import get_async_bot
+from steps import HANDLERS, NEXT_STEP_HANDLERS, use_transport
+from transport import AsyncTransport
+from render import RENDER, init_render_worker
+from webhook import WebhookServer
+from state import save_session, load_sessions
+from session import SESSIONS
+from janitor import JANITOR
+from metrics import METRICS, MetricsServer
+
+
+ASYNC_BOT: AsyncTeleBot | None = None  # клиент бота, создаётся при запуске (см. main())
+drawing_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=ASYNC_DRAWING_WORKERS,
+                                                          thread_name_prefix='drawing')
+next_steps: Dict[int, List[Tuple[Callable[..., Coroutine], Tuple]]] = dict()
+# ключ – айди чата, значение – обработчики следующего сообщения и их аргументы (см. AsyncTransport)
+
+
+async def process_next_step(message: types.Message) -> None:
+    """
+    Передаёт сообщение зарегистрированным обработчикам следующего сообщения.
+    Как и в ``TeleBot``, такое сообщение не попадает в другие обработчики
+    :param message: сообщение пользователя
+    """
+    for callback, args in next_steps.pop(message.chat.id, list()):
+        with METRICS.timer('step_seconds', errors='step_errors', step=callback.__name__):
+            await callback(message, *args)
+
+
+
+async def serve_webhook() -> None:
+    """
+    Принимает обновления через webhook: HTTP-сервер работает в отдельном потоке,
+    обновления передаются обработчикам в цикле событий по порядку
+    """
+    loop = asyncio.get_running_loop()
+
+    def process_update(update: types.Update, on_done: Callable[[], None]) -> None:
+        """
+        Передаёт обновление в цикл событий; ``on_done`` вызывается, когда обработка закончена
+        :param update: обновление
+        :param on_done: функция, которая вызывается после обработки
+        """
+        future = asyncio.run_coroutine_threadsafe(ASYNC_BOT.process_new_updates([update]), loop)
+        future.add_done_callback(lambda _: on_done())
+
+    server = WebhookServer(process_update, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN)
+    if WEBHOOK_URL:
+        await ASYNC_BOT.set_webhook(url=WEBHOOK_URL,
+                                    secret_token=WEBHOOK_SECRET_TOKEN,
+                                    max_connections=WEBHOOK_MAX_CONNECTIONS)
+    try:
+        await loop.run_in_executor(None, server.serve_forever)
+    finally:
+        server.shutdown()
+
+
+class SessionMiddleware(BaseMiddleware):
+    """
+    Обрабатывает обновления одного чата по очереди, а обновления разных чатов – параллельно,
+    и сохраняет состояние чата после обработки каждого сообщения и нажатия кнопки.\n
+    ``AsyncTeleBot`` запускает обработку всех полученных обновлений сразу, поэтому обработка каждого обновления
+    начинается с ожидания блокировки его чата (``asyncio.Lock`` пропускает ожидающих по порядку)
+    и заканчивается её освобождением. Так обработчики одного чата не пересекаются
+    (в том числе при выборе обработчика следующего шага) и не меняют превью одновременно в разных потоках
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+        self.active_chats: Dict[int, int] = dict()
+        # ключ – айди чата, значение – сколько его обновлений сейчас обрабатывается или ждёт обработки
+        self.active_chats_lock = threading.Lock()
+        # active_chats читает поток уборки, который под этой блокировкой удаляет состояния неактивных чатов
+        self.chat_locks: Dict[int, asyncio.Lock] = dict()
+        # ключ – айди чата, значение – блокировка, которую держит обрабатываемое обновление чата
+
+    @staticmethod
+    def find_chat_id(message: types.Message | types.CallbackQuery) -> int:
+        """
+        Определяет чат сообщения или нажатия кнопки
+        :param message: сообщение или запрос
+        :return: айди чата
+        """
+        return message.message.chat.id if isinstance(message, types.CallbackQuery) else message.chat.id
+
+    def is_active(self, chat_id: int) -> bool:
+        """
+        Определяет, обрабатывается ли сейчас обновление чата
+        :param chat_id: айди чата
+        :return: ``True``, если обрабатывается. ``False`` – в обратном случае
+        """
+        return chat_id in self.active_chats
+
+    async def pre_process(self, message: types.Message | types.CallbackQuery, data: Dict) -> None:
+        chat_id = self.find_chat_id(message)
+        with self.active_chats_lock:
+            self.active_chats[chat_id] = self.active_chats.get(chat_id, 0) + 1
+        lock = self.chat_locks.get(chat_id)
+        if lock is None:
+            lock = self.chat_locks[chat_id] = asyncio.Lock()
+        await lock.acquire()
+
+    async def post_process(self, message: types.Message | types.CallbackQuery, data: Dict,
+                           exception: Exception | None) -> None:
+        chat_id = self.find_chat_id(message)
+        try:
+            save_session(chat_id, next_steps.get(chat_id, list()))
+        finally:
+            self.chat_locks[chat_id].release()
+            with self.active_chats_lock:
+                if self.active_chats[chat_id] > 1:
+                    self.active_chats[chat_id] -= 1
+                else:
+                    del self.active_chats[chat_id]
+                    del self.chat_locks[chat_id]
+
+
+def main() -> None:
+    """
+    Запускает асинхронного бота: настраивает лог, загружает шрифты и состояния чатов,
+    запускает фоновые потоки и процессы, затем принимает обновления. Время этапов запуска записывается в лог
+    """
+    global ASYNC_BOT
+    STARTUP.mark('импорт')
+    logging.basicConfig(level=logging.INFO, filename=f'app.log', filemode='w',
+                        format='%(asctime)s %(levelname)s %(message)s')
+    with STARTUP.stage('шрифты'):
+        init_render_worker()
+    if METRICS_ENABLED:
+        METRICS.enable()  # до запуска процессов отрисовки, чтобы они собирали замеры
+    # процессы создаются копированием основного процесса (fork), поэтому запускаются раньше клиента бота
+    # и сервера метрик, пока в процессе нет других потоков
+    with STARTUP.stage('процессы отрисовки'):
+        RENDER.start()
+    with STARTUP.stage('клиент бота'):
+        ASYNC_BOT = get_async_bot()
+        use_transport(AsyncTransport(ASYNC_BOT, drawing_executor, next_steps))
+        # первым, чтобы сообщение, которого ждёт шаг, не попало в другие обработчики
+        ASYNC_BOT.register_message_handler(process_next_step, func=lambda message: message.chat.id in next_steps,
+                                           content_types=telebot_util.content_type_media)
+        HANDLERS.register(ASYNC_BOT)
+    with STARTUP.stage('состояния чатов'):
+        next_steps.update(load_sessions(NEXT_STEP_HANDLERS))
+        session_middleware = SessionMiddleware()
+        ASYNC_BOT.setup_middleware(session_middleware)
+    if METRICS_ENABLED:
+        with STARTUP.stage('метрики'):
+            for handler in ASYNC_BOT.message_handlers + ASYNC_BOT.callback_query_handlers:
+                # обработчики следующего сообщения замеряются в process_next_step()
+                if handler['function'] is not process_next_step:
+                    handler['function'] = METRICS.time_function(handler['function'], 'step_seconds', 'step_errors',
+                                                                step=handler['function'].__name__)
+            JANITOR.add_gauges(METRICS)
+            METRICS.add_gauge('processing_chats', lambda: len(session_middleware.active_chats))
+            MetricsServer(METRICS, METRICS_HOST, METRICS_PORT, METRICS_PATH).start()
+    with STARTUP.stage('фоновые потоки'):
+        SESSIONS.start()
+        JANITOR.start(is_active=session_middleware.is_active,
+                      on_evict=lambda chat_id: next_steps.pop(chat_id, None),
+                      lock=session_middleware.active_chats_lock)
+    STARTUP.log()
+    asyncio.run(serve_webhook() if WEBHOOK_ENABLED else ASYNC_BOT.infinity_polling())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+batch.py
+"""
+import re
+import csv
+import copy
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Literal
+from static import *
+from util import pick_title_params, istoowide, define_fill
+from photo import get_prepared_photo, get_photo_analysis, drop_prepared_photo, PhotoTooLargeError
+from drawing import draw_cover
+from render import init_render_worker, encode_png
+
+
+BATCH_STAGES: Tuple[str, ...] = ('photo', 'titles', 'draw', 'encode', 'write')
+# этапы отрисовки одной обложки, для которых измеряется время
+PHOTO_BG_TYPES: Tuple[str, ...] = ('white', 'grey', 'grad-white', 'grad-grey')
+COLOR_KEYS: Tuple[str, ...] = ('upper_color', 'lower_color', 'left_color', 'right_color')
+
+
+class ManifestError(ValueError):
+    """
+    Обложка из манифеста не может быть отрисована из-за неправильных параметров
+    """
+
+
+def read_manifest(manifest_path: str) -> List[Dict]:
+    """
+    Читает манифест пакетной отрисовки: json-список объектов или csv-файл с заголовком.\n
+    Ключи (столбцы): ``photo``, ``upper_title``, ``lower_title``, ``upper_color``, ``lower_color``,
+    ``left_color``, ``right_color``, ``corners``, ``copyright_sign``; необязательные – ``name``, ``photo_bg``.
+    Пути к фотографиям считаются от директории манифеста
+    :param manifest_path: путь к манифесту (``.json`` или ``.csv``)
+    :return: список параметров обложек
+    """
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as file:
+        if manifest_path.lower().endswith('.csv'):
+            items = [{key: value for key, value in row.items() if value not in (None, '')}
+                     for row in csv.DictReader(file)]
+        else:
+            items = json.load(file)
+    if not isinstance(items, list):
+        raise ManifestError('Манифест должен быть списком обложек')
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('photo'), str) or not item['photo']:
+            raise ManifestError(f'Обложка {i}: нет фотографии')
+        if 'name' in item and (not isinstance(item['name'], str) or not item['name']):
+            raise ManifestError(f'Обложка {i}: имя обложки должно быть непустой строкой')
+        item['photo'] = os.path.join(base_dir, item['photo'])
+        item.setdefault('name', f'{i:03d}_' + os.path.splitext(os.path.basename(item['photo']))[0])
+    return items
+
+
+def parse_corners(corners: Any) -> List[int]:
+    """
+    Определяет расположение прямоугольников
+    :param corners: номер готового расположения из ``CORNER_COORDS``,
+                    строка из 12 символов 0/1 или список из 12 состояний прямоугольников
+    :return: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
+    """
+    if isinstance(corners, str) and re.fullmatch(r'\d{1,2}', corners):
+        corners = int(corners)
+    if not isinstance(corners, (int, str, list)) or isinstance(corners, bool):
+        raise ManifestError(f'неизвестное расположение прямоугольников: {corners!r}')
+    if isinstance(corners, int):
+        if corners not in CORNER_COORDS:
+            raise ManifestError(f'нет расположения прямоугольников {corners}')
+        return list(CORNER_COORDS[corners])
+    if isinstance(corners, str):
+        corners = [int(state) for state in corners if state in '01']
+    if len(corners) != RECTANGLE_NUM * 2 or any(state not in (0, 1) for state in corners):
+        raise ManifestError(f'расположение прямоугольников должно состоять из {RECTANGLE_NUM * 2} значений 0/1')
+    return list(corners)
+
+
+def make_title_params(text: Any, title_type: Literal['upper', 'lower'], color: str) -> Tuple[str, Dict]:
+    """
+    Подбирает параметры заголовка и проверяет его так же, как бот (этапы 2б / 3б):
+    пустой заголовок в боте отправить нельзя, поэтому он тоже не принимается
+    :param text: заголовочный текст
+    :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param color: цвет подложки заголовка
+    :return: заголовок в верхнем регистре и параметры надписи
+    """
+    if not isinstance(text, str) or not text.strip():
+        raise ManifestError(f'заголовок ({title_type}) должен быть непустой строкой')
+    text = text.strip().upper()
+    max_n = 3 if title_type == 'upper' else 2
+    if len(text.split('\n')) > max_n:
+        raise ManifestError(f'в заголовке ({title_type}) больше {max_n} строк')
+    params = pick_title_params(text, title_type)
+    if istoowide(text, params['font']):
+        raise ManifestError(f'заголовок ({title_type}) слишком длинный')
+    return text, params | {'fill': define_fill(color)}
+
+
+def make_cover_info(item: Dict) -> Dict:
+    """
+    Собирает параметры обложки из параметров манифеста.
+    Фон или маска для фотографии выбираются по соотношению сторон, как в боте (этап 1б)
+    :param item: параметры обложки из манифеста
+    :return: параметры обложки
+    """
+    cover_info = copy.deepcopy(COVER_BASE_INFO)
+    cover_info['photo'] = item['photo']
+    for key in COLOR_KEYS:
+        color = str(item.get(key, '')).upper()
+        if not re.fullmatch(r'#[0-9A-F]{6}', color):
+            raise ManifestError(f'{key}: HEX-код должен состоять из 7 символов, первый из которых #')
+        cover_info[key] = color
+    cover_info['corners'] = parse_corners(item.get('corners', 12))
+    copyright_sign = item.get('copyright_sign', 0)
+    if isinstance(copyright_sign, str) and re.fullmatch(r'\d{1,2}', copyright_sign):
+        copyright_sign = int(copyright_sign)
+    if not isinstance(copyright_sign, int) or isinstance(copyright_sign, bool) \
+            or not 0 <= copyright_sign < RECTANGLE_NUM * 2:
+        raise ManifestError(f'нет прямоугольника {copyright_sign!r} для копирайт-надписи')
+    cover_info['copyright_sign'] = copyright_sign
+
+    width, height = get_prepared_photo(cover_info['photo'])['size']
+    if (width / height) < (PHOTO_WIDTH / PHOTO_HEIGHT):
+        cover_info['photo_bg'] = item.get('photo_bg', 'grad-grey')
+        if cover_info['photo_bg'] not in PHOTO_BG_TYPES:
+            raise ManifestError(f'неизвестный фон для фото: {cover_info["photo_bg"]}')
+    elif (width / height) > (PHOTO_WIDTH / PHOTO_HEIGHT):
+        cover_info['mask'] = True
+    cover_info['photo_analysis'] = get_photo_analysis(cover_info['photo'])
+    return cover_info
+
+
+def render_batch_item(item: Dict, output_dir: str) -> Dict:
+    """
+    Рисует одну обложку из манифеста и сохраняет её в png. Вызывается в процессе отрисовки
+    :param item: параметры обложки из манифеста
+    :param output_dir: директория для готовых обложек
+    :return: словарь с именем обложки (``name``), путём к файлу (``path``) или ошибкой (``error``)
+             и временем этапов в секундах (``timings``)
+    """
+    timings = dict()
+    result = {'name': item['name'], 'timings': timings}
+    started = stage_started = time.perf_counter()
+
+    def finish_stage(stage: str) -> None:
+        nonlocal stage_started
+        now = time.perf_counter()
+        timings[stage] = now - stage_started
+        stage_started = now
+
+    try:
+        cover_info = make_cover_info(item)
+        finish_stage('photo')
+        cover_info['upper_title'], cover_info['upper_title_params'] = make_title_params(
+            item.get('upper_title'), 'upper', cover_info['upper_color'])
+        cover_info['lower_title'], cover_info['lower_title_params'] = make_title_params(
+            item.get('lower_title'), 'lower', cover_info['lower_color'])
+        finish_stage('titles')
+        image = draw_cover(cover_info)
+        finish_stage('draw')
+        png = encode_png(image)
+        finish_stage('encode')
+        result['path'] = os.path.join(output_dir, item['name'] + '.png')
+        with open(result['path'], 'wb') as file:
+            file.write(png)
+        finish_stage('write')
+    except (ValueError, OSError, PhotoTooLargeError) as error:
+        result['error'] = str(error)
+    except Exception as error:
+        # одна неправильная обложка не должна останавливать всю отрисовку
+        logging.exception(f'{item["name"]} Ошибка при отрисовке обложки')
+        result['error'] = f'{type(error).__name__}: {error}'
+    finally:
+        drop_prepared_photo(item['photo'])
+        timings['total'] = time.perf_counter() - started
+    return result
+
+
+def render_batch(items: List[Dict], output_dir: str, workers: int = RENDER_WORKERS) -> List[Dict]:
+    """
+    Рисует обложки из манифеста в пуле процессов, выводя время каждой обложки по мере готовности
+    :param items: параметры обложек, которые вернул ``read_manifest()``
+    :param output_dir: директория для готовых обложек
+    :param workers: количество процессов отрисовки; 0 – рисовать в текущем процессе
+    :return: результаты ``render_batch_item()`` в порядке манифеста
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    print_result_header()
+    results = list()
+    if workers <= 0:
+        init_render_worker()
+        for item in items:
+            results.append(render_batch_item(item, output_dir))
+            print_result(results[-1])
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('fork'),
+                             initializer=init_render_worker) as executor:
+        futures = {executor.submit(render_batch_item, item, output_dir): i for i, item in enumerate(items)}
+        results = [dict() for _ in items]
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            print_result(results[futures[future]])
+    return results
+
+
+def print_result_header() -> None:
+    """
+    Выводит заголовок таблицы времени отрисовки
+    """
+    print(f'{"name":<32}' + ''.join(f'{stage:>9}' for stage in BATCH_STAGES + ('total',)))
+
+
+def print_result(result: Dict) -> None:
+    """
+    Выводит время этапов отрисовки обложки в миллисекундах
+    :param result: результат ``render_batch_item()``
+    """
+    timings = result['timings']
+    line = f'{result["name"]:<32}' + ''.join(
+        f'{timings[stage] * 1000:>9.1f}' if stage in timings else f'{"-":>9}' for stage in BATCH_STAGES + ('total',))
+    if 'error' in result:
+        line += f'  ошибка: {result["error"]}'
+    print(line, flush=True)
+
+
+def main() -> int:
+    """
+    Пакетная отрисовка обложек без Telegram: ``python batch.py manifest.json out/``
+    :return: код завершения: 0 – все обложки отрисованы, 1 – есть ошибки
+    """
+    parser = argparse.ArgumentParser(description='Пакетная отрисовка обложек по манифесту (json или csv)')
+    parser.add_argument('manifest', help='путь к манифесту')
+    parser.add_argument('output_dir', help='директория для готовых обложек')
+    parser.add_argument('-w', '--workers', type=int, default=RENDER_WORKERS,
+                        help='количество процессов отрисовки; 0 – рисовать в текущем процессе')
+    parser.add_argument('--report', help='путь к json-отчёту с временем отрисовки каждой обложки')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(message)s')
+
+    try:
+        items = read_manifest(args.manifest)
+    except (ValueError, OSError) as error:
+        print(f'Не удалось прочитать манифест: {error}')
+        return 1
+    started = time.perf_counter()
+    results = render_batch(items, args.output_dir, args.workers)
+    elapsed = time.perf_counter() - started
+    failed = sum('error' in result for result in results)
+    print(f'Готово: {len(results) - failed} из {len(results)} обложек за {elapsed:.2f} с')
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump({'elapsed': elapsed, 'workers': args.workers, 'items': results}, file,
+                      ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
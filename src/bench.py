@@ -0,0 +1,364 @@
+"""
+bench.py
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from functools import partial
+from typing import Any, Callable, Literal
+from PIL import Image, features
+from static import *
+from fonts import FONTS
+from geometry import Geometry, FULL_GEOMETRY, PREVIEW_GEOMETRY
+from util import create_gradient, make_gradient, pick_title_params, title_layouts, title_layouts_lock
+from photo import get_prepared_photo, get_photo_analysis, drop_prepared_photo
+from drawing import create_preview_pic, redraw_rectangle, draw_cover
+from preview import get_preview, drop_preview
+from render import init_render_worker, encode_png
+from batch import make_cover_info, make_title_params
+
+
+BENCH_PHOTO_SIZES: Dict[str, Tuple[int, int]] = {
+    'portrait-4x5':   (1080, 1350),
+    'square':         (1080, 1080),
+    'cover-3x2':      (1620, 1080),
+    'wide-16x9':      (1920, 1080),
+    'phone-4x3':      (4032, 3024),
+    'phone-3x4':      (3024, 4032),
+    'camera-24mp':    (6000, 4000),
+    'panorama-3x1':   (6000, 2000),
+}
+# ключ – название фотографии, значение – её размер (ширина, высота); фотографии генерируются в jpeg
+BENCH_TITLES: Dict[str, List[Tuple[str, Literal['upper', 'lower']]]] = {
+    'upper-1-line': [
+        ('ПОСВЯТ', 'upper'),
+        ('ДЕНЬ ФАКУЛЬТЕТА', 'upper'),
+        ('КАРАОКЕ-ВЕЧЕР', 'upper'),
+        ('КВАРТИРНИК НА ПОКРОВКЕ', 'upper'),
+    ],
+    'upper-1-line-diacritics': [
+        ('ЁЛКА ЛАЙВА', 'upper'),
+        ('ЙОГА НА КРЫШЕ', 'upper'),
+        ('НОВОГОДНИЙ КОНЦЕРТ', 'upper'),
+        ('ЗИМНИЙ ВЫЕЗД', 'upper'),
+    ],
+    'upper-2-lines': [
+        ('ДЕНЬ\nПЕРВОКУРСНИКА', 'upper'),
+        ('ЛЕТНЯЯ ШКОЛА\nЖУРНАЛИСТИКИ', 'upper'),
+        ('ФЕСТИВАЛЬ\nСТУДЕНЧЕСКИХ МЕДИА', 'upper'),
+        ('ВСТРЕЧА\nС ВЫПУСКНИКАМИ', 'upper'),
+    ],
+    'upper-2-lines-diacritics': [
+        ('ЁЛОЧНЫЙ\nБАЗАР', 'upper'),
+        ('ПРЕМИЯ\nЛУЧШИЙ ЙОГ ВЫШКИ', 'upper'),
+        ('КИНОКЛУБ:\nВСЁ И СРАЗУ', 'upper'),
+        ('МАЙСКИЙ\nТУРНИР ПО ФУТБОЛУ', 'upper'),
+    ],
+    'upper-3-lines': [
+        ('КОНФЕРЕНЦИЯ\nМЕДИА\nИ ТЕХНОЛОГИИ', 'upper'),
+        ('ЗАКРЫТИЕ\nСЕЗОНА\nHSE LIVE', 'upper'),
+        ('ПРЕЗЕНТАЦИЯ\nСТУДЕНЧЕСКИХ\nПРОЕКТОВ', 'upper'),
+        ('МАСТЕР-КЛАСС\nПО ФОТОГРАФИИ\nДЛЯ НОВИЧКОВ', 'upper'),
+    ],
+    'upper-3-lines-diacritics': [
+        ('ЁЛКА\nФАКУЛЬТЕТА\nГУМАНИТАРНЫХ НАУК', 'upper'),
+        ('БОЛЬШОЙ\nЗИМНИЙ\nКВИЗ', 'upper'),
+        ('ЛЕКЦИЯ\nО НОВОЙ\nМУЗЫКЕ', 'upper'),
+        ('ВЕЧЕР\nНАСТОЛЬНЫХ\nИГР И ЧАЁВ', 'upper'),
+    ],
+    'lower-1-line': [
+        ('АННА СМИРНОВА', 'lower'),
+        ('ИВАН ПЕТРОВ', 'lower'),
+        ('МАРИЯ КУЗНЕЦОВА', 'lower'),
+        ('ЕГОР ВОЛКОВ', 'lower'),
+    ],
+    'lower-1-line-diacritics': [
+        ('ПЁТР СОКОЛОВ', 'lower'),
+        ('ДМИТРИЙ ВОЛКОВ', 'lower'),
+        ('АЛЕКСЕЙ ФЁДОРОВ', 'lower'),
+        ('СЕМЁН ЛЕБЕДЕВ', 'lower'),
+    ],
+    'lower-2-lines': [
+        ('АННА СМИРНОВА\nИВАН ПЕТРОВ', 'lower'),
+        ('ЕЛЕНА ОРЛОВА\nМАРИЯ КУЗНЕЦОВА', 'lower'),
+        ('АЛЕКСАНДРА МОРОЗОВА\nЕГОР ВОЛКОВ', 'lower'),
+        ('ОЛЬГА НОВИКОВА\nКИРИЛЛ ЗАХАРОВ', 'lower'),
+    ],
+    'lower-2-lines-diacritics': [
+        ('ПЁТР СОКОЛОВ\nЕЛЕНА ОРЛОВА', 'lower'),
+        ('АЛЕКСАНДРА МОРОЗОВА\nСЕМЁН ЛЕБЕДЕВ', 'lower'),
+        ('ОЛЬГА НОВИКОВА\nАНДРЕЙ ЗАЙЦЕВ', 'lower'),
+        ('НИКОЛАЙ ЕГОРОВ\nФЁДОР БЕЛОВ', 'lower'),
+    ],
+}
+# ключ – название группы заголовков, значение – заголовки и их типы
+BENCH_CHAT_ID: int = 0  # айди чата, в хранилище которого сохраняются превью замеров
+BENCH_COLORS: Dict[str, str] = {
+    'upper_color': '#E4281B',
+    'lower_color': '#FFFFFF',
+    'left_color':  '#1F4EA1',
+    'right_color': '#F8C8DC',
+}
+# ключ – параметр обложки, значение – цвет, которым рисуются обложки замеров
+
+
+def make_bench_photo(path: str, size: Tuple[int, int]) -> None:
+    """
+    Создаёт фотографию для замеров: градиенты и шум, чтобы jpeg сжимался и декодировался примерно как снимок
+    :param path: путь к фотографии
+    :param size: размер фотографии (ширина, высота)
+    """
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.effect_noise(size, 48)
+    blue = Image.radial_gradient('L').resize(size)
+    Image.merge('RGB', (red, green, blue)).save(path, format='JPEG', quality=90)
+
+
+def make_bench_photos(photos_dir: str, names: List[str] | None = None) -> Dict[str, str]:
+    """
+    Создаёт фотографии для замеров
+    :param photos_dir: директория для фотографий
+    :param names: названия фотографий из ``BENCH_PHOTO_SIZES``; ``None`` – все
+    :return: словарь, где ключ – название фотографии, значение – путь к ней
+    """
+    photos = dict()
+    for name, size in BENCH_PHOTO_SIZES.items():
+        if names is None or name in names:
+            photos[name] = os.path.join(photos_dir, f'{name}.jpg')
+            make_bench_photo(photos[name], size)
+    return photos
+
+
+def measure(calls: List[Callable[[], Any]], repeat: int, setup: Callable[[], Any] | None = None) -> Dict:
+    """
+    Замеряет время вызовов: каждый вызов выполняется один раз без замера (прогрев) и ``repeat`` раз с замером
+    :param calls: вызовы без аргументов
+    :param repeat: сколько раз замерять каждый вызов
+    :param setup: функция, которая вызывается перед каждым вызовом и не попадает в замер (например, сброс кэша)
+    :return: словарь с количеством замеров (``calls``) и временем вызова в секундах:
+             ``min``, ``median``, ``mean``, ``p95``, ``max``
+    """
+    samples = list()
+    for call in calls:
+        for i in range(repeat + 1):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+            if i:
+                samples.append(elapsed)
+    samples.sort()
+    return {
+        'calls':  len(samples),
+        'min':    samples[0],
+        'median': statistics.median(samples),
+        'mean':   statistics.fmean(samples),
+        'p95':    samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max':    samples[-1],
+    }
+
+
+def clear_title_layouts() -> None:
+    """
+    Очищает кэш вёрсток заголовков, чтобы замерять подбор параметров надписи, а не чтение из кэша
+    """
+    with title_layouts_lock:
+        title_layouts.clear()
+
+
+def make_bench_cover_info(photo_path: str) -> Dict:
+    """
+    Собирает параметры обложки для замеров так же, как пакетная отрисовка
+    :param photo_path: путь к фотографии
+    :return: параметры обложки
+    """
+    cover_info = make_cover_info({'photo': photo_path, 'corners': 1, 'copyright_sign': 0} | BENCH_COLORS)
+    cover_info['upper_title'], cover_info['upper_title_params'] = make_title_params(
+        'ФЕСТИВАЛЬ\nСТУДЕНЧЕСКИХ МЕДИА', 'upper', cover_info['upper_color'])
+    cover_info['lower_title'], cover_info['lower_title_params'] = make_title_params(
+        'АННА СМИРНОВА', 'lower', cover_info['lower_color'])
+    return cover_info
+
+
+def redraw_burst(cover_info: Dict) -> None:
+    """
+    Перерисовывает все прямоугольники превью по очереди, как при нажатиях на этапе 8б
+    :param cover_info: параметры обложки
+    """
+    compositor = get_preview(BENCH_CHAT_ID)
+    for coord in range(RECTANGLE_NUM * 2):
+        redraw_rectangle(coord, cover_info['corners'][coord], compositor, cover_info)
+
+
+def find_gradient_size(photo_size: Tuple[int, int], geometry: Geometry) -> Tuple[int, int] | None:
+    """
+    Рассчитывает размер градиента по бокам фото, как ``draw_photo_bg()``
+    :param photo_size: размер фотографии (ширина, высота)
+    :param geometry: размеры обложки для нужного масштаба
+    :return: размер градиента; ``None``, если фотография не уже зоны фото и градиент не нужен
+    """
+    width, height = photo_size
+    if width / height >= geometry.photo_width / geometry.photo_height:
+        return None
+    return int((geometry.photo_width - width * (geometry.photo_height / height)) / 2), geometry.photo_height
+
+
+def run_photo_benchmarks(photos: Dict[str, str], repeat: int, only: str | None) -> List[Dict]:
+    """
+    Замеры, которые зависят от фотографии: для каждой фотографии рисуются превью и итоговая обложка
+    :param photos: словарь, где ключ – название фотографии, значение – путь к ней
+    :param repeat: сколько раз замерять каждый вызов
+    :param only: если задано, выполняются только замеры, в названии которых есть эта строка
+    :return: результаты замеров
+    """
+    results = list()
+
+    def run(benchmark: str, case: str, calls: List[Callable[[], Any]],
+            setup: Callable[[], Any] | None = None, times: int = repeat) -> None:
+        if only is not None and only not in benchmark:
+            return
+        results.append({'benchmark': benchmark, 'case': case} | measure(calls, times, setup))
+        print_result(results[-1])
+
+    for name, photo_path in photos.items():
+        run('prepare_photo', name, [partial(get_prepared_photo, photo_path)],
+            setup=partial(drop_prepared_photo, photo_path))
+        run('analyse_photo', name, [partial(get_photo_analysis, photo_path)],
+            setup=partial(drop_prepared_photo, photo_path))
+
+        cover_info = make_bench_cover_info(photo_path)
+        for geometry, label in ((PREVIEW_GEOMETRY, 'preview'), (FULL_GEOMETRY, 'full')):
+            gradient_size = find_gradient_size(get_prepared_photo(photo_path)['size'], geometry)
+            if gradient_size is not None:
+                run('create_gradient', f'{name}/{label}',
+                    [partial(create_gradient, '#A0A0A0', gradient_size),
+                     partial(create_gradient, '#A0A0A0', gradient_size, True)],
+                    setup=make_gradient.cache_clear)
+        run('create_preview_pic', name, [partial(create_preview_pic, cover_info, BENCH_CHAT_ID, True)])
+        create_preview_pic(cover_info, BENCH_CHAT_ID, True)
+        run('redraw_rectangle', f'{name}/burst-{RECTANGLE_NUM * 2}', [partial(redraw_burst, cover_info)])
+        run('create_pic', name, [lambda: encode_png(draw_cover(cover_info))], times=max(repeat // 2, 1))
+        drop_preview(BENCH_CHAT_ID)
+        drop_prepared_photo(photo_path)
+    return results
+
+
+def run_title_benchmarks(repeat: int, only: str | None) -> List[Dict]:
+    """
+    Замеры подбора параметров надписи по группам заголовков из ``BENCH_TITLES``.
+    Кэш вёрсток очищается перед каждым вызовом
+    :param repeat: сколько раз замерять каждый вызов
+    :param only: если задано, выполняются только замеры, в названии которых есть эта строка
+    :return: результаты замеров
+    """
+    results = list()
+    if only is not None and only not in 'pick_title_params':
+        return results
+    for group, titles in BENCH_TITLES.items():
+        for geometry, label in ((FULL_GEOMETRY, 'full'), (PREVIEW_GEOMETRY, 'preview')):
+            calls = [partial(pick_title_params, text, title_type, geometry) for text, title_type in titles]
+            results.append({'benchmark': 'pick_title_params', 'case': f'{group}/{label}'}
+                           | measure(calls, repeat, setup=clear_title_layouts))
+            print_result(results[-1])
+    return results
+
+
+def describe_environment() -> Dict:
+    """
+    Описывает окружение, в котором выполнялись замеры, чтобы сравнивать только сопоставимые запуски
+    :return: словарь с параметрами окружения
+    """
+    return {
+        'python':         platform.python_version(),
+        'pillow':         Image.__version__,
+        'freetype':       features.version('freetype2'),
+        'raqm':           features.check('raqm'),
+        'layout_engine':  FONT_LAYOUT_ENGINE,
+        'font_instances': len(FONTS.instances or {}),
+        'machine':        platform.machine(),
+        'cpu_count':      os.cpu_count(),
+    }
+
+
+def compare_results(results: List[Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    """
+    Сравнивает медианы замеров с предыдущим запуском
+    :param results: результаты замеров
+    :param baseline: отчёт предыдущего запуска
+    :param threshold: во сколько раз медиана может вырасти (например, 0.2 – на 20%), прежде чем считаться регрессией
+    :return: замеры, медиана которых выросла больше допустимого, с медианой предыдущего запуска (``baseline``)
+    """
+    previous = {(result['benchmark'], result['case']): result['median'] for result in baseline['results']}
+    regressions = list()
+    for result in results:
+        median = previous.get((result['benchmark'], result['case']))
+        if median is not None and result['median'] > median * (1 + threshold):
+            regressions.append(result | {'baseline': median})
+    return regressions
+
+
+def print_result(result: Dict) -> None:
+    """
+    Выводит результат замера в миллисекундах
+    :param result: результат замера
+    """
+    print(f'{result["benchmark"]:<20}{result["case"]:<36}{result["calls"]:>6}'
+          + ''.join(f'{result[key] * 1000:>10.2f}' for key in ('min', 'median', 'p95')), flush=True)
+
+
+def main() -> int:
+    """
+    Замеры отрисовки и вёрстки: ``python bench.py [-o bench.json] [--baseline old.json]``
+    :return: код завершения: 0 – регрессий нет, 1 – медиана какого-то замера выросла больше допустимого
+    """
+    parser = argparse.ArgumentParser(description='Замеры времени отрисовки обложек и подбора параметров заголовков')
+    parser.add_argument('-o', '--output', help='путь к json-отчёту с результатами замеров')
+    parser.add_argument('-r', '--repeat', type=int, default=10, help='сколько раз замерять каждый вызов')
+    parser.add_argument('-k', '--only', help='выполнять только замеры, в названии которых есть эта строка')
+    parser.add_argument('--photos', nargs='+', choices=list(BENCH_PHOTO_SIZES), metavar='NAME',
+                        help=f'фотографии для замеров: {", ".join(BENCH_PHOTO_SIZES)}; по умолчанию все')
+    parser.add_argument('--baseline', help='json-отчёт предыдущего запуска для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='на сколько (доля) может вырасти медиана замера по сравнению с --baseline')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(message)s')
+
+    started = time.perf_counter()
+    init_render_worker()
+    print(f'{"benchmark":<20}{"case":<36}{"calls":>6}{"min":>10}{"median":>10}{"p95":>10}  (мс)')
+    results = run_title_benchmarks(args.repeat, args.only)
+    with tempfile.TemporaryDirectory() as photos_dir:
+        results += run_photo_benchmarks(make_bench_photos(photos_dir, args.photos), args.repeat, args.only)
+    report = {
+        'created':     time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'elapsed':     time.perf_counter() - started,
+        'repeat':      args.repeat,
+        'environment': describe_environment(),
+        'results':     results,
+    }
+    print(f'Готово: {len(results)} замеров за {report["elapsed"]:.1f} с')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    if baseline.get('environment') != report['environment']:
+        print('Окружение отличается от --baseline, сравнение может быть неточным', file=sys.stderr)
+    regressions = compare_results(results, baseline, args.threshold)
+    for result in regressions:
+        print(f'Регрессия: {result["benchmark"]} {result["case"]}: '
+              f'{result["baseline"] * 1000:.2f} → {result["median"] * 1000:.2f} мс', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+"""
+bot.py
+"""
+from functools import lru_cache
+from typing import Any, Callable
+from static import *
+
+
+@lru_cache(maxsize=None)
+def read_token() -> str:
+    """
+    Читает токен бота из ``TOKEN_PATH`` при первом обращении
+    :return: токен бота
+    """
+    with open(TOKEN_PATH, 'r', encoding='utf-8') as file:
+        return file.read().strip()
+
+
+@lru_cache(maxsize=None)
+def get_bot() -> 'ChatSerialTeleBot':
+    """
+    Создаёт клиент бота при первом обращении
+    :return: клиент бота
+    """
+    from dispatch import ChatSerialTeleBot
+    return ChatSerialTeleBot(token=read_token(), num_threads=BOT_THREADS)
+
+
+@lru_cache(maxsize=None)
+def get_async_bot() -> 'AsyncTeleBot':
+    """
+    Создаёт клиент асинхронного бота при первом обращении
+    :return: клиент бота
+    """
+    from telebot.async_telebot import AsyncTeleBot
+    return AsyncTeleBot(token=read_token())
+
+
+class Handlers:
+    """
+    Обработчики сообщений и нажатий кнопок, которые регистрируются у клиента бота при запуске.\n
+    Декораторы принимают те же параметры, что и ``TeleBot.message_handler()`` и ``TeleBot.callback_query_handler()``,
+    но не требуют клиента, поэтому импорт модуля с обработчиками не создаёт бота
+    """
+
+    def __init__(self) -> None:
+        self.handlers: List[Tuple[str, Callable, Dict[str, Any]]] = list()
+        # тип обработчика ('message' или 'callback_query'), функция и её фильтры – в порядке объявления
+
+    def message_handler(self, **filters: Any) -> Callable[[Callable], Callable]:
+        """
+        Добавляет обработчик сообщений
+        :param filters: фильтры, как у ``TeleBot.message_handler()``
+        :return: декоратор, возвращающий функцию без изменений
+        """
+        def decorator(function: Callable) -> Callable:
+            self.handlers.append(('message', function, filters))
+            return function
+        return decorator
+
+    def callback_query_handler(self, **filters: Any) -> Callable[[Callable], Callable]:
+        """
+        Добавляет обработчик нажатий кнопок
+        :param filters: фильтры, как у ``TeleBot.callback_query_handler()``
+        :return: декоратор, возвращающий функцию без изменений
+        """
+        def decorator(function: Callable) -> Callable:
+            self.handlers.append(('callback_query', function, filters))
+            return function
+        return decorator
+
+    def register(self, bot: Any, wrap: Callable[[Callable], Callable] | None = None) -> None:
+        """
+        Регистрирует обработчики у клиента бота в порядке объявления
+        :param bot: клиент бота (``TeleBot`` или ``AsyncTeleBot``)
+        :param wrap: функция, которая оборачивает обработчик перед регистрацией
+            (например, ``to_sync()`` для асинхронных шагов у ``TeleBot``); ``None`` – без обёртки
+        """
+        for handler_type, function, filters in self.handlers:
+            getattr(bot, f'register_{handler_type}_handler')(wrap(function) if wrap else function, **filters)
@@ -0,0 +1,214 @@
+"""
+compositor.py
+"""
+from functools import lru_cache
+from typing import Iterable
+from PIL import Image, ImageDraw
+from static import *
+from fonts import get_info_font
+from geometry import Geometry, FULL_GEOMETRY, get_geometry
+from util import (calculate_coords_rectangle,
+                  calculate_copyright_xy,
+                  define_fill)
+
+
+@lru_cache(maxsize=RECTANGLE_NUM * 4)
+def make_digit_mask(coord: int, geometry: Geometry = FULL_GEOMETRY) -> Image.Image:
+    """
+    Создаёт маску с цифрой – координатой прямоугольника – размером с прямоугольник.\n
+    Маски одинаковы для всех обложек одного масштаба, поэтому рисуются один раз
+    :param coord: координата прямоугольника
+    :param geometry: размеры обложки для нужного масштаба
+    :return: маска в режиме ``L``
+    """
+    mask = Image.new('L', geometry.rectangle_size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.text(xy=(geometry.rectangle_width / 2, geometry.rectangle_height / 2),
+              text=str(coord+1),
+              font=get_info_font(geometry.info_font_size),
+              fill=255,
+              align='center',
+              anchor='mm')
+    return mask
+
+
+@lru_cache(maxsize=RECTANGLE_NUM * 4)
+def make_copyright_mask(coord: int, geometry: Geometry = FULL_GEOMETRY) \
+        -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    Создаёт маску с копирайт-надписью по размеру занимаемой ею области
+    :param coord: порядковый номер прямоугольника, на котором располагается надпись
+    :param geometry: размеры обложки для нужного масштаба
+    :return: маска в режиме ``L`` и координаты области в формате ``(x1, y1, x2, y2)``
+    """
+    params = {
+        'xy':      calculate_copyright_xy(coord, geometry),
+        'text':    COPYRIGHT_TEXT,
+        'spacing': int(geometry.info_font_size_pixels / 17),
+        'font':    get_info_font(geometry.info_font_size),
+        'align':   'left',
+        'anchor':  'ld',
+    }
+    bbox = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox(**params)
+    mask = Image.new('L', (bbox[2] - bbox[0], bbox[3] - bbox[1]), 0)
+    params['xy'] = (params['xy'][0] - bbox[0], params['xy'][1] - bbox[1])
+    ImageDraw.Draw(mask).text(fill=255, **params)
+    return mask, bbox
+
+
+def make_rectangle_box(coord: int, geometry: Geometry = FULL_GEOMETRY) -> Tuple[int, int, int, int]:
+    """
+    Рассчитывает область прямоугольника в формате, который принимают ``crop()`` и ``paste()``
+    :param coord: координата прямоугольника
+    :param geometry: размеры обложки для нужного масштаба
+    :return: область в формате ``(x1, y1, x2, y2)``, правая и нижняя границы не включаются
+    """
+    (x1, y1), (x2, y2) = calculate_coords_rectangle(coord, geometry)
+    return x1, y1, x2 + 1, y2 + 1
+
+
+def intersects(box_1: Tuple[int, int, int, int], box_2: Tuple[int, int, int, int]) -> bool:
+    """
+    Определяет, пересекаются ли две области
+    :param box_1: область в формате ``(x1, y1, x2, y2)``
+    :param box_2: область в формате ``(x1, y1, x2, y2)``
+    :return: ``True``, если области пересекаются. ``False`` – в обратном случае
+    """
+    return box_1[0] < box_2[2] and box_2[0] < box_1[2] and box_1[1] < box_2[3] and box_2[1] < box_1[3]
+
+
+class PreviewCompositor:
+    """
+    Собирает превью-изображение из слоёв: фона с фотографией и плашками (рисуется один раз),
+    боковых прямоугольников, цифр-координат и копирайт-надписи.\n
+    При изменении состояния перерисовываются только затронутые прямоугольники,
+    поэтому стоимость нажатия не зависит от размера фотографии
+    """
+
+    def __init__(self, base: Image.Image, left_color: str, right_color: str,
+                 geometry: Geometry = FULL_GEOMETRY) -> None:
+        """
+        :param base: фон с фотографией и плашками, без боковых прямоугольников
+        :param left_color: цвет левых прямоугольников
+        :param right_color: цвет правых прямоугольников
+        :param geometry: размеры превью; должны совпадать с размером фона
+        """
+        self.base = base
+        self.geometry = geometry
+        self.left_color = left_color
+        self.right_color = right_color
+        self.corners = [0 for _ in range(RECTANGLE_NUM * 2)]
+        self.digits = False
+        self.copyright_sign: int | None = None
+        self.image = base.copy()
+
+    def find_bg_color(self, coord: int) -> str:
+        """
+        Определяет цвет прямоугольника в текущем состоянии
+        :param coord: координата прямоугольника
+        :return: цветовое значение HEX
+        """
+        if not self.corners[coord]:
+            return '#000000'
+        return self.left_color if coord < RECTANGLE_NUM else self.right_color
+
+    def find_copyright_coords(self) -> List[int]:
+        """
+        Находит прямоугольники, на которые попадает копирайт-надпись
+        :return: список координат прямоугольников
+        """
+        if self.copyright_sign is None:
+            return []
+        bbox = make_copyright_mask(self.copyright_sign, self.geometry)[1]
+        return [i for i in range(RECTANGLE_NUM * 2) if intersects(make_rectangle_box(i, self.geometry), bbox)]
+
+    def compose(self, coords: Iterable[int]) -> None:
+        """
+        Заново собирает области заданных прямоугольников из слоёв
+        :param coords: координаты прямоугольников
+        """
+        for coord in coords:
+            box = make_rectangle_box(coord, self.geometry)
+            cell = self.base.crop(box)
+            bg_color = self.find_bg_color(coord)
+            if self.corners[coord]:
+                cell.paste(bg_color, (0, 0, *cell.size))
+            if self.digits:
+                cell.paste(define_fill(bg_color), (0, 0), make_digit_mask(coord, self.geometry))
+            if self.copyright_sign is not None:
+                mask, bbox = make_copyright_mask(self.copyright_sign, self.geometry)
+                if intersects(box, bbox):
+                    cell.paste(define_fill(self.find_bg_color(self.copyright_sign)),
+                               (bbox[0] - box[0], bbox[1] - box[1]), mask)
+            self.image.paste(cell, box[:2])
+
+    def set_corner(self, coord: int, color_state: int) -> None:
+        """
+        Меняет состояние одного прямоугольника
+        :param coord: координата прямоугольника
+        :param color_state: новое состояние: 0 – не закрашенный, 1 – закрашенный
+        """
+        self.set_corners([color_state if i == coord else state for i, state in enumerate(self.corners)])
+
+    def set_corners(self, corners: List[int]) -> None:
+        """
+        Меняет состояние прямоугольников, перерисовывая только изменившиеся
+        :param corners: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
+        """
+        changed = {i for i, state in enumerate(corners) if state != self.corners[i]}
+        if self.copyright_sign in changed:
+            changed.update(self.find_copyright_coords())
+        self.corners = list(corners)
+        self.compose(changed)
+
+    def show_digits(self, digits: bool = True) -> None:
+        """
+        Показывает или скрывает цифры-координаты прямоугольников
+        :param digits: если истинно, цифры показываются
+        """
+        if digits != self.digits:
+            self.digits = digits
+            self.compose(range(RECTANGLE_NUM * 2))
+
+    def set_copyright_sign(self, coord: int | None) -> None:
+        """
+        Переносит копирайт-надпись на другой прямоугольник
+        :param coord: порядковый номер прямоугольника; ``None`` – убрать надпись
+        """
+        changed = set(self.find_copyright_coords())
+        self.copyright_sign = coord
+        changed.update(self.find_copyright_coords())
+        self.compose(changed)
+
+    def dump(self, path: str) -> Dict:
+        """
+        Сохраняет фоновый слой на диск, чтобы освободить память
+        :param path: путь для сохранения фонового слоя
+        :return: состояние, по которому ``restore()`` восстановит превью
+        """
+        self.base.save(path)
+        return {
+            'left_color':     self.left_color,
+            'right_color':    self.right_color,
+            'corners':        self.corners,
+            'digits':         self.digits,
+            'copyright_sign': self.copyright_sign,
+            'multiplier':     self.geometry.multiplier,
+        }
+
+    @classmethod
+    def restore(cls, path: str, state: Dict) -> 'PreviewCompositor':
+        """
+        Восстанавливает превью по фоновому слою на диске и сохранённому состоянию
+        :param path: путь к фоновому слою
+        :param state: состояние, которое вернул ``dump()``
+        :return: экземпляр ``PreviewCompositor``
+        """
+        base = Image.open(path)
+        base.load()
+        compositor = cls(base, state['left_color'], state['right_color'],
+                         get_geometry(state.get('multiplier', MULTIPLIER)))
+        compositor.set_corners(state['corners'])
+        compositor.show_digits(state['digits'])
+        compositor.set_copyright_sign(state['copyright_sign'])
+        return compositor
@@ -0,0 +1,161 @@
+"""
+dispatch.py
+"""
+import logging
+import threading
+import telebot
+from collections import deque
+from telebot import types
+from typing import Callable, Dict, List, Tuple
+from metrics import METRICS
+
+
+def find_update_chat_id(update: types.Update) -> int | None:
+    """
+    Определяет чат, к которому относится обновление
+    :param update: обновление
+    :return: айди чата; ``None``, если обновление не относится к чату
+    """
+    message = update.message or update.edited_message
+    if message is None and update.callback_query is not None:
+        message = update.callback_query.message
+    return message.chat.id if message is not None else None
+
+
+class ChatSerialTeleBot(telebot.TeleBot):
+    """
+    ``TeleBot``, который обрабатывает обновления одного чата по очереди, а обновления разных чатов – параллельно.\n
+    У каждого чата своя очередь обновлений, её разбирает один поток из пула ``TeleBot``.
+    Поэтому обработчики одного чата не пересекаются (в том числе при выборе обработчика следующего шага),
+    и количество потоков можно увеличивать
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.chat_queues: Dict[int, deque[Tuple[types.Update, Callable[[], None] | None]]] = dict()
+        # ключ – айди чата, значение – необработанные обновления и функции, которые вызываются после их обработки;
+        # чат есть в словаре, пока его очередь разбирается
+        self.chat_queues_lock = threading.Lock()
+        self.chat_update_listeners: List[Callable[[int], None]] = list()
+        self.local = threading.local()
+
+    def add_chat_update_listener(self, listener: Callable[[int], None]) -> None:
+        """
+        Добавляет функцию, которая вызывается после обработки каждого обновления чата
+        (в том же потоке, до следующего обновления этого чата)
+        :param listener: функция, принимающая айди чата
+        """
+        self.chat_update_listeners.append(listener)
+
+    def is_serial(self) -> bool:
+        """
+        Определяет, разбирает ли текущий поток очередь чата
+        :return: ``True``, если разбирает. ``False`` – в обратном случае
+        """
+        return getattr(self.local, 'serial', False)
+
+    def process_new_updates(self, updates: List[types.Update]) -> None:
+        """
+        Раскладывает обновления по очередям чатов
+        :param updates: обновления
+        """
+        if not self.threaded or self.is_serial():
+            super().process_new_updates(updates)
+            return
+        for update in updates:
+            self.enqueue_update(update)
+
+    def enqueue_update(self, update: types.Update, on_done: Callable[[], None] | None = None) -> None:
+        """
+        Ставит обновление в очередь его чата.
+        Обновление, которое не относится к чату, обрабатывается отдельно в потоке из пула
+        :param update: обновление
+        :param on_done: функция, которая вызывается, когда обработка обновления закончена (в том числе с ошибкой)
+        """
+        if not self.threaded or self.is_serial():
+            try:
+                super().process_new_updates([update])
+            except Exception:
+                logging.exception(f'Ошибка при обработке обновления {update.update_id}')
+            finally:
+                if on_done is not None:
+                    on_done()
+            return
+        if update.update_id > self.last_update_id:
+            self.last_update_id = update.update_id
+        chat_id = find_update_chat_id(update)
+        if chat_id is None:
+            self.worker_pool.put(self.process_other_update, update, on_done)
+            return
+        with self.chat_queues_lock:
+            queue = self.chat_queues.get(chat_id)
+            if queue is not None:
+                queue.append((update, on_done))
+                return
+            self.chat_queues[chat_id] = deque([(update, on_done)])
+        self.worker_pool.put(self.process_chat_queue, chat_id)
+
+    def process_other_update(self, update: types.Update, on_done: Callable[[], None] | None) -> None:
+        """
+        Обрабатывает обновление, которое не относится к чату
+        :param update: обновление
+        :param on_done: функция, которая вызывается после обработки
+        """
+        self.local.serial = True
+        try:
+            super().process_new_updates([update])
+        except Exception:
+            logging.exception(f'Ошибка при обработке обновления {update.update_id}')
+        finally:
+            self.local.serial = False
+            if on_done is not None:
+                on_done()
+
+    def process_chat_queue(self, chat_id: int) -> None:
+        """
+        Обрабатывает обновления чата по очереди, пока очередь не опустеет
+        :param chat_id: айди чата
+        """
+        self.local.serial = True
+        try:
+            while True:
+                with self.chat_queues_lock:
+                    queue = self.chat_queues[chat_id]
+                    if not queue:
+                        del self.chat_queues[chat_id]
+                        return
+                    update, on_done = queue.popleft()
+                try:
+                    super().process_new_updates([update])
+                except Exception:
+                    logging.exception(f'{chat_id} Ошибка при обработке обновления {update.update_id}')
+                for listener in self.chat_update_listeners:
+                    try:
+                        listener(chat_id)
+                    except Exception:
+                        logging.exception(f'{chat_id} Ошибка после обработки обновления {update.update_id}')
+                if on_done is not None:
+                    on_done()
+        finally:
+            self.local.serial = False
+
+    def _exec_task(self, task, *args, **kwargs) -> None:
+        """
+        В потоке, который разбирает очередь чата, выполняет обработчик сразу, иначе – как ``TeleBot``.
+        Время обработчиков следующего сообщения записывается в метрики этапов по имени функции
+        (обработчики сообщений и кнопок вызываются через ``_run_middlewares_and_handler()``
+        и замеряются обёртками, см. ``Metrics.time_function()``)
+        """
+        if not self.is_serial():
+            super()._exec_task(task, *args, **kwargs)
+            return
+        if task == self._run_middlewares_and_handler:
+            timer = METRICS.null_timer
+        else:
+            timer = METRICS.timer('step_seconds', errors='step_errors', step=getattr(task, '__name__', 'unknown'))
+        try:
+            with timer:
+                task(*args, **kwargs)
+        except Exception as error:
+            if not self._handle_exception(error):
+                raise
@@ -0,0 +1,189 @@
+"""
+download.py
+"""
+import os
+import hashlib
+from telebot import apihelper
+from static import *
+from metrics import METRICS
+
+
+PHOTO_SIGNATURES: Dict[bytes, str] = {
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'\xff\xd8\xff':      'jpg',
+}
+# ключ – первые байты файла, значение – расширение, с которым сохраняется фотография
+PHOTO_SIGNATURE_LENGTH: int = max(map(len, PHOTO_SIGNATURES))
+
+
+class PhotoDownloadError(Exception):
+    """
+    Фотография не может быть принята по результатам скачивания
+    """
+
+
+class PhotoFileTooLargeError(PhotoDownloadError):
+    """
+    Файл больше ``PHOTO_MAX_FILE_SIZE``
+    """
+
+
+class PhotoFormatError(PhotoDownloadError):
+    """
+    Файл не является png или jpeg
+    """
+
+
+def check_photo_file_size(file_size: int | None, max_size: int = PHOTO_MAX_FILE_SIZE) -> None:
+    """
+    Проверяет размер файла, который сообщил Telegram, до скачивания
+    :param file_size: размер файла в байтах; ``None``, если неизвестен
+    :param max_size: максимальный размер файла в байтах
+    """
+    if file_size is not None and file_size > max_size:
+        raise PhotoFileTooLargeError(f'{file_size} больше {max_size} байт')
+
+
+def sniff_photo_format(head: bytes) -> str | None:
+    """
+    Определяет формат фотографии по первым байтам файла
+    :param head: начало файла
+    :return: расширение (``png``, ``jpg``); ``None``, если формат не поддерживается
+    """
+    for signature, extension in PHOTO_SIGNATURES.items():
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def make_file_url(token: str, file_path: str, file_url: str | None) -> str:
+    """
+    Создаёт ссылку на файл так же, как ``download_file()`` из telebot
+    :param token: токен бота
+    :param file_path: путь к файлу, который вернул ``get_file()``
+    :param file_url: шаблон ссылки из настроек telebot; ``None`` – сервер Telegram
+    :return: ссылка на файл
+    """
+    if file_url is None:
+        return f'https://api.telegram.org/file/bot{token}/{file_path}'
+    return file_url.format(token, file_path)
+
+
+class PhotoWriter:
+    """
+    Записывает скачиваемую фотографию на диск по частям.\n
+    По первым байтам определяет формат, по ходу записи проверяет размер и считает sha256 содержимого.
+    Пока файл не скачан полностью, он хранится под временным именем
+    """
+
+    def __init__(self, path_without_extension: str, max_size: int = PHOTO_MAX_FILE_SIZE) -> None:
+        """
+        :param path_without_extension: путь для сохранения; расширение добавляется по формату файла
+        :param max_size: максимальный размер файла в байтах
+        """
+        self.path_without_extension = path_without_extension
+        self.temp_path = path_without_extension + '.part'
+        self.max_size = max_size
+        self.size = 0
+        self.head = b''
+        self.extension: str | None = None
+        self.hash = hashlib.sha256()
+        self.file = open(self.temp_path, 'wb')
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Записывает очередную часть файла
+        :param chunk: часть файла
+        """
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise PhotoFileTooLargeError(f'больше {self.max_size} байт')
+        if self.extension is None:
+            self.head = (self.head + chunk)[:PHOTO_SIGNATURE_LENGTH]
+            self.check_head(final=False)
+        self.hash.update(chunk)
+        self.file.write(chunk)
+
+    def check_head(self, final: bool) -> None:
+        """
+        Определяет формат по накопленному началу файла
+        :param final: если истинно, файл закончился и начало больше не пополнится
+        """
+        self.extension = sniff_photo_format(self.head)
+        if self.extension is None and (final or len(self.head) >= PHOTO_SIGNATURE_LENGTH):
+            raise PhotoFormatError(f'неизвестная сигнатура {self.head.hex()}')
+
+    def finish(self) -> Tuple[str, str]:
+        """
+        Завершает запись и переименовывает файл
+        :return: путь к сохранённой фотографии и sha256 её содержимого
+        """
+        if self.extension is None:
+            self.check_head(final=True)
+        self.file.close()
+        path = f'{self.path_without_extension}.{self.extension}'
+        os.replace(self.temp_path, path)
+        return path, self.hash.hexdigest()
+
+    def abort(self) -> None:
+        """
+        Прерывает запись и удаляет недокачанный файл
+        """
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def download_photo(token: str, file_path: str, path_without_extension: str,
+                   max_size: int = PHOTO_MAX_FILE_SIZE) -> Tuple[str, str]:
+    """
+    Скачивает фотографию по частям сразу на диск, не держа файл в памяти целиком
+    :param token: токен бота
+    :param file_path: путь к файлу, который вернул ``get_file()``
+    :param path_without_extension: путь для сохранения; расширение добавляется по формату файла
+    :param max_size: максимальный размер файла в байтах
+    :return: путь к сохранённой фотографии и sha256 её содержимого
+    """
+    url = make_file_url(token, file_path, apihelper.FILE_URL)
+    # noinspection PyProtectedMember
+    session = apihelper._get_req_session()
+    with METRICS.timer('phase_seconds', phase='download'), \
+            session.get(url, proxies=apihelper.proxy, stream=True,
+                        timeout=(apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT)) as response:
+        if response.status_code != 200:
+            raise apihelper.ApiHTTPException('Download file', response)
+        writer = PhotoWriter(path_without_extension, max_size)
+        try:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                writer.write(chunk)
+            return writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+
+
+async def download_photo_async(token: str, file_path: str, path_without_extension: str,
+                               max_size: int = PHOTO_MAX_FILE_SIZE) -> Tuple[str, str]:
+    """
+    То же, что ``download_photo()``, для асинхронного бота
+    :param token: токен бота
+    :param file_path: путь к файлу, который вернул ``get_file()``
+    :param path_without_extension: путь для сохранения; расширение добавляется по формату файла
+    :param max_size: максимальный размер файла в байтах
+    :return: путь к сохранённой фотографии и sha256 её содержимого
+    """
+    from telebot import asyncio_helper  # только для асинхронного бота: требует aiohttp
+    url = make_file_url(token, file_path, asyncio_helper.FILE_URL)
+    session = await asyncio_helper.session_manager.get_session()
+    with METRICS.timer('phase_seconds', phase='download'):
+        async with session.get(url, proxy=asyncio_helper.proxy) as response:
+            if response.status != 200:
+                raise asyncio_helper.ApiHTTPException('Download file', response)
+            writer = PhotoWriter(path_without_extension, max_size)
+            try:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    writer.write(chunk)
+                return writer.finish()
+            except BaseException:
+                writer.abort()
+                raise
@@ -1,43 +1,37 @@
 """
 drawing.py
 """
+from typing import Literal
 from PIL import Image, ImageDraw
 from static import *
+from preview import save_preview
+from compositor import PreviewCompositor
+from photo import get_prepared_photo, get_scaled_photo, get_photo_analysis
+from fonts import FONTS, get_info_font
+from geometry import Geometry, FULL_GEOMETRY, PREVIEW_GEOMETRY
+from metrics import METRICS
 from util import (calculate_coords_rectangle,
                   calculate_copyright_xy,
                   define_fill,
-                  find_avg_rgb,
                   rgb_to_greyscale_hex,
-                  create_gradient)
+                  create_gradient,
+                  pick_title_params,
+                  find_upper_rectangle_bboxes)
 
 
-def draw_preview_digits(coords: List[int], draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+def find_photo_analysis(cover_info: Dict) -> Dict:
     """
-    Рисует на превью-изображении цифру / цифры – координаты прямоугольников
-    :param coords: координата прямоугольника, где нужно нарисовать цифру
-    :param draw: экземпляр ``ImageDraw.Draw`` с превью-изображением
+    Возвращает результаты анализа фотографии; если их нет в параметрах обложки, анализирует фотографию
     :param cover_info: параметры обложки
+    :return: словарь с результатами анализа
     """
-    corners = cover_info['corners']
-    for coord in coords:
-        xy_rectangle = calculate_coords_rectangle(coord)
-        xy_font = (xy_rectangle[0][0] + RECTANGLE_WIDTH / 2, xy_rectangle[0][1] + RECTANGLE_HEIGHT / 2)
-        if coord < RECTANGLE_NUM and corners[coord]:
-            bg_color = cover_info['left_color']
-        elif coord >= RECTANGLE_NUM and corners[coord]:
-            bg_color = cover_info['right_color']
-        else:
-            bg_color = '#000000'
-        draw.text(xy=xy_font,
-                  text=str(coord+1),
-                  font=INFO_FONT,
-                  fill=define_fill(bg_color),
-                  align='center',
-                  anchor='mm')
+    if not cover_info.get('photo_analysis'):
+        cover_info['photo_analysis'] = get_photo_analysis(cover_info['photo'])
+    return cover_info['photo_analysis']
 
 
 def draw_photo_bg(image: Image.Image, draw: ImageDraw.ImageDraw, size: Tuple[int, int], photo_bg: str,
-                  cover_info: Dict) -> None:
+                  cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении фон для фото
     :param image: экземпляр ``Image.Image`` с обложкой
@@ -45,19 +39,22 @@ def draw_photo_bg(image: Image.Image, draw: ImageDraw.ImageDraw, size: Tuple[int
     :param size: размер фото в пикселях (ширина, высота)
     :param photo_bg: информация о фоне изображения
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
     width, height = size
+    pic_width = geometry.pic_width
+    rectangle_width, rectangle_height = geometry.rectangle_size
     xy_1 = (
-        RECTANGLE_SIZE,
-        (int((PIC_WIDTH - width) / 2) - 1, RECTANGLE_HEIGHT + PHOTO_HEIGHT - 1))
+        geometry.rectangle_size,
+        (int((pic_width - width) / 2) - 1, rectangle_height + geometry.photo_height - 1))
     xy_2 = (
-        (int((PIC_WIDTH + width) / 2), RECTANGLE_HEIGHT),
-        (PIC_WIDTH - RECTANGLE_WIDTH - 1, RECTANGLE_HEIGHT + PHOTO_HEIGHT - 1))
+        (int((pic_width + width) / 2), rectangle_height),
+        (pic_width - rectangle_width - 1, rectangle_height + geometry.photo_height - 1))
     if '-' not in photo_bg:
         if photo_bg == 'white':
             fill = '#FFFFFF'
         else:
-            fill = rgb_to_greyscale_hex(find_avg_rgb(cover_info['photo']))
+            fill = rgb_to_greyscale_hex(find_photo_analysis(cover_info)['avg_rgb'])
 
         draw.rectangle(xy=xy_1,
                        fill=fill)
@@ -67,179 +64,191 @@ def draw_photo_bg(image: Image.Image, draw: ImageDraw.ImageDraw, size: Tuple[int
         if photo_bg.split('-')[1] == 'white':
             fill = '#FFFFFF'
         else:
-            fill = rgb_to_greyscale_hex(find_avg_rgb(cover_info['photo']))
+            fill = rgb_to_greyscale_hex(find_photo_analysis(cover_info)['avg_rgb'])
 
-        gradient_size = (int((PHOTO_WIDTH - width) / 2), PHOTO_HEIGHT)
+        gradient_size = (int((geometry.photo_width - width) / 2), geometry.photo_height)
         gradient = create_gradient(fill, gradient_size)
         gradient_reverse = create_gradient(fill, gradient_size, True)
         image.paste(im=gradient, box=xy_1[0])
         image.paste(im=gradient_reverse, box=xy_2[0])
 
 
-def make_crop_mask(photo: Image.Image, cover_info: Dict) -> Image.Image | None:
+def make_crop_mask(photo: Image.Image, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> Image.Image | None:
     """
     Создаёт маску для обрезания фотографии, если она требуется
     :param photo: фото для обрезания
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
     if cover_info.get('mask'):
         mask = Image.new('L', photo.size, 0)
         draw = ImageDraw.Draw(mask)
-        draw.rectangle(xy=(((photo.size[0] - PHOTO_WIDTH) / 2, 0),
-                           ((photo.size[0] + PHOTO_WIDTH) / 2 - 1, photo.size[1] - 1)),
+        draw.rectangle(xy=(((photo.size[0] - geometry.photo_width) / 2, 0),
+                           ((photo.size[0] + geometry.photo_width) / 2 - 1, photo.size[1] - 1)),
                        fill=255)
         return mask
     return None
 
 
-def draw_photo(draw: ImageDraw.ImageDraw, image: Image.Image, cover_info: Dict) -> None:
+def draw_photo(draw: ImageDraw.ImageDraw, image: Image.Image, cover_info: Dict,
+               geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Вставляет на изображение фотографию
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param image: экземпляр ``Image.Image`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
-    photo = Image.open(cover_info['photo'])
-    width, height = photo.size
-    width *= (PHOTO_HEIGHT / height)
-    photo = photo.resize((int(width), PHOTO_HEIGHT))
-    image.paste(im=photo,
-                box=(int((PIC_WIDTH - width) / 2), RECTANGLE_HEIGHT),
-                mask=make_crop_mask(photo, cover_info))
-    if photo_bg := cover_info.get('photo_bg'):
-        draw_photo_bg(image, draw, (width, height), photo_bg, cover_info)
-
-
-def draw_upper_lower_rectangles(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+    prepared_photo = get_prepared_photo(cover_info['photo'])
+    with METRICS.timer('phase_seconds', phase='draw_photo'):
+        width, height = prepared_photo['size']
+        width *= (geometry.photo_height / height)
+        photo = get_scaled_photo(prepared_photo, geometry.photo_height)
+        image.paste(im=photo,
+                    box=(int((geometry.pic_width - width) / 2), geometry.rectangle_height),
+                    mask=make_crop_mask(photo, cover_info, geometry))
+        if photo_bg := cover_info.get('photo_bg'):
+            draw_photo_bg(image, draw, (width, height), photo_bg, cover_info, geometry)
+
+
+def draw_upper_lower_rectangles(draw: ImageDraw.ImageDraw, cover_info: Dict,
+                                geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении верхние и нижние плашки
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
-    draw.rectangle(xy=UPPER_COORDS,
+    draw.rectangle(xy=geometry.upper_coords,
                    fill=cover_info['upper_color'])
 
-    draw.rectangle(xy=LOWER_COORDS,
+    draw.rectangle(xy=geometry.lower_coords,
                    fill=cover_info['lower_color'])
 
 
-def redraw_rectangle(coord: int, color_state: int, draw: ImageDraw.ImageDraw, cover_info: Dict,
-                     draw_digits: bool = True) -> None:
+def redraw_rectangle(coord: int, color_state: int, compositor: PreviewCompositor, cover_info: Dict) -> None:
     """
     Перерисовывает прямоугольник на превью-изображении,
     сохраняет данные о перерисованных прямоугольниках
     :param coord: координата прямоугольника, который нужно перерисовать
     :param color_state: состояние прямоугольника: 0 – не закашенный, 1 – закрашенный
-    :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
-    :param draw_digits: если истинно, рисует поверх перерисованного прямоугольника цифру с координатой
+    :param compositor: превью-изображение, собранное из слоёв
     :param cover_info: параметры обложки
     """
     corners = cover_info['corners']
-    if color_state:
-        corners[coord] = 0
-        draw.rectangle(xy=calculate_coords_rectangle(coord),
-                       fill='#000000')
-    else:
-        corners[coord] = 1
-        fill = cover_info['left_color'] if coord < RECTANGLE_NUM else cover_info['right_color']
-        draw.rectangle(xy=calculate_coords_rectangle(coord),
-                       fill=fill)
-    if draw_digits:
-        draw_preview_digits([coord], draw, cover_info)
+    corners[coord] = 1 - color_state
+    compositor.set_corner(coord, corners[coord])
 
 
-def draw_corners(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+def draw_corners(draw: ImageDraw.ImageDraw, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении прямоугольники
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
     coords = cover_info['corners']
 
     for i, coord in enumerate(coords):
         if coord:
             fill = cover_info['left_color'] if i < RECTANGLE_NUM else cover_info['right_color']
-            draw.rectangle(xy=calculate_coords_rectangle(i),
+            draw.rectangle(xy=calculate_coords_rectangle(i, geometry),
                            fill=fill)
 
 
-def draw_upper_title(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+def find_title_params(cover_info: Dict, title_type: Literal['upper', 'lower'],
+                      geometry: Geometry = FULL_GEOMETRY) -> Dict:
+    """
+    Возвращает параметры заголовка для нужного масштаба.
+    Параметры в ``cover_info`` подобраны для итоговой обложки, для другого масштаба они берутся из кэша вёрсток
+    :param cover_info: параметры обложки
+    :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param geometry: размеры обложки для нужного масштаба
+    :return: словарь с параметрами надписи
+    """
+    params = cover_info[f'{title_type}_title_params']
+    if geometry.multiplier == MULTIPLIER:
+        return params
+    return pick_title_params(cover_info[f'{title_type}_title'], title_type, geometry) | {'fill': params['fill']}
+
+
+def draw_upper_title(draw: ImageDraw.ImageDraw, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении верхний заголовок
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
     if len(cover_info['upper_title'].split('\n')) == 3:
-        draw_upper_rectangle(draw, cover_info)
-    params = cover_info['upper_title_params']
-    draw.text(**params)
+        draw_upper_rectangle(draw, cover_info, geometry)
+    params = find_title_params(cover_info, 'upper', geometry)
+    draw.text(**params | {'font': FONTS.localize(params['font'])})
 
 
-def draw_upper_rectangle(draw: ImageDraw.ImageDraw, cover_info: Dict):
+def draw_upper_rectangle(draw: ImageDraw.ImageDraw, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY):
     """
     Рисует на изображении прямоугольник по ширине третьей строки
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
-    params = cover_info['upper_title_params']
-    font = params['font']
-    spacing = params['spacing']
-    xy = params['xy']
-
-    splitted_text = cover_info['upper_title'].split('\n')
-    bbox = draw.textbbox(text='X\nX\n' + splitted_text[-1].strip(), xy=xy, font=font,
-                         spacing=spacing, anchor='ms', align='center')
-    bbox_bottom = draw.textbbox(text='\n'.join(splitted_text[:2]) + '\nX', xy=xy, font=font,
-                                spacing=spacing, anchor='ms', align='center')
-    coords = (max(bbox[0], RECTANGLE_WIDTH), bbox[1], min(bbox[2], PIC_WIDTH - RECTANGLE_WIDTH), bbox_bottom[3])
+    bbox, bbox_bottom = find_upper_rectangle_bboxes(cover_info['upper_title'], geometry)
+    coords = (max(bbox[0], geometry.rectangle_width), bbox[1],
+              min(bbox[2], geometry.pic_width - geometry.rectangle_width), bbox_bottom[3])
     draw.rectangle(coords, fill=cover_info['upper_color'])
 
 
-def draw_lower_title(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+def draw_lower_title(draw: ImageDraw.ImageDraw, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении нижний заголовок, надпись «ФОТОГРАФ» / «ФОТОГРАФЫ»
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
-    draw_photographer_text(draw, cover_info)
-    params = cover_info['lower_title_params']
-    draw.text(**params)
+    draw_photographer_text(draw, cover_info, geometry)
+    params = find_title_params(cover_info, 'lower', geometry)
+    draw.text(**params | {'font': FONTS.localize(params['font'])})
 
 
-def draw_photographer_text(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+def draw_photographer_text(draw: ImageDraw.ImageDraw, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении надпись «ФОТОГРАФ» / «ФОТОГРАФЫ» с цветной подложкой
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
+    info_font = get_info_font(geometry.info_font_size)
+    center_x = geometry.pic_width / 2
+    bottom_y = geometry.pic_height - geometry.rectangle_height
     if '\n' not in cover_info['lower_title']:
-        draw.text(xy=(PIC_WIDTH / 2, PIC_HEIGHT - RECTANGLE_HEIGHT - 1),
+        draw.text(xy=(center_x, bottom_y - 1),
                   text=PHOTOGRAPHER_TEXT,
                   fill=define_fill(cover_info['lower_color']),
-                  font=INFO_FONT,
+                  font=info_font,
                   align='center',
                   anchor='mt')
     else:
-        photographers_textlength = draw.textlength(PHOTOGRAPHERS_TEXT, INFO_FONT)
+        photographers_textlength = draw.textlength(PHOTOGRAPHERS_TEXT, info_font)
         rectangle_xy = (
-            ((PIC_WIDTH / 2) - (photographers_textlength / 2), PIC_HEIGHT - RECTANGLE_HEIGHT - INFO_FONT_SIZE_PIXELS),
-            ((PIC_WIDTH / 2) + (photographers_textlength / 2) - 1, PIC_HEIGHT - RECTANGLE_HEIGHT - 1)
+            (center_x - (photographers_textlength / 2), bottom_y - geometry.info_font_size_pixels),
+            (center_x + (photographers_textlength / 2) - 1, bottom_y - 1)
         )
         draw.rectangle(xy=rectangle_xy,
                        fill=cover_info['lower_color'])
-        draw.text(xy=(PIC_WIDTH / 2, PIC_HEIGHT - RECTANGLE_HEIGHT - INFO_FONT_SIZE_PIXELS - 1),
+        draw.text(xy=(center_x, bottom_y - geometry.info_font_size_pixels - 1),
                   text=PHOTOGRAPHERS_TEXT,
                   fill=define_fill(cover_info['lower_color']),
-                  font=INFO_FONT,
+                  font=info_font,
                   align='center',
                   anchor='mt')
 
 
-def draw_copyright(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
+def draw_copyright(draw: ImageDraw.ImageDraw, cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> None:
     """
     Рисует на изображении надпись-копирайт
     :param draw: экземпляр ``ImageDraw.Draw`` с обложкой
     :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
     """
     coord_i = cover_info['copyright_sign']
     coords = cover_info['corners']
@@ -252,30 +261,76 @@ def draw_copyright(draw: ImageDraw.ImageDraw, cover_info: Dict) -> None:
         else:
             bg_color = cover_info['right_color']
 
-    draw.text(xy=calculate_copyright_xy(coord_i),
+    draw.text(xy=calculate_copyright_xy(coord_i, geometry),
               text=COPYRIGHT_TEXT,
               fill=define_fill(bg_color),
-              spacing=int(INFO_FONT_SIZE_PIXELS / 17),
-              font=INFO_FONT,
+              spacing=int(geometry.info_font_size_pixels / 17),
+              font=get_info_font(geometry.info_font_size),
               align='left',
               anchor='ld')
 
 
-def create_preview_pic(cover_info: Dict, chat_id: int, drawn_corners: bool = False) -> None:
+def draw_preview_base(cover_info: Dict, geometry: Geometry = PREVIEW_GEOMETRY) -> Image.Image:
     """
-    «Собирает» превью-изображение
+    Рисует фоновый слой превью-изображения: плашки и фотографию без боковых прямоугольников
     :param cover_info: параметры обложки
-    :param chat_id: айди чата (для сохранения картинки с нужным названием)
-    :param drawn_corners: если истинно, рисует прямоугольники
+    :param geometry: размеры превью
+    :return: фоновый слой
     """
-    my_image = Image.new(mode='RGBA',
-                         size=(PIC_WIDTH, PIC_HEIGHT),
-                         color='#000000')
-    draw = ImageDraw.Draw(my_image)
+    with METRICS.timer('phase_seconds', phase='draw_preview'):
+        my_image = Image.new(mode='RGBA',
+                             size=geometry.pic_size,
+                             color='#000000')
+        draw = ImageDraw.Draw(my_image)
+
+        draw_upper_lower_rectangles(draw, cover_info, geometry)
+        draw_photo(draw, my_image, cover_info, geometry)
+    return my_image
+
 
-    draw_upper_lower_rectangles(draw, cover_info)
+def draw_cover(cover_info: Dict, geometry: Geometry = FULL_GEOMETRY) -> Image.Image:
+    """
+    Рисует итоговую обложку
+    :param cover_info: параметры обложки
+    :param geometry: размеры обложки для нужного масштаба
+    :return: обложка
+    """
+    with METRICS.timer('phase_seconds', phase='draw_cover'):
+        my_image = Image.new(mode='RGBA',
+                             size=geometry.pic_size,
+                             color='#000000')
+        draw = ImageDraw.Draw(my_image)
+        draw_upper_lower_rectangles(draw, cover_info, geometry)
+        draw_corners(draw, cover_info, geometry)
+        draw_photo(draw, my_image, cover_info, geometry)
+        with METRICS.timer('phase_seconds', phase='draw_titles'):
+            draw_upper_title(draw, cover_info, geometry)
+            draw_lower_title(draw, cover_info, geometry)
+        draw_copyright(draw, cover_info, geometry)
+    return my_image
+
+
+def save_preview_pic(base: Image.Image, cover_info: Dict, chat_id: int, drawn_corners: bool = False,
+                     geometry: Geometry = PREVIEW_GEOMETRY) -> None:
+    """
+    Собирает превью-изображение из фонового слоя и сохраняет его в хранилище превью
+    :param base: фоновый слой, который вернул ``draw_preview_base()``
+    :param cover_info: параметры обложки
+    :param chat_id: айди чата (для сохранения картинки в хранилище превью)
+    :param drawn_corners: если истинно, рисует прямоугольники
+    :param geometry: размеры превью; должны совпадать с размером фонового слоя
+    """
+    compositor = PreviewCompositor(base, cover_info['left_color'], cover_info['right_color'], geometry)
     if drawn_corners:
-        draw_corners(draw, cover_info)
-    draw_photo(draw, my_image, cover_info)
+        compositor.set_corners(cover_info['corners'])
+    save_preview(chat_id, compositor)
+
 
-    my_image.save(PATH_TO_SAVE + str(chat_id) + '_' + PREVIEW_PIC_POSTFIX)
+def create_preview_pic(cover_info: Dict, chat_id: int, drawn_corners: bool = False) -> None:
+    """
+    «Собирает» превью-изображение
+    :param cover_info: параметры обложки
+    :param chat_id: айди чата (для сохранения картинки в хранилище превью)
+    :param drawn_corners: если истинно, рисует прямоугольники
+    """
+    save_preview_pic(draw_preview_base(cover_info), cover_info, chat_id, drawn_corners)
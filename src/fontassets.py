@@ -0,0 +1,191 @@
+"""
+fontassets.py
+"""
+import json
+import shutil
+import logging
+import zipfile
+import argparse
+import tempfile
+from static import *
+
+
+FONT_ASSETS_MANIFEST: str = 'manifest.json'
+FONT_ASSETS_VERSION: int = 1  # меняется, когда меняется способ сборки статических копий
+
+
+def download_font(font_url: str, font_path: str = FONT_PATH, member: str = FONT_ARCHIVE_MEMBER) -> None:
+    """
+    Скачивает архив шрифта по заданной ссылке и распаковывает из него только нужный файл, если его ещё нет на диске.
+    Архив удаляется сразу после распаковки
+    :param font_url: ссылка для скачивания архива
+    :param font_path: путь, по которому сохраняется файл шрифта
+    :param member: путь к файлу шрифта внутри архива
+    """
+    if os.path.exists(font_path):
+        return
+    import requests
+    logging.info(f'Скачивается шрифт: {font_url}')
+    os.makedirs(os.path.dirname(font_path), exist_ok=True)
+    with tempfile.TemporaryFile() as archive:
+        with requests.get(font_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                archive.write(chunk)
+        archive.seek(0)
+        with zipfile.ZipFile(archive, 'r') as file, file.open(member) as source, \
+                open(font_path + '.part', 'wb') as target:
+            shutil.copyfileobj(source, target)
+    os.replace(font_path + '.part', font_path)
+    logging.info(f'Шрифт сохранён: {font_path}')
+
+
+def describe_source(font_path: str) -> Dict:
+    """
+    Описывает файл вариативного шрифта, чтобы заметить, что статические копии собраны из другого файла
+    :param font_path: путь к файлу шрифта
+    :return: словарь с именем (``file``), размером (``size``) и временем изменения (``mtime``) файла
+    """
+    stat = os.stat(font_path)
+    return {'file': os.path.basename(font_path), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def make_instance_axes(min_width: int, width_step: int = MEASURE_WIDTH_STEP) -> Dict[str, Tuple[int, ...]]:
+    """
+    Определяет, какие статические копии шрифта собирать: заголовочный шрифт для значений оси ширины
+    от минимального до ``TITLE_FONT_AXES`` с шагом ``width_step`` (как в таблицах ширин measure.py)
+    и шрифт служебных надписей
+    :param min_width: минимальное значение оси ширины
+    :param width_step: шаг оси ширины
+    :return: словарь, где ключ – имя копии, значение – значения осей
+    """
+    instances = dict()
+    max_width = TITLE_FONT_AXES[WIDTH_AXES_INDEX]
+    for width in sorted({*range(min_width, max_width, width_step), max_width}):
+        axes = TITLE_FONT_AXES[:]
+        axes[WIDTH_AXES_INDEX] = width
+        instances[f'title-wdth{width}'] = tuple(axes)
+    instances['info'] = tuple(INFO_FONT_AXES)
+    return instances
+
+
+def read_assets_manifest(assets_path: str = FONT_ASSETS_PATH) -> Dict | None:
+    """
+    Читает манифест статических копий шрифта
+    :param assets_path: директория статических копий
+    :return: манифест; ``None``, если его нет или его нельзя прочитать
+    """
+    try:
+        with open(os.path.join(assets_path, FONT_ASSETS_MANIFEST), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def is_manifest_fresh(manifest: Dict | None, font_path: str, subset_text: str | None) -> bool:
+    """
+    Определяет, собраны ли статические копии из этого файла шрифта теми же настройками
+    :param manifest: манифест статических копий
+    :param font_path: путь к файлу вариативного шрифта
+    :param subset_text: символы, которые оставлены в копиях; ``None`` – копии не урезаны
+    :return: ``True``, если копии можно использовать. ``False`` – в обратном случае
+    """
+    return (manifest is not None
+            and manifest.get('version') == FONT_ASSETS_VERSION
+            and manifest.get('source') == describe_source(font_path)
+            and manifest.get('subset') == subset_text)
+
+
+def build_font_assets(font_path: str = FONT_PATH, assets_path: str = FONT_ASSETS_PATH,
+                      subset_text: str | None = None, force: bool = False) -> Dict:
+    """
+    Собирает статические копии вариативного шрифта (оси зафиксированы, таблицы вариаций удалены)
+    и записывает манифест. Если манифест уже описывает этот файл шрифта и те же настройки, ничего не делает.
+    Нужен fontTools из requirements-build.txt (боту он не нужен, поэтому его нет в requirements.txt)
+    :param font_path: путь к файлу вариативного шрифта
+    :param assets_path: директория статических копий
+    :param subset_text: если задано, в копиях остаются только эти символы
+    :param force: если истинно, собирает копии заново
+    :return: манифест
+    """
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+    from fontTools.varLib import instancer
+
+    download_font(FONT_URL, font_path)
+    manifest = read_assets_manifest(assets_path)
+    if not force and is_manifest_fresh(manifest, font_path, subset_text):
+        return manifest
+
+    os.makedirs(assets_path, exist_ok=True)
+    variable_font = TTFont(font_path)
+    axis_tags = [axis.axisTag for axis in variable_font['fvar'].axes]
+    min_width = int(variable_font['fvar'].axes[WIDTH_AXES_INDEX].minValue)
+    instances = list()
+    for name, axes in make_instance_axes(min_width).items():
+        # флаг пересечения контуров заставляет FreeType растеризовать глифы с многократной передискретизацией,
+        # а исходный вариативный шрифт рисуется без неё
+        font = instancer.instantiateVariableFont(variable_font, dict(zip(axis_tags, axes)),
+                                                 overlap=instancer.OverlapMode.KEEP_AND_DONT_SET_FLAGS)
+        if subset_text is not None:
+            options = subset.Options()
+            options.layout_features = ['*']
+            options.name_IDs = ['*']
+            options.notdef_outline = True
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(text=subset_text)
+            subsetter.subset(font)
+        file_name = f'{name}.ttf'
+        font.save(os.path.join(assets_path, file_name))
+        instances.append({'name': name, 'axes': list(axes), 'file': file_name})
+        logging.info(f'Собрана статическая копия шрифта: {file_name}')
+
+    manifest = {
+        'version':   FONT_ASSETS_VERSION,
+        'source':    describe_source(font_path),
+        'subset':    subset_text,
+        'instances': instances,
+    }
+    with open(os.path.join(assets_path, FONT_ASSETS_MANIFEST + '.part'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    os.replace(os.path.join(assets_path, FONT_ASSETS_MANIFEST + '.part'),
+               os.path.join(assets_path, FONT_ASSETS_MANIFEST))
+    return manifest
+
+
+def load_font_instances(font_path: str = FONT_PATH, assets_path: str = FONT_ASSETS_PATH) -> Dict[Tuple[int, ...], str]:
+    """
+    Находит собранные статические копии шрифта.
+    Копии, собранные из другого файла шрифта, не используются
+    :param font_path: путь к файлу вариативного шрифта
+    :param assets_path: директория статических копий
+    :return: словарь, где ключ – значения осей, значение – путь к статической копии
+    """
+    manifest = read_assets_manifest(assets_path)
+    if manifest is None:
+        return dict()
+    if not is_manifest_fresh(manifest, font_path, manifest.get('subset')):
+        logging.warning(f'Статические копии шрифта в {assets_path} собраны из другого файла, они не используются')
+        return dict()
+    return {tuple(instance['axes']): os.path.join(assets_path, instance['file'])
+            for instance in manifest['instances']
+            if os.path.exists(os.path.join(assets_path, instance['file']))}
+
+
+def main() -> None:
+    """
+    Сборка статических копий шрифта: ``python fontassets.py [--subset] [--force]``
+    """
+    parser = argparse.ArgumentParser(description='Сборка статических копий шрифта для заголовков и служебных надписей')
+    parser.add_argument('--subset', action='store_true',
+                        help='оставить в копиях только символы FONT_SUBSET_TEXT')
+    parser.add_argument('--force', action='store_true', help='собрать копии заново')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger('fontTools').setLevel(logging.WARNING)
+    manifest = build_font_assets(subset_text=FONT_SUBSET_TEXT if args.subset else None, force=args.force)
+    print(f'Статических копий шрифта: {len(manifest["instances"])} в {FONT_ASSETS_PATH}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+fonts.py
+"""
+import io
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import ImageFont
+from static import *
+from fontassets import download_font, load_font_instances
+
+
+FontKey = Tuple[int, Tuple[int, ...] | None]
+# размер шрифта и значения осей вариативного шрифта (``None`` – значения по умолчанию)
+
+
+class FontManager:
+    """
+    Выдаёт экземпляры вариативного шрифта по размеру и значениям осей.\n
+    Файл шрифта читается с диска один раз, при первом запросе шрифта (если файла нет, он скачивается).
+    Если для значений осей собрана статическая копия (см. fontassets.py), вместо вариативного шрифта
+    загружается она: оси не нужно настраивать, а FreeType не пересчитывает контуры при растеризации.
+    У каждого потока свой кэш экземпляров, поэтому потоки не меняют оси шрифта друг другу
+    """
+
+    def __init__(self, font_path: str, cache_size: int, layout_engine: str | None = None,
+                 assets_path: str | None = None) -> None:
+        """
+        :param font_path: путь к файлу вариативного шрифта
+        :param cache_size: сколько экземпляров шрифта хранить в кэше одного потока
+        :param layout_engine: движок вёрстки текста: ``basic``, ``raqm`` или ``None`` (по умолчанию в Pillow)
+        :param assets_path: директория статических копий шрифта; ``None`` – использовать только вариативный шрифт
+        """
+        self.font_path = font_path
+        self.assets_path = assets_path
+        self.cache_size = cache_size
+        self.layout_engine = {
+            'basic': ImageFont.Layout.BASIC,
+            'raqm':  ImageFont.Layout.RAQM,
+        }.get(layout_engine)
+        self.font_bytes: bytes | None = None
+        self.instances: Dict[Tuple[int, ...], str] | None = None
+        # ключ – значения осей, значение – путь к статической копии шрифта
+        self.instance_bytes: Dict[Tuple[int, ...], bytes] = dict()
+        # ключ – значения осей, значение – прочитанный файл статической копии
+        self.local = threading.local()
+        self.keys: weakref.WeakKeyDictionary[ImageFont.FreeTypeFont, FontKey] = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def make_font(self, size: int, axes: List[int] | Tuple[int, ...] | None = None) -> ImageFont.FreeTypeFont:
+        """
+        Создаёт новый экземпляр шрифта, не сохраняя его в кэш.
+        Без значений осей подходит для временного шрифта, оси которого будут меняться
+        :param size: размер шрифта
+        :param axes: значения осей; ``None`` – значения по умолчанию
+        :return: экземпляр шрифта
+        """
+        font_bytes = self.find_instance(tuple(axes)) if axes is not None else None
+        if font_bytes is not None:
+            return ImageFont.truetype(font=io.BytesIO(font_bytes),
+                                      size=size,
+                                      encoding='unic',
+                                      layout_engine=self.layout_engine)
+        with self.lock:
+            if self.font_bytes is None:
+                download_font(FONT_URL, self.font_path)
+                with open(self.font_path, 'rb') as file:
+                    self.font_bytes = file.read()
+        font = ImageFont.truetype(font=io.BytesIO(self.font_bytes),
+                                  size=size,
+                                  encoding='unic',
+                                  layout_engine=self.layout_engine)
+        if axes is not None:
+            font.set_variation_by_axes(list(axes))
+        return font
+
+    def find_instance(self, axes: Tuple[int, ...]) -> bytes | None:
+        """
+        Находит статическую копию шрифта для значений осей
+        :param axes: значения осей
+        :return: файл статической копии; ``None``, если копия не собрана
+        """
+        with self.lock:
+            if self.instances is None:
+                download_font(FONT_URL, self.font_path)
+                self.instances = load_font_instances(self.font_path, self.assets_path) if self.assets_path else dict()
+            if axes not in self.instances:
+                return None
+            if axes not in self.instance_bytes:
+                with open(self.instances[axes], 'rb') as file:
+                    self.instance_bytes[axes] = file.read()
+            return self.instance_bytes[axes]
+
+    def get_font(self, size: int, axes: List[int] | Tuple[int, ...] | None = None) -> ImageFont.FreeTypeFont:
+        """
+        Возвращает экземпляр шрифта из кэша текущего потока, при необходимости создаёт его.\n
+        Оси возвращённого шрифта нельзя менять
+        :param size: размер шрифта
+        :param axes: значения осей; ``None`` – значения по умолчанию
+        :return: экземпляр шрифта
+        """
+        key = (size, tuple(axes) if axes is not None else None)
+        cache = getattr(self.local, 'cache', None)
+        if cache is None:
+            cache = self.local.cache = OrderedDict()
+        font = cache.get(key)
+        if font is not None:
+            cache.move_to_end(key)
+            return font
+
+        font = self.make_font(*key)
+        cache[key] = font
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        with self.lock:
+            self.keys[font] = key
+        return font
+
+    def describe(self, font: ImageFont.FreeTypeFont) -> FontKey | None:
+        """
+        Определяет размер и значения осей шрифта, выданного ``get_font()``
+        :param font: экземпляр шрифта
+        :return: размер и значения осей; ``None``, если шрифт создан не через ``get_font()``
+        """
+        with self.lock:
+            return self.keys.get(font)
+
+    def localize(self, font: ImageFont.FreeTypeFont) -> ImageFont.FreeTypeFont:
+        """
+        Возвращает такой же шрифт из кэша текущего потока.
+        Нужен, когда шрифт подобран в одном потоке, а рисовать им будут в другом
+        :param font: экземпляр шрифта
+        :return: экземпляр шрифта текущего потока
+        """
+        key = self.describe(font)
+        return self.get_font(*key) if key is not None else font
+
+
+FONTS: FontManager = FontManager(FONT_PATH, FONT_CACHE_SIZE, FONT_LAYOUT_ENGINE, FONT_ASSETS_PATH)
+
+
+def get_title_font(size: int = TITLE_FONT_SIZE) -> ImageFont.FreeTypeFont:
+    """
+    Возвращает заголовочный шрифт текущего потока
+    :param size: размер шрифта
+    :return: экземпляр шрифта
+    """
+    return FONTS.get_font(size, TITLE_FONT_AXES)
+
+
+@lru_cache(maxsize=None)
+def get_min_width() -> int:
+    """
+    Возвращает минимальное значение оси ширины заголовочного шрифта
+    :return: значение оси ширины
+    """
+    return FONTS.make_font(TITLE_FONT_SIZE).get_variation_axes()[WIDTH_AXES_INDEX]['minimum']
+
+
+def get_info_font(size: int = INFO_FONT_SIZE) -> ImageFont.FreeTypeFont:
+    """
+    Возвращает шрифт для служебных надписей текущего потока
+    :param size: размер шрифта
+    :return: экземпляр шрифта
+    """
+    return FONTS.get_font(size, INFO_FONT_AXES)
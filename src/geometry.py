@@ -0,0 +1,74 @@
+"""
+geometry.py
+"""
+from functools import lru_cache
+from typing import NamedTuple
+from static import *
+
+
+class Geometry(NamedTuple):
+    """
+    Размеры обложки и шрифтов для одного масштаба.
+    Для ``MULTIPLIER`` совпадают с константами из static.py
+    """
+    multiplier: float
+    pic_width: int
+    pic_height: int
+    pic_size: Tuple[int, int]
+    rectangle_width: int
+    rectangle_height: int
+    rectangle_size: Tuple[int, int]
+    photo_width: int
+    photo_height: int
+    photo_size: Tuple[int, int]
+    upper_coords: Tuple[Tuple[int, int], Tuple[int, int]]
+    lower_coords: Tuple[Tuple[int, int], Tuple[int, int]]
+    title_font_size: int
+    title_font_size_pixels: int
+    info_font_size: int
+    info_font_size_pixels: int
+
+
+@lru_cache(maxsize=None)
+def get_geometry(multiplier: float) -> Geometry:
+    """
+    Рассчитывает размеры обложки и шрифтов для заданного масштаба
+    :param multiplier: масштаб относительно обложки 1080x720
+    :return: размеры
+    """
+    pic_width = int(PIC_BASE_WIDTH * multiplier)
+    pic_height = int(PIC_BASE_HEIGHT * multiplier)
+    rectangle_width = int(pic_width / RECTANGLE_NUM)
+    rectangle_height = int(pic_height / RECTANGLE_NUM)
+    photo_width = int(pic_width - rectangle_width * 2)
+    photo_height = int(pic_height - rectangle_height * 2)
+    return Geometry(
+        multiplier=multiplier,
+        pic_width=pic_width,
+        pic_height=pic_height,
+        pic_size=(pic_width, pic_height),
+        rectangle_width=rectangle_width,
+        rectangle_height=rectangle_height,
+        rectangle_size=(rectangle_width, rectangle_height),
+        photo_width=photo_width,
+        photo_height=photo_height,
+        photo_size=(photo_width, photo_height),
+        upper_coords=(
+            (rectangle_width, 0),
+            (rectangle_width * (RECTANGLE_NUM - 1) - 1, rectangle_height - 1)
+        ),
+        lower_coords=(
+            (rectangle_width, rectangle_height * (RECTANGLE_NUM - 1)),
+            (rectangle_width * (RECTANGLE_NUM - 1) - 1, rectangle_height * RECTANGLE_NUM - 1)
+        ),
+        title_font_size=int(TITLE_FONT_BASE_SIZE * multiplier),
+        title_font_size_pixels=int(TITLE_FONT_BASE_SIZE_PIXELS * multiplier),
+        info_font_size=int(INFO_FONT_BASE_SIZE * multiplier),
+        info_font_size_pixels=int(INFO_FONT_BASE_SIZE_PIXELS * multiplier),
+    )
+
+
+FULL_GEOMETRY: Geometry = get_geometry(MULTIPLIER)
+# итоговая обложка
+PREVIEW_GEOMETRY: Geometry = get_geometry(PREVIEW_MULTIPLIER)
+# превью-изображения, которые бот показывает при выборе прямоугольников и копирайт-надписи
@@ -0,0 +1,244 @@
+"""
+janitor.py
+"""
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Callable, ContextManager
+from static import *
+from state import covers_info, find_sessions_to_evict, evict_session, get_last_activity
+from storage import PHOTOS
+from metrics import Metrics
+
+
+def find_file_chat_id(file_name: str) -> int | None:
+    """
+    Определяет чат по имени файла в ``PATH_TO_SAVE`` (имена начинаются с айди чата)
+    :param file_name: имя файла
+    :return: айди чата; ``None``, если имя файла не начинается с айди
+    """
+    try:
+        return int(file_name.split('_', 1)[0])
+    except ValueError:
+        return None
+
+
+def measure_directory(path: str) -> int:
+    """
+    Считает, сколько байт занимают файлы директории вместе с вложенными директориями
+    :param path: путь к директории
+    :return: размер файлов в байтах; 0, если директории нет
+    """
+    if not os.path.isdir(path):
+        return 0
+    total_size = 0
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            total_size += measure_directory(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            total_size += entry.stat(follow_symlinks=False).st_size
+    return total_size
+
+
+def sweep_directory(path: str, max_age: float, max_size: float, protected: Callable[[str], bool],
+                    lock: ContextManager | None = None) -> Tuple[int, int]:
+    """
+    Удаляет файлы старше ``max_age`` секунд; если файлы занимают больше ``max_size`` байт,
+    удаляет самые старые, пока размер не уложится в ограничение.
+    Защищённые файлы не удаляются, но учитываются в размере
+    :param path: путь к директории
+    :param max_age: сколько секунд хранить файл
+    :param max_size: сколько байт могут занимать файлы директории; ``float('inf')`` – только по возрасту
+    :param protected: функция, определяющая по имени файла, что его нельзя удалять
+    :param lock: блокировка, под которой файл перед удалением проверяется ещё раз
+        (если его могут начать использовать во время уборки); ``None`` – не проверять
+    :return: количество удалённых файлов и освобождённых байт
+    """
+    files = list()
+    total_size = 0
+    for entry in os.scandir(path):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        total_size += stat.st_size
+        if not protected(entry.name):
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+
+    removed_files, removed_bytes = 0, 0
+    deadline = time.time() - max_age
+    for mtime, size, file_name in sorted(files):
+        if mtime >= deadline and total_size <= max_size:
+            break
+        with lock if lock is not None else nullcontext():
+            if lock is not None and protected(file_name):
+                continue
+            try:
+                os.remove(os.path.join(path, file_name))
+            except FileNotFoundError:
+                pass
+            else:
+                removed_files += 1
+                removed_bytes += size
+        total_size -= size
+    return removed_files, removed_bytes
+
+
+class Janitor:
+    """
+    Фоновая уборка: удаляет состояния заброшенных чатов (по времени неактивности и по количеству чатов)
+    и файлы в ``PATH_TO_SAVE`` (по возрасту и по общему размеру).\n
+    Файлы чатов, состояние которых хранится, не удаляются, кроме недокачанных.
+    Счётчики удалённого накапливаются в ``stats``
+    """
+
+    def __init__(self, interval: float, session_ttl: float, max_sessions: int,
+                 path: str, max_file_age: float, max_dir_size: int) -> None:
+        """
+        :param interval: раз в сколько секунд проводить уборку
+        :param session_ttl: сколько секунд хранить состояние неактивного чата
+        :param max_sessions: сколько чатов хранить
+        :param path: директория с файлами чатов
+        :param max_file_age: сколько секунд хранить файл
+        :param max_dir_size: сколько байт могут занимать файлы директории
+        """
+        self.interval = interval
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.path = path
+        self.max_file_age = max_file_age
+        self.max_dir_size = max_dir_size
+        self.is_active: Callable[[int], bool] = lambda chat_id: False
+        self.on_evict: Callable[[int], None] = lambda chat_id: None
+        self.lock: ContextManager = nullcontext()
+        self.stats: Dict[str, int] = {
+            'runs':                 0,
+            'sessions_expired':     0,
+            'sessions_overflowed':  0,
+            'files_removed':        0,
+            'bytes_removed':        0,
+        }
+        # ключ – название счётчика, значение – сколько всего удалено с запуска бота
+        self.stats_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='Janitor', daemon=True)
+
+    def start(self, is_active: Callable[[int], bool], on_evict: Callable[[int], None],
+              lock: ContextManager | None = None) -> None:
+        """
+        Запускает уборку в отдельном потоке
+        :param is_active: функция, определяющая, обрабатывается ли сейчас обновление чата
+        :param on_evict: функция, которая удаляет данные чата, принадлежащие боту (обработчики следующего сообщения)
+        :param lock: блокировка, которую бот берёт, прежде чем начать обработку обновления чата
+            (то есть прежде чем ``is_active`` станет ``True``); под ней чат проверяется ещё раз и удаляется.
+            ``None`` – не проверять
+        """
+        self.is_active = is_active
+        self.on_evict = on_evict
+        if lock is not None:
+            self.lock = lock
+        self.thread.start()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Возвращает копию счётчиков
+        :return: словарь, где ключ – название счётчика, значение – сколько всего удалено
+        """
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def add_gauges(self, metrics: Metrics) -> None:
+        """
+        Добавляет в метрики показатели, за которыми следит уборка: количество хранимых состояний чатов,
+        место, которое занимают файлы в ``path``, хранилище фотографий и счётчики удалённого
+        :param metrics: метрики
+        """
+        metrics.add_gauge('sessions', lambda: len(covers_info))
+        metrics.add_gauge('pictures_bytes', lambda: measure_directory(self.path))
+        metrics.add_gauge('photo_storage', PHOTOS.get_stats, label='stat')
+        metrics.add_gauge('janitor', self.get_stats, label='counter', kind='counter')
+
+    def protects(self, file_name: str) -> bool:
+        """
+        Определяет, нельзя ли удалять файл: он принадлежит хранимому чату и докачан
+        :param file_name: имя файла
+        :return: ``True``, если файл нельзя удалять. ``False`` – в обратном случае
+        """
+        return not file_name.endswith('.part') and find_file_chat_id(file_name) in covers_info
+
+    def evict(self, chat_id: int, found_at: float) -> bool:
+        """
+        Удаляет состояние чата, если с поиска заброшенных чатов его обновления не начали обрабатываться
+        и не были обработаны
+        :param chat_id: айди чата
+        :param found_at: время (``time.monotonic()``) до поиска заброшенных чатов
+        :return: ``True``, если состояние удалено. ``False`` – в обратном случае
+        """
+        with self.lock:
+            if self.is_active(chat_id):
+                return False
+            activity = get_last_activity(chat_id)
+            if activity is not None and activity >= found_at:
+                return False
+            try:
+                self.on_evict(chat_id)
+                evict_session(chat_id)
+            except Exception:
+                logging.exception(f'{chat_id} Не удалось удалить состояние чата')
+                return False
+        return True
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Проводит одну уборку
+        :return: словарь, где ключ – название счётчика, значение – сколько удалено за эту уборку
+        """
+        found_at = time.monotonic()
+        expired, overflowed = find_sessions_to_evict(self.session_ttl, self.max_sessions, self.is_active)
+        expired = [chat_id for chat_id in expired if self.evict(chat_id, found_at)]
+        overflowed = [chat_id for chat_id in overflowed if self.evict(chat_id, found_at)]
+        removed_files, removed_bytes = 0, 0
+        if os.path.isdir(self.path):
+            removed_files, removed_bytes = sweep_directory(self.path, self.max_file_age, self.max_dir_size,
+                                                           self.protects)
+        if os.path.isdir(PHOTOS.path):
+            # фотографии без чатов остаются только после сбоя, ограничение по размеру к ним не применяется;
+            # под блокировкой хранилища, потому что PHOTOS.add() может отдать чату уже лежащий файл
+            photo_files, photo_bytes = sweep_directory(PHOTOS.path, self.max_file_age, float('inf'),
+                                                       PHOTOS.is_referenced, PHOTOS.lock)
+            removed_files += photo_files
+            removed_bytes += photo_bytes
+        result = {
+            'runs':                 1,
+            'sessions_expired':     len(expired),
+            'sessions_overflowed':  len(overflowed),
+            'files_removed':        removed_files,
+            'bytes_removed':        removed_bytes,
+        }
+        with self.stats_lock:
+            for key, value in result.items():
+                self.stats[key] += value
+        if expired or overflowed or removed_files:
+            logging.info(f'Уборка: удалено состояний чатов – {len(expired)} по времени, {len(overflowed)} по количеству; '
+                         f'удалено файлов – {removed_files} ({removed_bytes} байт)')
+        return result
+
+    def run(self) -> None:
+        """
+        Проводит уборку раз в ``interval`` секунд, пока уборка не остановлена
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logging.exception('Ошибка при уборке')
+
+    def stop(self) -> None:
+        """
+        Останавливает уборку
+        """
+        self.stopped.set()
+
+
+JANITOR: Janitor = Janitor(JANITOR_INTERVAL, SESSION_TTL, SESSION_MAX_COUNT,
+                           PATH_TO_SAVE, JANITOR_MAX_FILE_AGE, JANITOR_MAX_DIR_SIZE)
@@ -0,0 +1,79 @@
+"""
+markup.py
+"""
+from telebot import types
+from typing import Literal
+from static import *
+
+
+def make_corner_type_markup() -> types.InlineKeyboardMarkup:
+    """
+    Создаёт Inline-клавиатуру для выбора типа расположения прямоугольников
+    """
+    markup = types.InlineKeyboardMarkup(row_width=4)
+    corner_btns = [types.InlineKeyboardButton(str(i), callback_data='corner_'+str(i)) for i in CORNER_COORDS.keys()]
+    other_corner_btn = types.InlineKeyboardButton('Собрать самому', callback_data='custom_corner')
+    ready_btn = types.InlineKeyboardButton('Готово', callback_data=f'corner_ready')
+    markup.row(other_corner_btn)
+    markup.add(*corner_btns)
+    markup.row(ready_btn)
+    return markup
+
+
+def make_interface_markup(prefix: str, corners: List[int],
+                          add_random: bool = True, add_ready: bool = True) -> types.InlineKeyboardMarkup:
+    """
+    Создаёт Inline-клавиатуру для редактирования расположения прямоугольников
+    :param prefix: префикс, который будет передаваться в callback_data у кнопок
+    :param corners: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
+    :param add_random: если истинно, добавляет кнопку «Рандом»
+    :param add_ready: если истинно, добавляет кнопку «Готово»
+    :return: Inline-клавиатура
+    """
+    markup = types.InlineKeyboardMarkup(row_width=6)
+    for i in range(RECTANGLE_NUM):
+        col_state_left, col_state_right = (f'_{corners[i]}',
+                                           f'_{corners[i+RECTANGLE_NUM]}') if prefix == CUSTOM_CORNER_PREFIX else ('',
+                                                                                                                   '')
+        row = [types.InlineKeyboardButton(str(i+1), callback_data=f'{prefix}_{str(i)}' + col_state_left)]
+        for j in range(4):
+            row.append(types.InlineKeyboardButton('⬛', callback_data='_'))
+        row.append(types.InlineKeyboardButton(str(i+RECTANGLE_NUM+1),
+                                              callback_data=f'{prefix}_{str(i+RECTANGLE_NUM)}'+col_state_right))
+        markup.add(*row)
+
+    if add_random:
+        random_btn = types.InlineKeyboardButton('Рандом', callback_data=f'{prefix}_random')
+        markup.row(random_btn)
+    if add_ready:
+        ready_btn = types.InlineKeyboardButton('Готово', callback_data=f'{prefix}_ready')
+        markup.row(ready_btn)
+    return markup
+
+
+def make_photo_bg_markup() -> types.InlineKeyboardMarkup:
+    """
+    Создаёт Inline-клавиатуру для выбора фона фотографии
+    :return: Inline-клавиатура
+    """
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    btn_white = types.InlineKeyboardButton('Белый', callback_data=f'bg_white')
+    btn_black = types.InlineKeyboardButton('Серый', callback_data=f'bg_grey')
+    btn_gradient_white = types.InlineKeyboardButton('Чёрно-белый градиент', callback_data=f'bg_grad-white')
+    btn_gradient_grey = types.InlineKeyboardButton('Чёрно-серый градиент', callback_data=f'bg_grad-grey')
+    markup.add(btn_white, btn_black, btn_gradient_white, btn_gradient_grey)
+    return markup
+
+
+def make_color_markup(prefix: Literal['u', 'l', 'i', 'r'], colors: Dict[str, str]) -> types.InlineKeyboardMarkup:
+    """
+    Создаёт Inline-клавиатуру для выбора цвета плашки
+    :param prefix: префикс плашки, которая покрасится: ``u`` – верхняя, ``l`` – нижняя, ``i`` – левая, ``r`` – правая
+    :param colors: словарь, где ключ – название цвета, значение – HEX-код
+    :return: Inline-клавиатура
+    """
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    color_btns = [types.InlineKeyboardButton(k, callback_data=prefix+'_'+v) for k, v in colors.items()]
+    color_btns.append(types.InlineKeyboardButton('Другой', callback_data=prefix+'_other'))
+    markup.add(*color_btns)
+    return markup
@@ -0,0 +1,131 @@
+"""
+measure.py
+"""
+import threading
+from PIL import ImageFont
+from static import *
+from fonts import FONTS, get_min_width
+
+
+class AdvanceTable:
+    """
+    Таблица ширин символов и кернинга пар символов для одного экземпляра шрифта.\n
+    Заполняется по мере появления новых символов, поэтому для заголовков
+    с небольшим алфавитом почти сразу сводится к поиску в словарях
+    """
+
+    def __init__(self, size: int, axes: Tuple[int, ...]) -> None:
+        """
+        :param size: размер шрифта
+        :param axes: значения осей шрифта
+        """
+        self.size = size
+        self.axes = axes
+        self.advances: Dict[str, float] = dict()
+        self.kerning: Dict[Tuple[str, str], float] = dict()
+
+    def get_advance(self, char: str) -> float:
+        """
+        Возвращает ширину символа
+        :param char: символ
+        :return: ширина символа в пикселях
+        """
+        advance = self.advances.get(char)
+        if advance is None:
+            advance = self.advances[char] = FONTS.get_font(self.size, self.axes).getlength(char)
+        return advance
+
+    def get_kerning(self, pair: Tuple[str, str]) -> float:
+        """
+        Возвращает поправку кернинга для пары символов
+        :param pair: пара символов
+        :return: поправка в пикселях
+        """
+        kerning = self.kerning.get(pair)
+        if kerning is None:
+            pair_length = FONTS.get_font(self.size, self.axes).getlength(''.join(pair))
+            kerning = self.kerning[pair] = pair_length - self.get_advance(pair[0]) - self.get_advance(pair[1])
+        return kerning
+
+    def estimate_length(self, text: str) -> float:
+        """
+        Оценивает ширину строки по таблице
+        :param text: однострочный текст
+        :return: ширина строки в пикселях
+        """
+        return sum(map(self.get_advance, text)) + sum(map(self.get_kerning, zip(text, text[1:])))
+
+
+advance_tables: Dict[Tuple[int, Tuple[int, ...]], AdvanceTable] = dict()
+# ключ – размер шрифта и значения осей, значение – таблица ширин символов
+advance_tables_lock: threading.Lock = threading.Lock()
+
+
+def get_advance_table(size: int, width: int) -> AdvanceTable:
+    """
+    Возвращает таблицу ширин символов для заголовочного шрифта с заданной шириной
+    :param size: размер шрифта
+    :param width: значение оси ширины
+    :return: таблица ширин символов
+    """
+    axes = TITLE_FONT_AXES[:]
+    axes[WIDTH_AXES_INDEX] = width
+    key = (size, tuple(axes))
+    with advance_tables_lock:
+        if key not in advance_tables:
+            advance_tables[key] = AdvanceTable(*key)
+        return advance_tables[key]
+
+
+def find_width_samples(width: int) -> Tuple[int, int]:
+    """
+    Находит ближайшие к значению оси ширины точки, для которых строятся таблицы
+    :param width: значение оси ширины
+    :return: ближайшие точки снизу и сверху (совпадают, если значение само является точкой)
+    """
+    min_width = get_min_width()
+    low = min_width + (width - min_width) // MEASURE_WIDTH_STEP * MEASURE_WIDTH_STEP
+    if low == width:
+        return low, low
+    return low, min(low + MEASURE_WIDTH_STEP, TITLE_FONT_AXES[WIDTH_AXES_INDEX])
+
+
+def estimate_length(text: str, font: ImageFont.FreeTypeFont) -> float | None:
+    """
+    Оценивает ширину строки заголовочным шрифтом по таблицам ширин символов,
+    для промежуточных значений оси ширины – линейной интерполяцией между соседними точками
+    :param text: однострочный текст
+    :param font: заголовочный шрифт, выданный ``FONTS``
+    :return: ширина строки в пикселях; ``None``, если для шрифта нельзя построить таблицу
+    """
+    key = FONTS.describe(font)
+    if key is None or key[1] is None:
+        return None
+    size, axes = key
+    width = axes[WIDTH_AXES_INDEX]
+    if any(value != TITLE_FONT_AXES[i] for i, value in enumerate(axes) if i != WIDTH_AXES_INDEX):
+        return None
+    if not get_min_width() <= width <= TITLE_FONT_AXES[WIDTH_AXES_INDEX]:
+        return None
+
+    low, high = find_width_samples(width)
+    low_length = get_advance_table(size, low).estimate_length(text)
+    if low == high:
+        return low_length
+    high_length = get_advance_table(size, high).estimate_length(text)
+    return low_length + (high_length - low_length) * (width - low) / (high - low)
+
+
+def is_wider(text: str, font: ImageFont.FreeTypeFont, limit: float) -> bool:
+    """
+    Определяет, не меньше ли ширина строки заданного предела.
+    FreeType вызывается, только если оценка по таблицам близка к пределу
+    :param text: однострочный текст
+    :param font: шрифт
+    :param limit: предел в пикселях
+    :return: ``True``, если ширина строки не меньше предела. ``False`` – в обратном случае
+    """
+    length = estimate_length(text, font)
+    if length is None or abs(length - limit) <= limit * MEASURE_MARGIN:
+        length = font.getlength(text)
+    return length >= limit
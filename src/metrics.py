@@ -0,0 +1,333 @@
+"""
+metrics.py
+"""
+import time
+import inspect
+import logging
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, ContextManager
+from static import *
+
+
+Labels = Tuple[Tuple[str, str], ...]
+# пары «имя метки – значение», отсортированные по имени
+
+
+def make_labels(labels: Dict[str, Any]) -> Labels:
+    """
+    Приводит метки серии к ключу словаря
+    :param labels: словарь, где ключ – имя метки, значение – значение метки
+    :return: отсортированные пары «имя – значение»
+    """
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Экранирует значение метки для текстового формата Prometheus
+    :param value: значение метки
+    :return: экранированное значение
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Labels, extra: str = '') -> str:
+    """
+    Форматирует метки серии для текстового формата Prometheus
+    :param labels: метки серии
+    :param extra: дополнительная метка, уже отформатированная (например, ``le="0.1"``)
+    :return: метки в фигурных скобках; пустая строка, если меток нет
+    """
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in labels]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Timer:
+    """
+    Замеряет время блока ``with`` и записывает его в гистограмму;
+    если в блоке возникло исключение, увеличивает счётчик ошибок
+    """
+    __slots__ = ('metrics', 'name', 'errors', 'labels', 'started')
+
+    def __init__(self, metrics: 'Metrics', name: str, errors: str | None, labels: Dict[str, Any]) -> None:
+        """
+        :param metrics: метрики, в которые записывается время
+        :param name: название гистограммы
+        :param errors: название счётчика ошибок; ``None`` – ошибки не считаются
+        :param labels: метки серии
+        """
+        self.metrics = metrics
+        self.name = name
+        self.errors = errors
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None and self.errors is not None:
+            self.metrics.inc(self.errors, **self.labels)
+
+
+class Metrics:
+    """
+    Метрики бота: гистограммы времени, счётчики и показатели, которые вычисляются при запросе.\n
+    Пока метрики не включены, ``observe()``, ``inc()`` и ``timer()`` ничего не делают,
+    поэтому замеры в обработчиках и отрисовке почти ничего не стоят.
+    Процессы отрисовки копируют включённые метрики при запуске, собирают замеры у себя
+    и возвращают их вместе с результатом задачи (``take()`` / ``merge()``)
+    """
+
+    def __init__(self, buckets: Tuple[float, ...], prefix: str) -> None:
+        """
+        :param buckets: верхние границы корзин гистограмм в секундах (по возрастанию)
+        :param prefix: префикс названий метрик
+        """
+        self.buckets = buckets
+        self.prefix = prefix
+        self.enabled = False
+        self.histograms: Dict[str, Dict[Labels, List[float]]] = dict()
+        # ключ – название гистограммы, значение – серии: количество замеров в каждой корзине
+        # (последняя – больше всех границ) и сумма замеров
+        self.counters: Dict[str, Dict[Labels, float]] = dict()
+        # ключ – название счётчика, значение – серии и их значения
+        self.gauges: Dict[str, Tuple[Callable[[], float | Dict[str, float]], str | None, str]] = dict()
+        # ключ – название показателя, значение – функция, имя метки (если функция возвращает словарь) и тип метрики
+        self.lock = threading.Lock()
+        self.null_timer = nullcontext()
+
+    def enable(self) -> None:
+        """
+        Включает сбор метрик
+        """
+        self.enabled = True
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """
+        Записывает замер времени в гистограмму
+        :param name: название гистограммы
+        :param seconds: время в секундах
+        :param labels: метки серии
+        """
+        if not self.enabled:
+            return
+        key = make_labels(labels)
+        index = bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.histograms.setdefault(name, dict()).get(key)
+            if series is None:
+                series = self.histograms[name][key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """
+        Увеличивает счётчик
+        :param name: название счётчика
+        :param value: на сколько увеличить
+        :param labels: метки серии
+        """
+        if not self.enabled:
+            return
+        key = make_labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, dict())
+            series[key] = series.get(key, 0) + value
+
+    def timer(self, name: str, errors: str | None = None, **labels: Any) -> ContextManager:
+        """
+        Замеряет время блока ``with``: ``with METRICS.timer('phase_seconds', phase='decode'): ...``
+        :param name: название гистограммы
+        :param errors: название счётчика ошибок блока; ``None`` – ошибки не считаются
+        :param labels: метки серии
+        :return: контекстный менеджер; если метрики выключены – пустой
+        """
+        if not self.enabled:
+            return self.null_timer
+        return Timer(self, name, errors, labels)
+
+    def time_function(self, func: Callable, name: str, errors: str | None = None, **labels: Any) -> Callable:
+        """
+        Оборачивает функцию (в том числе асинхронную), чтобы время каждого вызова записывалось в гистограмму.
+        Сигнатура сохраняется, поэтому обёртку можно подставить вместо обработчика бота
+        :param func: функция
+        :param name: название гистограммы
+        :param errors: название счётчика ошибок; ``None`` – ошибки не считаются
+        :param labels: метки серии
+        :return: обёрнутая функция
+        """
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_coroutine(*args, **kwargs) -> Any:
+                with self.timer(name, errors, **labels):
+                    return await func(*args, **kwargs)
+            return timed_coroutine
+
+        @functools.wraps(func)
+        def timed_function(*args, **kwargs) -> Any:
+            with self.timer(name, errors, **labels):
+                return func(*args, **kwargs)
+        return timed_function
+
+    def add_gauge(self, name: str, func: Callable[[], float | Dict[str, float]],
+                  label: str | None = None, kind: str = 'gauge') -> None:
+        """
+        Добавляет показатель, который вычисляется при каждом запросе метрик
+        :param name: название показателя
+        :param func: функция, возвращающая значение или словарь, где ключ – значение метки ``label``, значение – значение
+        :param label: имя метки, если функция возвращает словарь
+        :param kind: тип метрики: ``gauge`` или ``counter`` (например, для накопленных счётчиков уборки)
+        """
+        self.gauges[name] = (func, label, kind)
+
+    def take(self) -> Dict | None:
+        """
+        Забирает накопленные гистограммы и счётчики, обнуляя их. Используется в процессах отрисовки
+        :return: словарь с гистограммами (``histograms``) и счётчиками (``counters``); ``None``, если метрики выключены
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            snapshot = {'histograms': self.histograms, 'counters': self.counters}
+            self.histograms, self.counters = dict(), dict()
+        return snapshot
+
+    def merge(self, snapshot: Dict | None) -> None:
+        """
+        Добавляет замеры, которые вернул ``take()`` в другом процессе
+        :param snapshot: результат ``take()``
+        """
+        if snapshot is None or not self.enabled:
+            return
+        with self.lock:
+            for name, histogram in snapshot['histograms'].items():
+                for key, values in histogram.items():
+                    series = self.histograms.setdefault(name, dict()).setdefault(key, [0] * len(values))
+                    for i, value in enumerate(values):
+                        series[i] += value
+            for name, counter in snapshot['counters'].items():
+                series = self.counters.setdefault(name, dict())
+                for key, value in counter.items():
+                    series[key] = series.get(key, 0) + value
+
+    def render(self) -> str:
+        """
+        Формирует метрики в текстовом формате Prometheus
+        :return: текст метрик
+        """
+        lines = list()
+        with self.lock:
+            histograms = {name: {key: list(values) for key, values in histogram.items()}
+                          for name, histogram in self.histograms.items()}
+            counters = {name: dict(counter) for name, counter in self.counters.items()}
+
+        for name, histogram in sorted(histograms.items()):
+            full_name = self.prefix + name
+            lines.append(f'# TYPE {full_name} histogram')
+            for key, values in sorted(histogram.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), values):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                    lines.append(f'{full_name}_bucket{format_labels(key, le)} {cumulative}')
+                lines.append(f'{full_name}_sum{format_labels(key)} {values[-1]}')
+                lines.append(f'{full_name}_count{format_labels(key)} {cumulative}')
+
+        for name, counter in sorted(counters.items()):
+            full_name = f'{self.prefix}{name}_total'
+            lines.append(f'# TYPE {full_name} counter')
+            lines.extend(f'{full_name}{format_labels(key)} {value}' for key, value in sorted(counter.items()))
+
+        for name, (func, label, kind) in sorted(self.gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                logging.exception(f'Метрики: не удалось вычислить {name}')
+                continue
+            full_name = self.prefix + name + ('_total' if kind == 'counter' else '')
+            lines.append(f'# TYPE {full_name} {kind}')
+            if label is None:
+                lines.append(f'{full_name} {value}')
+            else:
+                lines.extend(f'{full_name}{format_labels(((label, str(key)),))} {item}'
+                             for key, item in sorted(value.items()))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Отдаёт метрики по GET-запросу
+    """
+    server: 'MetricsHTTPServer'
+
+    def do_GET(self) -> None:
+        """
+        Обрабатывает GET-запрос метрик
+        """
+        if self.path != self.server.path:
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f'Метрики: {self.address_string()} {format % args}')
+
+
+class MetricsHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP-сервер, у которого есть ссылка на метрики
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], metrics: Metrics, path: str) -> None:
+        self.metrics = metrics
+        self.path = path
+        super().__init__(address, MetricsRequestHandler)
+
+
+class MetricsServer:
+    """
+    Локальный HTTP-сервер метрик, работает в отдельном потоке
+    """
+
+    def __init__(self, metrics: Metrics, host: str, port: int, path: str) -> None:
+        """
+        :param metrics: метрики
+        :param host: адрес, на котором слушает сервер
+        :param port: порт
+        :param path: путь, по которому отдаются метрики
+        """
+        self.http_server = MetricsHTTPServer((host, port), metrics, path)
+        self.thread = threading.Thread(target=self.http_server.serve_forever, name='Metrics', daemon=True)
+
+    def start(self) -> None:
+        """
+        Запускает сервер
+        """
+        self.thread.start()
+        host, port = self.http_server.server_address[:2]
+        logging.info(f'Метрики: сервер слушает {host}:{port}{self.http_server.path}')
+
+    def shutdown(self) -> None:
+        """
+        Останавливает сервер
+        """
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+
+METRICS: Metrics = Metrics(METRICS_BUCKETS, METRICS_PREFIX)
@@ -0,0 +1,180 @@
+"""
+photo.py
+"""
+import threading
+from PIL import Image, ImageStat
+from static import *
+from util import rgb_to_hex
+from metrics import METRICS
+
+
+prepared_photos: Dict[str, Dict] = dict()
+# ключ – путь к фотографии, значение – исходный размер и уменьшенные копии фотографии
+photo_analyses: Dict[str, Dict] = dict()
+# ключ – путь к фотографии, значение – результаты анализа фотографии
+prepared_photos_lock: threading.Lock = threading.Lock()
+
+
+class PhotoTooLargeError(Exception):
+    """
+    Фотография превышает допустимое количество пикселей и не может быть уменьшена при декодировании
+    """
+
+
+class PhotoAspectRatioError(Exception):
+    """
+    Фотография слишком вытянута по ширине или по высоте, чтобы разместить её в зоне фото
+    """
+
+
+def open_photo(photo_path: str) -> Image.Image:
+    """
+    Открывает фотографию без декодирования: читается только заголовок с размером и форматом
+    :param photo_path: путь к фотографии
+    :return: открытая фотография
+    """
+    try:
+        return Image.open(photo_path)
+    except Image.DecompressionBombError as error:
+        raise PhotoTooLargeError(str(error)) from error
+
+
+def reduce_photo(photo: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Декодирует открытую фотографию сразу в наименьший размер, который не меньше заданного:
+    jpeg – в режиме draft (масштабирование при декодировании), затем ``Image.reduce()``.\n
+    Проверяет количество пикселей до декодирования
+    :param photo: фотография, открытая ``open_photo()``
+    :param size: размер, не меньше которого должна быть фотография (каждая сторона – не меньше 1 пикселя)
+    :return: уменьшенная фотография
+    """
+    size = (max(1, size[0]), max(1, size[1]))
+    photo.draft(photo.mode, size)
+    width, height = photo.size
+    if width * height > PHOTO_MAX_PIXELS:
+        raise PhotoTooLargeError(f'{width}x{height} больше {PHOTO_MAX_PIXELS} пикселей')
+
+    factor = min(width // size[0], height // size[1])
+    if factor > 1:
+        photo = photo.reduce(factor)
+    return photo
+
+
+def prepare_photo(photo_path: str) -> Dict:
+    """
+    Открывает фотографию и уменьшает её до высоты зоны фото.
+    Результат сохраняется, чтобы не декодировать оригинал при каждой отрисовке
+    :param photo_path: путь к фотографии
+    :return: словарь с исходным размером (``size``) и уменьшенными копиями по высоте (``scaled``)
+    """
+    photo = open_photo(photo_path)
+    width, height = photo.size
+    if max(width / height, height / width) > PHOTO_MAX_ASPECT_RATIO:
+        raise PhotoAspectRatioError(f'{width}x{height}: соотношение сторон больше {PHOTO_MAX_ASPECT_RATIO}')
+    scaled_size = (max(1, int(width * (PHOTO_HEIGHT / height))), PHOTO_HEIGHT)
+    photo = reduce_photo(photo, scaled_size)
+    prepared_photo = {
+        'size':   (width, height),
+        'scaled': {PHOTO_HEIGHT: photo.resize(scaled_size)},
+    }
+    with prepared_photos_lock:
+        prepared_photos[photo_path] = prepared_photo
+    return prepared_photo
+
+
+def get_prepared_photo(photo_path: str) -> Dict:
+    """
+    Возвращает подготовленную фотографию, при необходимости подготавливает её
+    :param photo_path: путь к фотографии
+    :return: словарь с исходным размером (``size``) и уменьшенными копиями по высоте (``scaled``)
+    """
+    with prepared_photos_lock:
+        prepared_photo = prepared_photos.get(photo_path)
+    if prepared_photo is None:
+        with METRICS.timer('phase_seconds', phase='decode'):
+            prepared_photo = prepare_photo(photo_path)
+    return prepared_photo
+
+
+def get_scaled_photo(prepared_photo: Dict, height: int) -> Image.Image:
+    """
+    Возвращает копию фотографии заданной высоты, при необходимости уменьшает наибольшую из готовых копий.
+    Используется для превью, которые рисуются в уменьшенном масштабе
+    :param prepared_photo: подготовленная фотография
+    :param height: высота копии
+    :return: уменьшенная фотография
+    """
+    scaled = prepared_photo['scaled']
+    photo = scaled.get(height)
+    if photo is None:
+        width, original_height = prepared_photo['size']
+        source = scaled[max(scaled)]
+        photo = source.resize((max(1, int(width * (height / original_height))), height))
+        scaled[height] = photo
+    return photo
+
+
+def select_scaled_photo(prepared_photo: Dict, height: int) -> Dict:
+    """
+    Оставляет в подготовленной фотографии только копию нужной высоты, чтобы не передавать лишнее в процесс отрисовки
+    :param prepared_photo: подготовленная фотография
+    :param height: высота копии
+    :return: словарь в формате ``prepare_photo()`` с одной копией
+    """
+    return {'size': prepared_photo['size'], 'scaled': {height: get_scaled_photo(prepared_photo, height)}}
+
+
+def drop_prepared_photo(photo_path: str) -> None:
+    """
+    Удаляет подготовленную фотографию и результаты её анализа из памяти
+    :param photo_path: путь к фотографии
+    """
+    with prepared_photos_lock:
+        prepared_photos.pop(photo_path, None)
+        photo_analyses.pop(photo_path, None)
+
+
+def get_photo_analysis(photo_path: str) -> Dict:
+    """
+    Возвращает результаты анализа фотографии, при необходимости анализирует её.
+    Одна и та же фотография хранится один раз для всех чатов, поэтому и анализируется один раз
+    :param photo_path: путь к фотографии
+    :return: словарь с результатами анализа
+    """
+    with prepared_photos_lock:
+        photo_analysis = photo_analyses.get(photo_path)
+    if photo_analysis is None:
+        with METRICS.timer('phase_seconds', phase='analyse'):
+            photo_analysis = analyse_photo(photo_path)
+        with prepared_photos_lock:
+            photo_analyses[photo_path] = photo_analysis
+    return photo_analysis
+
+
+def analyse_photo(photo_path: str) -> Dict:
+    """
+    Анализирует фотографию по уменьшенной копии (jpeg декодируется сразу в уменьшенном виде):
+    средний цвет (уменьшение до одного пикселя), среднее арифметическое по каналам, статистика яркости и основные цвета.
+    Результат сохраняется в параметрах обложки, чтобы фон фото и градиент брали готовые значения
+    :param photo_path: путь к фотографии
+    :return: словарь с результатами анализа
+    """
+    photo = reduce_photo(open_photo(photo_path), (PHOTO_ANALYSIS_SIZE, PHOTO_ANALYSIS_SIZE)).convert('RGB')
+    photo.thumbnail((PHOTO_ANALYSIS_SIZE, PHOTO_ANALYSIS_SIZE))
+
+    stat = ImageStat.Stat(photo)
+    brightness_stat = ImageStat.Stat(photo.convert('L'))
+    quantized = photo.quantize(colors=PHOTO_PALETTE_SIZE)
+    palette = quantized.getpalette()
+    return {
+        'avg_rgb':    photo.resize((1, 1), Image.Resampling.LANCZOS).getpixel((0, 0)),
+        'mean_rgb':   tuple(round(value) for value in stat.mean),
+        'brightness': {
+            'mean':   round(brightness_stat.mean[0], 1),
+            'stddev': round(brightness_stat.stddev[0], 1),
+            'min':    brightness_stat.extrema[0][0],
+            'max':    brightness_stat.extrema[0][1],
+        },
+        'palette':    [rgb_to_hex(tuple(palette[i * 3:i * 3 + 3]))
+                       for _, i in sorted(quantized.getcolors(), reverse=True)],
+    }
@@ -0,0 +1,112 @@
+"""
+preview.py
+"""
+import io
+import logging
+import threading
+from collections import OrderedDict
+from static import *
+from compositor import PreviewCompositor
+from metrics import METRICS
+
+
+previews: OrderedDict[int, PreviewCompositor] = OrderedDict()
+# ключ – айди чата, значение – превью-изображение (порядок – от давно использованных к недавним)
+spilled_previews: Dict[int, Dict] = dict()
+# ключ – айди чата, значение – состояние превью, фоновый слой которого выгружен на диск
+previews_lock: threading.Lock = threading.Lock()
+
+
+def make_preview_path(chat_id: int) -> str:
+    """
+    Формирует путь к превью-изображению на диске
+    :param chat_id: айди чата
+    :return: путь к превью-изображению
+    """
+    return PATH_TO_SAVE + str(chat_id) + '_' + PREVIEW_PIC_POSTFIX
+
+
+def spill_previews() -> None:
+    """
+    Выгружает на диск давно использованные превью-изображения,
+    если их в памяти больше ``PREVIEW_CACHE_SIZE``. Вызывается под ``previews_lock``
+    """
+    if not PREVIEW_SPILL_TO_DISK:
+        return
+    while len(previews) > PREVIEW_CACHE_SIZE:
+        chat_id, compositor = previews.popitem(last=False)
+        spilled_previews[chat_id] = compositor.dump(make_preview_path(chat_id))
+
+
+def save_preview(chat_id: int, compositor: PreviewCompositor) -> None:
+    """
+    Сохраняет превью-изображение в памяти
+    :param chat_id: айди чата
+    :param compositor: превью-изображение, собранное из слоёв
+    """
+    with previews_lock:
+        spilled_previews.pop(chat_id, None)
+        previews[chat_id] = compositor
+        previews.move_to_end(chat_id)
+        spill_previews()
+
+
+def rebuild_preview(chat_id: int) -> None:
+    """
+    Заново рисует превью-изображение по параметрам обложки, вместе с прямоугольниками.
+    Нужно, когда превью нет ни в памяти, ни на диске: состояния чатов восстанавливаются после перезапуска бота,
+    а превью – нет
+    :param chat_id: айди чата
+    """
+    from state import covers_info  # state и render импортируют этот модуль
+    from render import RENDER
+    logging.warning(f'{chat_id} Превью-изображение не найдено, оно рисуется заново')
+    RENDER.create_preview_pic(covers_info[chat_id], chat_id, drawn_corners=True)
+
+
+def get_preview(chat_id: int) -> PreviewCompositor:
+    """
+    Возвращает превью-изображение для редактирования на месте.\n
+    Если фоновый слой был выгружен на диск, загружает его обратно в память;
+    если превью нет (например, после перезапуска бота), рисует его заново
+    :param chat_id: айди чата
+    :return: превью-изображение, собранное из слоёв
+    """
+    with previews_lock:
+        if chat_id in previews:
+            previews.move_to_end(chat_id)
+            return previews[chat_id]
+        state = spilled_previews.pop(chat_id, None)
+        if state is not None:
+            compositor = PreviewCompositor.restore(make_preview_path(chat_id), state)
+            previews[chat_id] = compositor
+            spill_previews()
+            return compositor
+    rebuild_preview(chat_id)
+    return get_preview(chat_id)
+
+
+def get_preview_png(chat_id: int) -> bytes:
+    """
+    Кодирует превью-изображение в png без записи на диск
+    :param chat_id: айди чата
+    :return: байты png-файла, готовые к отправке
+    """
+    buffer = io.BytesIO()
+    compositor = get_preview(chat_id)
+    with METRICS.timer('phase_seconds', phase='encode_preview_png'):
+        compositor.image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def drop_preview(chat_id: int) -> None:
+    """
+    Удаляет превью-изображение из памяти и с диска
+    :param chat_id: айди чата
+    """
+    with previews_lock:
+        previews.pop(chat_id, None)
+        spilled_previews.pop(chat_id, None)
+    preview_pic_path = make_preview_path(chat_id)
+    if os.path.exists(preview_pic_path):
+        os.remove(preview_pic_path)
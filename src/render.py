@@ -0,0 +1,207 @@
+"""
+render.py
+"""
+import io
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+from PIL import Image
+from static import *
+from fonts import get_title_font, get_info_font
+from photo import get_prepared_photo, select_scaled_photo, prepared_photos, prepared_photos_lock
+from geometry import FULL_GEOMETRY, PREVIEW_GEOMETRY
+from drawing import draw_preview_base, draw_cover, save_preview_pic
+from util import pack_cover_info, unpack_cover_info
+from metrics import METRICS
+
+
+def init_render_worker() -> None:
+    """
+    Подготавливает процесс отрисовки: заранее загружает шрифты обоих масштабов
+    """
+    for geometry in (FULL_GEOMETRY, PREVIEW_GEOMETRY):
+        get_title_font(geometry.title_font_size)
+        get_info_font(geometry.info_font_size)
+
+
+def init_render_process() -> None:
+    """
+    Подготавливает процесс пула отрисовки: отбрасывает замеры, скопированные из основного процесса при запуске,
+    и загружает шрифты
+    """
+    METRICS.take()
+    init_render_worker()
+
+
+def encode_png(image: Image.Image) -> bytes:
+    """
+    Кодирует изображение в png
+    :param image: изображение
+    :return: байты png-файла
+    """
+    buffer = io.BytesIO()
+    with METRICS.timer('phase_seconds', phase='encode_png'):
+        image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def run_in_worker(draw: Callable[[Dict], Image.Image], packed: Dict, prepared_photo: Dict) -> Image.Image:
+    """
+    Рисует изображение в процессе отрисовки.
+    Подготовленная фотография передаётся вместе с задачей и удаляется после отрисовки,
+    поэтому процесс не хранит фотографии и не использует устаревшие
+    :param draw: функция отрисовки
+    :param packed: параметры обложки, подготовленные ``pack_cover_info()``
+    :param prepared_photo: подготовленная фотография
+    :return: изображение
+    """
+    cover_info = unpack_cover_info(packed)
+    photo_path = cover_info['photo']
+    with prepared_photos_lock:
+        prepared_photos[photo_path] = prepared_photo
+    try:
+        return draw(cover_info)
+    finally:
+        with prepared_photos_lock:
+            prepared_photos.pop(photo_path, None)
+
+
+def render_preview_base(packed: Dict, prepared_photo: Dict) -> Tuple[Tuple[str, Tuple[int, int], bytes], Dict | None]:
+    """
+    Задача процесса отрисовки: фоновый слой превью-изображения в масштабе ``PREVIEW_MULTIPLIER``.
+    Слой возвращается без сжатия, потому что дальше он собирается в превью в основном процессе
+    :param packed: параметры обложки, подготовленные ``pack_cover_info()``
+    :param prepared_photo: подготовленная фотография с копией высоты фото превью
+    :return: режим, размер и пиксели изображения (аргументы ``Image.frombytes()``) и замеры процесса (``METRICS.take()``)
+    """
+    image = run_in_worker(draw_preview_base, packed, prepared_photo)
+    return (image.mode, image.size, image.tobytes()), METRICS.take()
+
+
+def render_cover_png(packed: Dict, prepared_photo: Dict) -> Tuple[bytes, Dict | None]:
+    """
+    Задача процесса отрисовки: итоговая обложка в png
+    :param packed: параметры обложки, подготовленные ``pack_cover_info()``
+    :param prepared_photo: подготовленная фотография с копией высоты фото итоговой обложки
+    :return: байты png-файла и замеры процесса (``METRICS.take()``)
+    """
+    return encode_png(run_in_worker(draw_cover, packed, prepared_photo)), METRICS.take()
+
+
+class RenderBackend:
+    """
+    Отрисовка обложек в пуле процессов.\n
+    Процессы создаются копированием основного процесса (fork) до создания клиента бота и запуска потоков
+    и заранее загружают шрифты.
+    Количество задач в пуле ограничено; если место в очереди не освободилось за отведённое время,
+    пул не запущен или сломался, изображение рисуется в потоке обработчика
+    """
+
+    def __init__(self, workers: int, queue_size: int, queue_timeout: float) -> None:
+        """
+        :param workers: количество процессов отрисовки; 0 – рисовать в потоке обработчика
+        :param queue_size: сколько задач может одновременно ждать или выполняться в пуле
+        :param queue_timeout: сколько секунд ждать места в очереди
+        """
+        self.workers = workers
+        self.queue = threading.BoundedSemaphore(max(queue_size, 1))
+        self.queue_timeout = queue_timeout
+        self.executor: ProcessPoolExecutor | None = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Запускает процессы отрисовки.
+        Вызывается из основного потока до создания клиента бота (он запускает пул потоков), сервера метрик
+        и фоновых потоков: копировать процесс, в котором работают другие потоки, небезопасно
+        """
+        if self.workers <= 0:
+            return
+        if threading.active_count() > 1:
+            logging.warning(f'Процессы отрисовки запускаются при {threading.active_count()} потоках, '
+                            f'копирование процесса может привести к взаимной блокировке')
+        with self.lock:
+            if self.executor is not None:
+                return
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('fork'),
+                                                initializer=init_render_process)
+            futures = [self.executor.submit(init_render_worker) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        logging.info(f'Запущено процессов отрисовки: {self.workers}')
+
+    def shutdown(self) -> None:
+        """
+        Останавливает процессы отрисовки
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def submit(self, job: Callable, *args) -> Any | None:
+        """
+        Выполняет задачу в пуле и ждёт результат. Замеры, которые задача вернула вместе с результатом,
+        добавляются к метрикам основного процесса
+        :param job: функция задачи
+        :param args: аргументы задачи
+        :return: результат задачи; ``None``, если задачу нужно выполнить в потоке обработчика
+        """
+        executor = self.executor
+        if executor is None:
+            return None
+        started = time.perf_counter()
+        if not self.queue.acquire(timeout=self.queue_timeout):
+            logging.warning('Очередь отрисовки заполнена, изображение рисуется в потоке обработчика')
+            METRICS.inc('render_fallbacks', reason='queue_full')
+            return None
+        try:
+            METRICS.observe('phase_seconds', time.perf_counter() - started, phase='render_queue')
+            with METRICS.timer('phase_seconds', phase='render_pool'):
+                result, snapshot = executor.submit(job, *args).result()
+            METRICS.merge(snapshot)
+            return result
+        except BrokenProcessPool:
+            logging.exception('Пул процессов отрисовки сломался, дальше изображения рисуются в потоках обработчиков')
+            METRICS.inc('render_fallbacks', reason='broken_pool')
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            return None
+        finally:
+            self.queue.release()
+
+    def create_preview_pic(self, cover_info: Dict, chat_id: int, drawn_corners: bool = False) -> None:
+        """
+        «Собирает» превью-изображение в масштабе ``PREVIEW_MULTIPLIER``: фоновый слой рисуется в пуле.
+        В процесс передаётся только копия фотографии нужной высоты
+        :param cover_info: параметры обложки
+        :param chat_id: айди чата (для сохранения картинки в хранилище превью)
+        :param drawn_corners: если истинно, рисует прямоугольники
+        """
+        result = self.submit(render_preview_base,
+                             pack_cover_info(cover_info),
+                             select_scaled_photo(get_prepared_photo(cover_info['photo']),
+                                                 PREVIEW_GEOMETRY.photo_height))
+        base = Image.frombytes(*result) if result is not None else draw_preview_base(cover_info)
+        save_preview_pic(base, cover_info, chat_id, drawn_corners)
+
+    def create_pic(self, cover_info: Dict) -> bytes:
+        """
+        «Собирает» итоговую обложку в пуле
+        :param cover_info: параметры обложки
+        :return: байты png-файла
+        """
+        result = self.submit(render_cover_png,
+                             pack_cover_info(cover_info),
+                             select_scaled_photo(get_prepared_photo(cover_info['photo']),
+                                                 FULL_GEOMETRY.photo_height))
+        return result if result is not None else encode_png(draw_cover(cover_info))
+
+
+RENDER: RenderBackend = RenderBackend(RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_QUEUE_TIMEOUT)
@@ -0,0 +1,270 @@
+"""
+session.py
+"""
+import json
+import atexit
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+from static import *
+
+
+class SessionStore(ABC):
+    """
+    Хранилище состояний чатов. Состояние – строка json, которую готовит state.py.\n
+    Методы вызываются из одного потока записи, поэтому хранилищу не нужны свои блокировки
+    """
+
+    @abstractmethod
+    def load_all(self) -> Dict[int, str]:
+        """
+        Загружает состояния всех чатов
+        :return: словарь, где ключ – айди чата, значение – состояние
+        """
+
+    @abstractmethod
+    def write(self, sessions: Dict[int, str | None]) -> None:
+        """
+        Сохраняет пачку состояний
+        :param sessions: словарь, где ключ – айди чата, значение – состояние; ``None`` – удалить состояние
+        """
+
+    def close(self) -> None:
+        """
+        Закрывает хранилище
+        """
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Хранилище в памяти процесса: состояния не переживают перезапуск
+    """
+
+    def __init__(self) -> None:
+        self.sessions: Dict[int, str] = dict()
+        # ключ – айди чата, значение – состояние
+
+    def load_all(self) -> Dict[int, str]:
+        return dict(self.sessions)
+
+    def write(self, sessions: Dict[int, str | None]) -> None:
+        for chat_id, data in sessions.items():
+            if data is None:
+                self.sessions.pop(chat_id, None)
+            else:
+                self.sessions[chat_id] = data
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Хранилище в файле SQLite. Пачка состояний записывается одной транзакцией.
+    Файл открывается при первом обращении к хранилищу
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: путь к файлу базы данных
+        """
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Открывает базу данных, если она ещё не открыта
+        :return: соединение с базой данных
+        """
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                               'chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+            self.connection = connection
+        return self.connection
+
+    def load_all(self) -> Dict[int, str]:
+        return dict(self.connect().execute('SELECT chat_id, data FROM sessions'))
+
+    def write(self, sessions: Dict[int, str | None]) -> None:
+        connection = self.connect()
+        with connection:
+            connection.execute('BEGIN')
+            connection.executemany('INSERT OR REPLACE INTO sessions (chat_id, data) VALUES (?, ?)',
+                                   [(chat_id, data) for chat_id, data in sessions.items() if data is not None])
+            connection.executemany('DELETE FROM sessions WHERE chat_id = ?',
+                                   [(chat_id,) for chat_id, data in sessions.items() if data is None])
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+
+
+def make_session_store(kind: str, path: str) -> SessionStore:
+    """
+    Создаёт хранилище состояний
+    :param kind: тип хранилища: ``memory`` – в памяти, ``sqlite`` – в файле SQLite
+    :param path: путь к файлу базы данных (для ``sqlite``)
+    :return: хранилище
+    """
+    if kind == 'memory':
+        return MemorySessionStore()
+    if kind == 'sqlite':
+        return SQLiteSessionStore(path)
+    raise ValueError(f'Неизвестный тип хранилища состояний: {kind}')
+
+
+class SessionWriter:
+    """
+    Отложенная запись состояний чатов (write-behind).\n
+    Обработчик только кладёт готовое состояние в словарь ожидающих записи; если чат изменился несколько раз
+    до записи, записывается последнее состояние. Отдельный поток раз в ``flush_interval`` секунд
+    (или когда ожидающих записи не меньше ``batch_size``) записывает их в хранилище одной пачкой
+    """
+
+    def __init__(self, store: SessionStore, flush_interval: float = SESSION_FLUSH_INTERVAL,
+                 batch_size: int = SESSION_BATCH_SIZE) -> None:
+        """
+        :param store: хранилище состояний
+        :param flush_interval: сколько секунд состояние может ждать записи
+        :param batch_size: сколько ожидающих записи состояний вызывают запись сразу
+        """
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending: Dict[int, str | None] = dict()
+        # ключ – айди чата, значение – состояние, ожидающее записи; ``None`` – удалить состояние
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='SessionWriter', daemon=True)
+
+    def start(self) -> None:
+        """
+        Запускает поток записи. До запуска состояния только накапливаются
+        """
+        if not self.thread.is_alive():
+            self.thread.start()
+
+    def put(self, chat_id: int, data: str | None) -> None:
+        """
+        Ставит состояние чата в очередь на запись
+        :param chat_id: айди чата
+        :param data: состояние; ``None`` – удалить состояние
+        """
+        with self.lock:
+            self.pending[chat_id] = data
+            if len(self.pending) >= self.batch_size:
+                self.wakeup.set()
+
+    def flush(self) -> None:
+        """
+        Записывает все ожидающие состояния
+        """
+        with self.write_lock:
+            with self.lock:
+                pending, self.pending = self.pending, dict()
+            if not pending:
+                return
+            try:
+                self.store.write(pending)
+            except Exception:
+                logging.exception(f'Не удалось записать состояния чатов: {len(pending)}')
+                with self.lock:
+                    self.pending = pending | self.pending
+
+    def run(self) -> None:
+        """
+        Записывает ожидающие состояния, пока запись не остановлена
+        """
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """
+        Записывает ожидающие состояния, останавливает поток записи и закрывает хранилище
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush()
+        self.store.close()
+
+
+def encode_next_steps(next_steps: List[Tuple[Callable, Tuple]]) -> List:
+    """
+    Готовит обработчики следующего сообщения к сохранению: функции заменяются на их имена
+    :param next_steps: обработчики и их аргументы
+    :return: список ``[имя обработчика, аргументы]``, где аргументы-функции записаны как ``{'handler': имя}``
+    """
+    return [[callback.__name__, [{'handler': arg.__name__} if callable(arg) else arg for arg in args]]
+            for callback, args in next_steps]
+
+
+def decode_next_steps(encoded: List, handlers: Dict[str, Callable]) -> List[Tuple[Callable, Tuple]]:
+    """
+    Восстанавливает обработчики следующего сообщения, сохранённые ``encode_next_steps()``
+    :param encoded: сохранённые обработчики
+    :param handlers: словарь, где ключ – имя обработчика, значение – функция
+    :return: обработчики и их аргументы
+    """
+    return [(handlers[name], tuple(handlers[arg['handler']] if isinstance(arg, dict) else arg for arg in args))
+            for name, args in encoded]
+
+
+def dump_session(packed_cover_info: Dict, ids_to_delete: List[int], next_steps: List) -> str:
+    """
+    Сериализует состояние чата
+    :param packed_cover_info: параметры обложки, подготовленные ``pack_cover_info()``
+    :param ids_to_delete: айди сообщений для удаления
+    :param next_steps: обработчики следующего сообщения, подготовленные ``encode_next_steps()``
+    :return: строка json
+    """
+    return json.dumps({'cover_info':    packed_cover_info,
+                       'ids_to_delete': ids_to_delete,
+                       'next_steps':    next_steps},
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+def load_session(data: str) -> Dict:
+    """
+    Разбирает состояние чата, сохранённое ``dump_session()``.
+    Значения, которые json превратил в списки (шрифты, координаты и цвета надписей, цвета фотографии),
+    снова становятся кортежами, как в ``pack_cover_info()``
+    :param data: строка json
+    :return: словарь с ключами ``cover_info``, ``ids_to_delete``, ``next_steps``
+    """
+    session = json.loads(data)
+    cover_info = session['cover_info']
+    for key in ('upper_title_params', 'lower_title_params'):
+        params = cover_info.get(key)
+        if params and 'font' in params:
+            size, axes = params['font']
+            params['font'] = (size, tuple(axes) if axes is not None else None)
+        if params:
+            restore_tuples(params, ('xy', 'fill'))
+    if cover_info.get('photo_analysis'):
+        restore_tuples(cover_info['photo_analysis'], ('avg_rgb', 'mean_rgb'))
+    return session
+
+
+def restore_tuples(values: Dict, keys: Tuple[str, ...]) -> None:
+    """
+    Превращает списки по заданным ключам обратно в кортежи
+    :param values: словарь, который меняется на месте
+    :param keys: ключи
+    """
+    for key in keys:
+        if isinstance(values.get(key), list):
+            values[key] = tuple(values[key])
+
+
+SESSIONS: SessionWriter = SessionWriter(make_session_store(SESSION_STORE, SESSION_DB_PATH))
+atexit.register(SESSIONS.close)
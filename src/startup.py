@@ -0,0 +1,54 @@
+"""
+startup.py
+"""
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class Startup:
+    """
+    Замер времени запуска бота по этапам.\n
+    Отсчёт начинается с импорта модуля, поэтому первым этапом записывается импорт модулей бота
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.stages: Dict[str, float] = dict()
+        # ключ – название этапа, значение – сколько секунд он занял
+
+    def mark(self, name: str) -> None:
+        """
+        Записывает этап, который длился с конца предыдущего этапа
+        :param name: название этапа
+        """
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0) + now - self.last
+        self.last = now
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Замеряет этап запуска
+        :param name: название этапа
+        """
+        self.mark('прочее')
+        try:
+            yield
+        finally:
+            self.mark(name)
+
+    def log(self) -> None:
+        """
+        Записывает в лог время этапов и общее время запуска
+        """
+        self.mark('прочее')
+        if self.stages['прочее'] < 0.001:
+            del self.stages['прочее']
+        stages = ', '.join(f'{name} – {seconds:.3f} с' for name, seconds in self.stages.items())
+        logging.info(f'Бот запущен за {self.last - self.started:.3f} с: {stages}')
+
+
+STARTUP: Startup = Startup()
@@ -0,0 +1,190 @@
+"""
+state.py
+"""
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+from static import *
+from storage import PHOTOS
+from preview import drop_preview
+from util import pack_cover_info, unpack_cover_info
+from session import SESSIONS, dump_session, load_session, encode_next_steps, decode_next_steps
+
+
+color2hex: Dict[str, str] = {
+    '🟦 Голубой':    '#94FCFF',
+    '🟩 Зелёный':    '#73E153',
+    '🟧 Оранжевый':  '#F06C00',
+    '🟨 Жёлтый':     '#FFFA00',
+    '🟥 Красный':    '#D9003A',
+    '💖 Розовый':    '#E04BCE',
+    '🟪 Фиолетовый': '#5E00A2',
+}
+# общий для всех чатов, поэтому меняется и читается только через add_color() и get_colors()
+color2hex_lock: threading.Lock = threading.Lock()
+ids_to_delete: Dict[int, List[int]] = dict()
+# ключ – айди чата, значение – список с айди сообщений
+covers_info: Dict[int, Dict[str, str | bool | int | List | Dict]] = dict()
+# ключ – айди чата, значение – словарь с параметрами обложки
+last_activity: OrderedDict[int, float] = OrderedDict()
+# ключ – айди чата, значение – время последнего обновления (time.monotonic()); от давно активных к недавно активным
+last_activity_lock: threading.Lock = threading.Lock()
+
+
+def add_color(color: str) -> None:
+    """
+    Добавляет свободный цвет в список цветов для выбора
+    :param color: цветовое значение HEX
+    """
+    with color2hex_lock:
+        color2hex[color] = color
+
+
+def get_colors() -> Dict[str, str]:
+    """
+    Возвращает копию списка цветов для выбора
+    :return: словарь, где ключ – название цвета, значение – HEX-код
+    """
+    with color2hex_lock:
+        return dict(color2hex)
+
+
+def make_result_pic_path(chat_id: int) -> str:
+    """
+    Создаёт путь к итоговой картинке чата
+    :param chat_id: айди чата
+    :return: путь к итоговой картинке
+    """
+    return PATH_TO_SAVE + str(chat_id) + '_' + RESULT_PIC_POSTFIX
+
+
+def remove_chat_files(chat_id: int) -> None:
+    """
+    Освобождает фотографию чата, удаляет итоговую обложку и превью чата с диска и из памяти
+    :param chat_id: айди чата
+    """
+    PHOTOS.release(chat_id)
+    result_pic_path = make_result_pic_path(chat_id)
+    if os.path.exists(result_pic_path):
+        os.remove(result_pic_path)
+        logging.warning(f'{chat_id} Удалён файл: {result_pic_path}')
+    drop_preview(chat_id)
+
+
+def reset_all_info(chat_id: int) -> None:
+    """
+    «Сбрасывает» информацию об обложке, айди для удаления,
+    расположение прямоугольников; удаляет изображения
+    """
+    global covers_info, ids_to_delete
+    ids_to_delete[chat_id] = list()
+    logging.warning(f'{chat_id} Сборшена информация об айди для удаления: {ids_to_delete[chat_id]}')
+    remove_chat_files(chat_id)
+    covers_info[chat_id] = copy.deepcopy(COVER_BASE_INFO)
+    logging.warning(f'{chat_id} Сброшена информация об обложке: {covers_info[chat_id]}')
+
+
+def save_session(chat_id: int, next_steps: List[Tuple[Callable, Tuple]]) -> None:
+    """
+    Сохраняет состояние чата: параметры обложки (шрифты – в виде размера и значений осей),
+    айди сообщений для удаления и обработчики следующего сообщения.
+    Сериализация выполняется сразу, запись в хранилище – в потоке записи
+    :param chat_id: айди чата
+    :param next_steps: обработчики следующего сообщения и их аргументы
+    """
+    cover_info = covers_info.get(chat_id)
+    if cover_info is None:
+        return
+    touch_session(chat_id)
+    SESSIONS.put(chat_id, dump_session(pack_cover_info(cover_info),
+                                       list(ids_to_delete.get(chat_id, list())),
+                                       encode_next_steps(next_steps)))
+
+
+def load_sessions(handlers: Dict[str, Callable]) -> Dict[int, List[Tuple[Callable, Tuple]]]:
+    """
+    Восстанавливает состояния чатов из хранилища, вызывается при запуске бота
+    :param handlers: словарь, где ключ – имя обработчика следующего сообщения, значение – функция
+    :return: словарь, где ключ – айди чата, значение – обработчики следующего сообщения и их аргументы
+    """
+    next_steps = dict()
+    for chat_id, data in SESSIONS.store.load_all().items():
+        try:
+            session = load_session(data)
+            cover_info = copy.deepcopy(COVER_BASE_INFO) | unpack_cover_info(session['cover_info'])
+            chat_ids_to_delete = list(session['ids_to_delete'])
+            chat_next_steps = decode_next_steps(session['next_steps'], handlers)
+        except (ValueError, KeyError, TypeError):
+            logging.exception(f'{chat_id} Не удалось восстановить состояние чата')
+            continue
+        # состояние разобрано целиком, только теперь оно становится состоянием чата
+        covers_info[chat_id] = cover_info
+        ids_to_delete[chat_id] = chat_ids_to_delete
+        if os.path.exists(photo_path := cover_info['photo']):
+            PHOTOS.acquire(chat_id, photo_path)
+        next_steps[chat_id] = chat_next_steps
+        touch_session(chat_id)
+    logging.info(f'Восстановлены состояния чатов: {len(covers_info)}')
+    return next_steps
+
+
+def touch_session(chat_id: int) -> None:
+    """
+    Отмечает, что чат был активен только что
+    :param chat_id: айди чата
+    """
+    with last_activity_lock:
+        last_activity[chat_id] = time.monotonic()
+        last_activity.move_to_end(chat_id)
+
+
+def get_last_activity(chat_id: int) -> float | None:
+    """
+    Возвращает время последнего обновления чата
+    :param chat_id: айди чата
+    :return: время (``time.monotonic()``); ``None``, если состояние чата не хранится
+    """
+    with last_activity_lock:
+        return last_activity.get(chat_id)
+
+
+def find_sessions_to_evict(ttl: float, max_sessions: int, is_active: Callable[[int], bool]) -> Tuple[List[int], List[int]]:
+    """
+    Находит чаты, состояние которых пора удалить: неактивные дольше ``ttl`` секунд
+    и давно активные, если чатов больше ``max_sessions``. Чаты, обновления которых обрабатываются, не трогаются
+    :param ttl: сколько секунд хранить состояние неактивного чата
+    :param max_sessions: сколько чатов хранить
+    :param is_active: функция, определяющая, обрабатывается ли сейчас обновление чата
+    :return: чаты, удаляемые по ``ttl``, и чаты, удаляемые по ``max_sessions``
+    """
+    deadline = time.monotonic() - ttl
+    expired, overflow = list(), list()
+    with last_activity_lock:
+        excess = len(last_activity) - max_sessions
+        for chat_id, activity in last_activity.items():
+            if activity >= deadline and excess <= 0:
+                break
+            if is_active(chat_id):
+                continue
+            if activity < deadline:
+                expired.append(chat_id)
+            else:
+                overflow.append(chat_id)
+            excess -= 1
+    return expired, overflow
+
+
+def evict_session(chat_id: int) -> None:
+    """
+    Удаляет состояние чата из памяти и хранилища вместе с файлами чата
+    :param chat_id: айди чата
+    """
+    remove_chat_files(chat_id)
+    covers_info.pop(chat_id, None)
+    ids_to_delete.pop(chat_id, None)
+    with last_activity_lock:
+        last_activity.pop(chat_id, None)
+    SESSIONS.put(chat_id, None)
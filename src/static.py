@@ -2,17 +2,38 @@
 static.py
 """
 import os
-import telebot
-from PIL import ImageFont
 from typing import Dict, Tuple, List
 
 
-BOT: telebot.TeleBot = telebot.TeleBot(token=open('./token.txt', 'r', encoding='utf-8').read())
+TOKEN_PATH: str = './token.txt'
+BOT_THREADS: int = 16  # сколько потоков обрабатывают обновления (обновления одного чата – по очереди)
+WEBHOOK_ENABLED: bool = False  # принимать обновления через webhook вместо long polling
+WEBHOOK_URL: str | None = None  # внешний адрес webhook для set_webhook(); None – не регистрировать (например, для тестов)
+WEBHOOK_HOST: str = '127.0.0.1'
+WEBHOOK_PORT: int = 8443
+WEBHOOK_PATH: str = '/telegram'
+WEBHOOK_SECRET_TOKEN: str | None = os.environ.get('WEBHOOK_SECRET_TOKEN')  # обязателен в режиме webhook
+WEBHOOK_MAX_CONNECTIONS: int = 40   # сколько одновременных запросов присылает Telegram
+WEBHOOK_QUEUE_SIZE: int = 1000      # сколько обновлений может ждать или обрабатываться, дальше сервер отвечает 503
+WEBHOOK_MAX_BODY_SIZE: int = 1 << 20
+METRICS_ENABLED: bool = False  # собирать метрики и отдавать их по HTTP в формате Prometheus
+METRICS_HOST: str = '127.0.0.1'
+METRICS_PORT: int = 9108
+METRICS_PATH: str = '/metrics'
+METRICS_PREFIX: str = 'hselive_'
+METRICS_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# верхние границы корзин гистограмм времени в секундах
 
 PATH_TO_SAVE: str = os.getcwd() + '/pictures/'
+PHOTO_STORAGE_PATH: str = PATH_TO_SAVE + 'photos/'  # фотографии, общие для всех чатов (имя файла – sha256 содержимого)
 FONT_URL: str = 'https://github.com/googlefonts/roboto-flex/releases/download/3.200/roboto-flex-fonts.zip'
-FONT_PATH: str = os.getcwd() +\
-  '/roboto-flex-fonts/fonts/variable/RobotoFlex[GRAD,XOPQ,XTRA,YOPQ,YTAS,YTDE,YTFI,YTLC,YTUC,opsz,slnt,wdth,wght].ttf'
+FONT_ARCHIVE_MEMBER: str = \
+  'roboto-flex-fonts/fonts/variable/RobotoFlex[GRAD,XOPQ,XTRA,YOPQ,YTAS,YTDE,YTFI,YTLC,YTUC,opsz,slnt,wdth,wght].ttf'
+FONT_PATH: str = os.getcwd() + '/' + FONT_ARCHIVE_MEMBER
+FONT_ASSETS_PATH: str = os.getcwd() + '/font-assets/'  # статические копии шрифта, которые собирает fontassets.py
+FONT_SUBSET_TEXT: str = ('ABCDEFGHIJKLMNOPQRSTUVWXYZАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ0123456789'
+                         ' !"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~«»„“”‘’–—…№©')
+# символы, которые остаются в статических копиях при сборке с --subset (заголовки переводятся в верхний регистр)
 
 LETTERS_WITH_DIACRITICS: Tuple[str, str] = ('Й', 'Ё')
 COPYRIGHT_TEXT: str = '©\nЛАЙВ\nРАБОТАЕТ'
@@ -29,10 +50,32 @@ COPYRIGHT_SIGN_PREFIX: str = 'copyright-sign'
 
 PREVIEW_PIC_POSTFIX: str = 'example.png'
 RESULT_PIC_POSTFIX: str = 'result.png'
+PREVIEW_CACHE_SIZE: int = 100       # сколько превью держать в памяти
+PREVIEW_SPILL_TO_DISK: bool = True  # выгружать ли лишние превью на диск (иначе все превью остаются в памяти)
+FILE_ID_CACHE_SIZE: int = 1024      # сколько file_id загруженных изображений помнить
+FILE_ID_ERRORS: Tuple[str, ...] = ('wrong file identifier', 'wrong remote file identifier', 'invalid file_id',
+                                   'file reference', 'file_reference')
+# части описаний ошибок Telegram (в нижнем регистре), при которых file_id не принят и файл загружается заново
+SESSION_STORE: str = 'sqlite'       # где хранить состояния чатов: 'sqlite' – в файле, 'memory' – только в памяти
+SESSION_DB_PATH: str = os.getcwd() + '/sessions.sqlite3'
+SESSION_FLUSH_INTERVAL: float = 1   # раз в сколько секунд записывать изменённые состояния чатов
+SESSION_BATCH_SIZE: int = 256       # сколько изменённых состояний записывать сразу, не дожидаясь интервала
+SESSION_TTL: float = 24 * 60 * 60   # через сколько секунд неактивности состояние чата и его файлы удаляются
+SESSION_MAX_COUNT: int = 10_000     # сколько чатов хранить; при превышении удаляются давно активные
+JANITOR_INTERVAL: float = 10 * 60   # раз в сколько секунд проводить уборку
+JANITOR_MAX_FILE_AGE: float = 24 * 60 * 60   # файлы в PATH_TO_SAVE старше этого удаляются, если чат не хранится
+JANITOR_MAX_DIR_SIZE: int = 2 * 1024 ** 3    # сколько байт могут занимать файлы в PATH_TO_SAVE
+RENDER_WORKERS: int = os.cpu_count() or 0  # количество процессов отрисовки; 0 – рисовать в потоке обработчика
+RENDER_QUEUE_SIZE: int = 32                # сколько задач отрисовки может одновременно ждать или выполняться в пуле
+RENDER_QUEUE_TIMEOUT: float = 10           # сколько секунд ждать места в очереди, затем рисовать в потоке обработчика
+ASYNC_DRAWING_WORKERS: int = 4             # сколько потоков рисуют и подбирают шрифты в асинхронном режиме
 
-MULTIPLIER: int = 2
-PIC_WIDTH: int = 1080 * MULTIPLIER
-PIC_HEIGHT: int = 720 * MULTIPLIER
+MULTIPLIER: int = 2                # масштаб итоговой обложки; константы ниже рассчитаны для него
+PREVIEW_MULTIPLIER: float = 1      # масштаб превью-изображений (см. geometry.py)
+PIC_BASE_WIDTH: int = 1080
+PIC_BASE_HEIGHT: int = 720
+PIC_WIDTH: int = PIC_BASE_WIDTH * MULTIPLIER
+PIC_HEIGHT: int = PIC_BASE_HEIGHT * MULTIPLIER
 PIC_SIZE: Tuple[int, int] = (PIC_WIDTH, PIC_HEIGHT)
 
 RECTANGLE_NUM: int = 6
@@ -44,6 +87,7 @@ COVER_BASE_INFO: Dict[str, str | bool | int | Dict | List] = {
     'photo':              '',
     'mask':               False,
     'photo_bg':           '',
+    'photo_analysis':     dict(),
     'upper_title_params': dict(),
     'upper_title':        '',
     'lower_title_params': dict(),
@@ -55,6 +99,13 @@ COVER_BASE_INFO: Dict[str, str | bool | int | Dict | List] = {
 PHOTO_WIDTH: int = int(PIC_WIDTH - RECTANGLE_WIDTH * 2)     # 720 if p_w=1080,r_w=180
 PHOTO_HEIGHT: int = int(PIC_HEIGHT - RECTANGLE_HEIGHT * 2)  # 480 if p_h=720,r_h=120
 PHOTO_SIZE: Tuple[int, int] = (PHOTO_WIDTH, PHOTO_HEIGHT)
+PHOTO_MAX_PIXELS: int = 50_000_000  # больше – фотография не принимается, если её нельзя уменьшить при декодировании
+PHOTO_MAX_ASPECT_RATIO: float = 10.0  # больше (по ширине или по высоте) – фотография не принимается
+PHOTO_MAX_FILE_SIZE: int = 20 * 1024 * 1024  # больше – файл не скачивается (Bot API отдаёт файлы до 20 МБ)
+DOWNLOAD_CHUNK_SIZE: int = 64 * 1024         # размер части, которыми фотография скачивается на диск
+PHOTO_ANALYSIS_SIZE: int = 256  # размер уменьшенной копии фотографии для анализа цветов
+PHOTO_PALETTE_SIZE: int = 5     # количество основных цветов фотографии
+GRADIENT_CACHE_SIZE: int = 64   # сколько градиентов для фона фото хранить в памяти
 
 UPPER_COORDS: Tuple[Tuple[int, int], Tuple[int, int]] = (
         (RECTANGLE_WIDTH, 0),
@@ -82,22 +133,19 @@ CORNER_COORDS: Dict[int, Tuple[int, int, int, int, int, int, int, int, int, int,
 
 TITLE_FONT_AXES: List[int] = [60, 800, 0, 60, 0, 96, 79, 468, 712, 570, 750, -203, 738]
 WIDTH_AXES_INDEX: int = 3
-TITLE_FONT_SIZE: int = int(76 * MULTIPLIER)
-TITLE_FONT_SIZE_PIXELS: int = int(54 * MULTIPLIER)
+TITLE_FONT_BASE_SIZE: int = 76
+TITLE_FONT_BASE_SIZE_PIXELS: int = 54
+TITLE_FONT_SIZE: int = int(TITLE_FONT_BASE_SIZE * MULTIPLIER)
+TITLE_FONT_SIZE_PIXELS: int = int(TITLE_FONT_BASE_SIZE_PIXELS * MULTIPLIER)
 
 INFO_FONT_AXES: List[int] = [8, 523, 0, 151, 0, 96, 79, 468, 712, 570, 750, -203, 738]
-INFO_FONT_SIZE: int = int(24 * MULTIPLIER)
-INFO_FONT_SIZE_PIXELS: int = int(17 * MULTIPLIER)
+INFO_FONT_BASE_SIZE: int = 24
+INFO_FONT_BASE_SIZE_PIXELS: int = 17
+INFO_FONT_SIZE: int = int(INFO_FONT_BASE_SIZE * MULTIPLIER)
+INFO_FONT_SIZE_PIXELS: int = int(INFO_FONT_BASE_SIZE_PIXELS * MULTIPLIER)
 
-TITLE_FONT: ImageFont.FreeTypeFont = ImageFont.truetype(
-    font=FONT_PATH,
-    size=TITLE_FONT_SIZE,
-    encoding='unic')
-TITLE_FONT.set_variation_by_axes(TITLE_FONT_AXES)
-MIN_WIDTH: int = TITLE_FONT.get_variation_axes()[WIDTH_AXES_INDEX]['minimum']
-
-INFO_FONT: ImageFont.FreeTypeFont = ImageFont.truetype(
-    font=FONT_PATH,
-    size=INFO_FONT_SIZE,
-    encoding='unic')
-INFO_FONT.set_variation_by_axes(INFO_FONT_AXES)
+FONT_CACHE_SIZE: int = 32              # сколько экземпляров шрифта хранить в кэше одного потока
+FONT_LAYOUT_ENGINE: str | None = None  # движок вёрстки текста: 'basic', 'raqm' или None (по умолчанию в Pillow)
+TITLE_LAYOUT_CACHE_SIZE: int = 1024    # сколько вёрсток заголовков хранить в памяти
+MEASURE_WIDTH_STEP: int = 5            # шаг оси ширины между таблицами ширин символов
+MEASURE_MARGIN: float = 0.03           # насколько близкая к пределу оценка ширины перепроверяется через FreeType
@@ -0,0 +1,738 @@
+"""
+steps.py
+"""
+import re
+import logging
+from telebot import types
+from random import randint
+from typing import Awaitable, Callable, Literal
+from static import *
+from util import pick_title_params, istoowide, define_fill
+from markup import (make_corner_type_markup,
+                    make_interface_markup,
+                    make_photo_bg_markup,
+                    make_color_markup)
+from bot import Handlers
+from drawing import redraw_rectangle
+from render import RENDER
+from transport import Transport
+from preview import get_preview, get_preview_png
+from photo import get_prepared_photo, get_photo_analysis, PhotoTooLargeError, PhotoAspectRatioError
+from storage import PHOTOS
+from download import check_photo_file_size, PhotoFileTooLargeError, PhotoFormatError
+from state import (ids_to_delete,
+                   covers_info,
+                   add_color,
+                   get_colors,
+                   make_result_pic_path,
+                   reset_all_info)
+
+
+BOT: Transport | None = None  # транспорт запущенного бота, задаётся при запуске (см. use_transport())
+HANDLERS: Handlers = Handlers()
+
+
+def use_transport(transport: Transport) -> None:
+    """
+    Задаёт транспорт, через который шаги общаются с клиентом бота; вызывается при запуске (main.py, async_main.py)
+    :param transport: транспорт
+    """
+    global BOT
+    BOT = transport
+
+
+async def delete_messages(chat_id: int) -> None:
+    """
+    Удаляет сообщения из чата по их айди, записанным в ids_to_delete
+    :param chat_id: айди чата
+    """
+    for i in ids_to_delete[chat_id]:
+        await BOT.delete_message(chat_id, i)
+        logging.info(f'{chat_id} Сообщение удалено, айди: {i}')
+
+
+@HANDLERS.message_handler(commands=['start'])
+async def process_photo(message: types.Message) -> None:
+    """
+    Этап 1а: начало обработки фотографии.\n
+    Переход к проверке фотографии (1б)
+    :param message: сообщение пользователя
+    """
+    chat_id = message.chat.id
+    await BOT.run_drawing(reset_all_info, chat_id)
+    msg = await BOT.send_message(
+        chat_id,
+        text='Чтобы начать, отправь мне фотографию в виде документа'
+    )
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(message, check_photo)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data.startswith('photo-other'))
+async def process_other_photo(call: types.CallbackQuery) -> None:
+    """
+    Этап 1в: начало обработки другой фотографии.\n
+    Переход к проверке фотографии (1б)
+    :param call: запрос от «неправильной» фотографии пользователя (1б)
+    """
+    chat_id = call.message.chat.id
+    ids_to_delete[chat_id].append(int(call.data.split('_')[1]))
+    photo_path = covers_info[chat_id]['photo']
+    PHOTOS.release(chat_id)
+    logging.warning(f'{chat_id} Удалено фото: {photo_path}')
+    msg = await BOT.send_message(
+        chat_id,
+        text='Чтобы продолжить, отправь другое фото'
+    )
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(msg, check_photo)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data.startswith('bg'))
+async def save_photo_bg(call: types.CallbackQuery) -> None:
+    """
+    Этап 1д: сохранение фона фотографии.\n
+    Переход к началу обработки верхнего заголовка (2а)
+    :param call: запрос от сообщения с выбором фона фотографии (1г)
+    """
+    chat_id = call.message.chat.id
+    photo_bg = call.data.split('_')[1]
+    covers_info[chat_id]['photo_bg'] = photo_bg
+    logging.info(f'{chat_id} Сохранён фон для фото: {photo_bg}')
+    await delete_messages(chat_id)
+    await process_upper_title(call.message)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data.startswith('photo-bg'))
+async def process_photo_bg(call: types.CallbackQuery) -> None:
+    """
+    Этап 1г: выбор фона фотографии.\n
+    Переход к этапу сохранения фона фотографии (1д)
+    :param call: запрос от сообщения
+    """
+    chat_id = call.message.chat.id
+    msg = await BOT.send_message(
+        chat_id,
+        text='Выбери цвет фона для зоны фото',
+        reply_markup=make_photo_bg_markup()
+        )
+    ids_to_delete[chat_id].append(msg.message_id)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data.startswith('photo-crop'))
+async def save_crop(call: types.CallbackQuery) -> None:
+    """
+    Этап 1е: сохранение маски для обрезания фотографии.\n
+    Переход к началу обработки верхнего заголовка (2а)
+    :param call: запрос от сообщения
+    """
+    chat_id = call.message.chat.id
+    mask = True
+    covers_info[chat_id]['mask'] = mask
+    logging.info(f'{chat_id} Включена маска для фотографии: {mask}')
+    await delete_messages(chat_id)
+    await process_upper_title(call.message)
+
+
+async def reject_photo(message: types.Message, text: str) -> None:
+    """
+    Сообщает, что фотография не принята, и ждёт другую (1б)
+    :param message: сообщение пользователя
+    :param text: текст сообщения
+    """
+    chat_id = message.chat.id
+    ids_to_delete[chat_id].append(message.message_id)
+    msg = await BOT.send_message(chat_id, text=text)
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(msg, check_photo)
+
+
+async def check_photo(message: types.Message) -> None:
+    """
+    Этап 1б: проверка фотографии, сообщение о несоответствии соотношения сторон,
+    сохранение пути к фотографии.\n
+    Переход к выбору другого фото (1в), выбору фона фотографии (1г),
+    сохранению маски для обрезания фотографии (1е), началу обработки верхнего заголовка (2а)
+    :param message: сообщение пользователя (предположительно, фотография) (1а)
+    """
+    chat_id = message.chat.id
+    if message.content_type != 'document':
+        logging.warning(f'{chat_id} Фото не принято, не тот тип сообщения: {message.content_type}')
+        await reject_photo(message, 'Мне нужно отправить картинку в виде документа. Попробуй ещё раз')
+        return
+
+    try:
+        check_photo_file_size(message.document.file_size)
+        photo_path = PHOTOS.acquire_existing(chat_id, message.document.file_unique_id)
+        if photo_path is None:
+            file_info = await BOT.get_file(message.document.file_id)
+            downloaded_path, digest = await BOT.download_photo(file_info.file_path,
+                                                               PATH_TO_SAVE + str(chat_id) + '_photo')
+            photo_path = PHOTOS.add(chat_id, downloaded_path, digest, message.document.file_unique_id)
+    except PhotoFileTooLargeError as error:
+        logging.warning(f'{chat_id} Фото не принято, слишком большой файл: {error}')
+        await reject_photo(message, f'Файл слишком большой. Я принимаю фотографии до '
+                                    f'{PHOTO_MAX_FILE_SIZE // (1024 * 1024)} МБ')
+        return
+    except PhotoFormatError as error:
+        logging.warning(f'{chat_id} Фото не принято, не тот формат: {error}')
+        await reject_photo(message, 'Я работаю только с файлами формата png, jpg, jpeg. Попробуй другой файл')
+        return
+    logging.info(f'{chat_id} Фотография сохранена: {photo_path}')
+
+    try:
+        width, height = (await BOT.run_drawing(get_prepared_photo, photo_path))['size']
+    except PhotoTooLargeError as error:
+        logging.warning(f'{chat_id} Фото не принято, слишком много пикселей: {error}')
+        PHOTOS.release(chat_id)
+        await reject_photo(message, 'Фотография слишком большая. Попробуй уменьшить её или отправь другой файл')
+        return
+    except PhotoAspectRatioError as error:
+        logging.warning(f'{chat_id} Фото не принято, слишком вытянуто: {error}')
+        PHOTOS.release(chat_id)
+        await reject_photo(message, 'Фотография слишком вытянута. Попробуй обрезать её или отправь другой файл')
+        return
+    except OSError as error:
+        logging.warning(f'{chat_id} Фото не принято, не удалось прочитать файл: {error}')
+        PHOTOS.release(chat_id)
+        await reject_photo(message, 'Не получилось открыть фотографию. Возможно, файл повреждён. Попробуй другой файл')
+        return
+    covers_info[chat_id]['photo'] = photo_path
+    covers_info[chat_id]['photo_analysis'] = await BOT.run_drawing(get_photo_analysis, photo_path)
+    logging.info(f'{chat_id} Фотография проанализирована: {covers_info[chat_id]["photo_analysis"]}')
+    markup = types.InlineKeyboardMarkup()
+    button_choose_other_photo = types.InlineKeyboardButton('Выбрать другое фото',
+                                                           callback_data=f'photo-other_{message.message_id}')
+    if (width / height) < (PHOTO_WIDTH / PHOTO_HEIGHT):
+        logging.warning(f'{chat_id} Соотношение сторон меньше 3:2 ({round(width / height, 2)})')
+        button_photo_bg = types.InlineKeyboardButton('Продолжить', callback_data='photo-bg')
+        markup.row(button_photo_bg)
+        markup.row(button_choose_other_photo)
+        msg = await BOT.send_message(
+            chat_id,
+            text='Внимание! Соотношение сторон фотографии меньше 3:2. Для зоны фото будет добавлен фон по бокам',
+            reply_markup=markup
+            )
+        ids_to_delete[chat_id].append(msg.message_id)
+    elif (width / height) > (PHOTO_WIDTH / PHOTO_HEIGHT):
+        logging.warning(f'{chat_id} Соотношение сторон больше 3:2 ({round(width / height), 2})')
+        button_photo_crop = types.InlineKeyboardButton('Продолжить', callback_data='photo-crop')
+        markup.row(button_photo_crop)
+        markup.row(button_choose_other_photo)
+        msg = await BOT.send_message(
+            chat_id,
+            text='Внимание! Соотношение сторон фотографии больше 3:2. Фотография будет обрезана по бокам',
+            reply_markup=markup
+            )
+        ids_to_delete[chat_id].append(msg.message_id)
+    else:
+        await delete_messages(chat_id)
+        await process_upper_title(message)
+
+
+async def reject_title(message: types.Message, text: str, title_type: Literal['upper', 'lower'],
+                       save_func: Callable[[types.Message], Awaitable]) -> None:
+    """
+    Сообщает, что заголовок не принят, и ждёт другой (2б / 3б)
+    :param message: сообщение пользователя
+    :param text: текст сообщения
+    :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param save_func: функция, сохраняющая заголовок
+    """
+    chat_id = message.chat.id
+    ids_to_delete[chat_id].append(message.message_id)
+    msg = await BOT.send_message(chat_id, text=text)
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(msg, check_title, title_type, save_func)
+
+
+async def check_title(message: types.Message, title_type: Literal['upper', 'lower'],
+                      save_func: Callable[[types.Message], Awaitable]) -> None:
+    """
+    Этап 2б / 3б: проверка заголовка.\n
+    Переход к сохранению заголовка (2в / 3в)
+    :param message: сообщение пользователя (предположительно, заголовок)
+    :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param save_func: функция, сохраняющая заголовок
+    """
+    chat_id = message.chat.id
+    if message.content_type != 'text':
+        logging.warning(f'{chat_id} Заголовок ({title_type}) не принят, не тот тип сообщения: {message.content_type}')
+        await reject_title(message, 'Сообщение должно содержать текст. Попробуй ещё раз', title_type, save_func)
+        return
+
+    msg_text = message.text.strip().upper()
+    max_n = 3 if title_type == 'upper' else 2
+    title_params = await BOT.run_drawing(pick_title_params, msg_text, title_type)
+    covers_info[chat_id][f'{title_type}_title_params'] = title_params
+    logging.info(f'{chat_id} Подобраны параметры для заголовка ({title_type}): {title_params}')
+    font = covers_info[chat_id][f'{title_type}_title_params']['font']
+
+    if await BOT.run_drawing(istoowide, msg_text, font):
+        logging.warning(f'{chat_id} Заголовок ({title_type}) не принят, слишком длинный: {msg_text}')
+        await reject_title(message, 'Текст слишком длинный. Попробуй ещё раз', title_type, save_func)
+    elif len(msg_text.split('\n')) > max_n:
+        logging.warning(f'{chat_id} Заголовок ({title_type}) не принят, слишком много строк: {msg_text}')
+        await reject_title(message, 'В тексте слишком много строк. Попробуй ещё раз', title_type, save_func)
+    else:
+        await save_func(message)
+
+
+async def save_upper_title(message: types.Message) -> None:
+    """
+    Этап 2в: сохранение верхнего заголовка.\n
+    Переход к обработке нижнего заголовка (3а)
+    :param message: сообщение с проверенным верхним заголовком (2б)
+    """
+    chat_id = message.chat.id
+    upper_title = message.text.strip().upper()
+    covers_info[chat_id]['upper_title'] = upper_title
+    logging.info(f'{chat_id} Сохранён верхний заголовок: {upper_title}')
+    await delete_messages(chat_id)
+    await process_lower_title(message)
+
+
+async def process_upper_title(message: types.Message) -> None:
+    """
+    Этап 2а: обработка верхнего заголовка.\n
+    Переход к проверке заголовка (2б)
+    :param message: сообщение из предыдущего этапа (1)
+    """
+    chat_id = message.chat.id
+    ids_to_delete[chat_id] = list()
+    msg = await BOT.send_message(
+        chat_id,
+        text='Напиши название мероприятия (если больше одной строки, напиши с переносами)'
+        )
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(msg, check_title, 'upper', save_upper_title)
+
+
+async def save_lower_title(message: types.Message) -> None:
+    """
+    Этап 3в: сохранение нижнего заголовка.\n
+    Переход к обработке цвета (4а)
+    :param message: сообщение с проверенным нижним заголовком (3б)
+    """
+    chat_id = message.chat.id
+    lower_title = message.text.strip().upper()
+    covers_info[chat_id]['lower_title'] = lower_title
+    logging.info(f'{chat_id} Сохранён нижний заголовок: {lower_title}')
+    await delete_messages(chat_id)
+    await process_color(chat_id, 'u')
+
+
+async def process_lower_title(message: types.Message) -> None:
+    """
+    Этап 3а: обработка нижнего заголовка.\n
+    Переход к проверке заголовка (3б)
+    :param message: сообщение из предыдущего этапа (2)
+    """
+    chat_id = message.chat.id
+    ids_to_delete[chat_id] = list()
+    msg = await BOT.send_message(
+        chat_id,
+        text='Напиши фотографа. Если их двое, напиши имена через перенос'
+        )
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(msg, check_title, 'lower', save_lower_title)
+
+
+async def process_color(chat_id: int, prefix: Literal['u', 'l', 'i', 'r']) -> None:
+    """
+    Этап 4а / 5а / 6а / 7а: обработка цвета плашки.\n
+    Переход к сохранению цвета плашки (4б / 5б / 6б / 7б), обработке свободного цвета (4г / 5г / 6г / 7г)
+    :param chat_id: айди чата из сообщения прошлого этапа (3, 4, 5, 6)
+    :param prefix: префикс плашки, которая покрасится: ``u`` – верхняя, ``l`` – нижняя, ``i`` – левая, ``r`` – правая
+    """
+    ids_to_delete[chat_id] = list()
+    await BOT.send_message(
+        chat_id,
+        text=f'Выбери цвет {PREFIX2POS.get(prefix)} плашки',
+        reply_markup=make_color_markup(prefix, get_colors())
+        )
+
+
+@HANDLERS.callback_query_handler(func=lambda call: re.fullmatch(r'[ulir]_#[A-F0-9]{6}', call.data))
+async def save_color(call: types.CallbackQuery) -> None:
+    """
+    Этап 4в / 5в / 6в / 7в: сохранение цвета плашки.\n
+    Переход к сохранению цвета другой плашки (5а / 6а / 7а), обработке расположения прямоугольников (8а)
+    :param call: запрос от сообщения с выбором цвета (4а, 5а, 6а, 7а)
+    """
+    chat_id = call.message.chat.id
+    await BOT.delete_message(chat_id, call.message.message_id)
+    color = call.data[2:]
+    title_fill = define_fill(color)
+    cover_info = covers_info[chat_id]
+    if call.data.startswith('u'):
+        cover_info['upper_color'] = color
+        logging.info(f'{chat_id} Сохранён верхний цвет: {color}')
+        cover_info['upper_title_params']['fill'] = title_fill
+        logging.info(f'{chat_id} Сохранён цвет верхнего заголовка: {title_fill}')
+        await process_color(chat_id, 'l')
+
+    elif call.data.startswith('l'):
+        cover_info['lower_color'] = color
+        logging.info(f'{chat_id} Сохранён нижний цвет: {color}')
+        cover_info['lower_title_params']['fill'] = title_fill
+        logging.info(f'{chat_id} Сохранён цвет нижнего заголовка: {title_fill}')
+        await process_color(chat_id, 'i')
+
+    elif call.data.startswith('i'):
+        cover_info['left_color'] = color
+        logging.info(f'{chat_id} Сохранён цвет левых прямоугольников: {color}')
+        await process_color(chat_id, 'r')
+
+    elif call.data.startswith('r'):
+        cover_info['right_color'] = color
+        logging.info(f'{chat_id} Сохранён цвет правых прямоугольников: {color}')
+        await process_corner_forms(call)
+
+
+async def check_other_color(message: types.Message, prefix: Literal['u', 'l', 'i', 'r'],
+                            save_func: Callable[[types.Message, str], Awaitable]) -> None:
+    """
+    Этап 4д / 5д / 6д / 7д:проверка свободного цвета.\n
+    Переход к сохранению свободного цвета (4е / 5е / 6е / 7е)
+    :param message: сообщение пользователя (предположительно, с HEX-кодом цвета)
+    :param prefix: префикс плашки, которая покрасится: ``u`` – верхняя, ``l`` – нижняя, ``i`` – левая, ``r`` – правая
+    :param save_func: функция, сохраняющая свободный цвет
+    """
+    msg_text = message.text
+    if re.fullmatch(r'^#[0-9a-fA-F]{6}$', msg_text):
+        await save_func(message, prefix)
+    else:
+        logging.warning(f'{message.chat.id} HEX-код свободного цвета не принят: {msg_text}')
+        chat_id = message.chat.id
+        ids_to_delete[chat_id].append(message.message_id)
+        msg = await BOT.send_message(
+            chat_id,
+            text='HEX-код должен состоять из 7 символов (от 0 до 9, от A до F), первый из которых #'
+            )
+        ids_to_delete[chat_id].append(msg.message_id)
+        BOT.register_next_step_handler(msg, check_other_color, prefix, save_func)
+
+
+async def save_other_color(message: types.Message, prefix: Literal['u', 'l', 'i', 'r']) -> None:
+    """
+    Этап 4е / 5е / 6е / 7е: сохранению свободного цвета.\n
+    Переход к выбору цвета плашки (4а / 5а / 6а / 7а)
+    :param message: сообщение с проверенным свободным цветом
+    :param prefix: префикс плашки, которая покрасится: ``u`` – верхняя, ``l`` – нижняя, ``i`` – левая, ``r`` – правая
+    """
+    chat_id = message.chat.id
+    color = message.text.upper()
+    add_color(color)
+    logging.info(f'{chat_id} Добавлен свободный цвет: {color}')
+    await delete_messages(chat_id)
+    await process_color(chat_id, prefix)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data.endswith('other'))
+async def process_other_color(call: types.CallbackQuery) -> None:
+    """
+    Этап 4г / 5г / 6г / 7г: обработка свободного цвета.\n
+    Переход к проверке свободного цвета (4д / 5д / 6д / 7д)
+    :param call: запрос от сообщения этапа 4а / 5а / 6а / 7а
+    """
+    chat_id = call.message.chat.id
+    await BOT.delete_message(chat_id, call.message.message_id)
+    prefix = call.data[0]
+    msg = await BOT.send_message(
+        chat_id,
+        text='Напиши HEX-код цвета (через #)'
+    )
+    ids_to_delete[chat_id].append(msg.message_id)
+    BOT.register_next_step_handler(msg, check_other_color, prefix, save_other_color)
+
+
+async def process_corner_forms(call: types.CallbackQuery) -> None:
+    """
+    Этап 8а: обработка расположения прямоугольников.\n
+    Переход к самостоятельному составлению расположения прямоугольников (8б),
+    сохранению расположения прямоугольников (8в)
+    :param call: запрос от сообщения прошлого этапа (7)
+    """
+    chat_id = call.message.chat.id
+    await BOT.run_drawing(RENDER.create_preview_pic, covers_info[chat_id], chat_id, False)
+    await BOT.upload('photo', await BOT.run_drawing(get_preview_png, chat_id), lambda photo: BOT.send_photo(
+        chat_id,
+        photo=photo,
+        caption='Выбери форму боковых плашек',
+        reply_markup=make_corner_type_markup()))
+
+
+def set_preview_corners(chat_id: int, corners: List[int]) -> bytes:
+    """
+    Перерисовывает прямоугольники на превью-изображении
+    :param chat_id: айди чата
+    :param corners: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
+    :return: превью-изображение в png
+    """
+    get_preview(chat_id).set_corners(corners)
+    return get_preview_png(chat_id)
+
+
+def show_preview_digits(chat_id: int) -> bytes:
+    """
+    Показывает номера прямоугольников на превью-изображении
+    :param chat_id: айди чата
+    :return: превью-изображение в png
+    """
+    get_preview(chat_id).show_digits()
+    return get_preview_png(chat_id)
+
+
+def redraw_preview_rectangles(chat_id: int, corners: Dict[int, int], cover_info: Dict) -> bytes:
+    """
+    Перерисовывает заданные прямоугольники на превью-изображении
+    :param chat_id: айди чата
+    :param corners: словарь, где ключ – координата прямоугольника, значение – его текущее состояние
+    :param cover_info: параметры обложки
+    :return: превью-изображение в png
+    """
+    compositor = get_preview(chat_id)
+    for coord, color_state in corners.items():
+        redraw_rectangle(coord, color_state, compositor, cover_info)
+        logging.info(f'{chat_id} Перерисован прямоугольник {coord}: {color_state}, {cover_info["corners"]}')
+    return get_preview_png(chat_id)
+
+
+async def edit_custom_message(call: types.CallbackQuery, corners: List[int], photo: bytes) -> None:
+    """
+    Изменяет сообщение о редактировании расположения прямоугольников
+    :param call: запрос, по которому определяется сообщение для редактирования
+    :param corners: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
+    :param photo: превью-изображение в png
+    """
+    await BOT.upload('photo', photo, lambda media: BOT.edit_message_media(
+        media=types.InputMediaPhoto(media, caption='Выбери прямоугольники, которые будут перекрашены'),
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        reply_markup=make_interface_markup(CUSTOM_CORNER_PREFIX, corners)))
+
+
+@HANDLERS.callback_query_handler(func=lambda call: re.fullmatch(r'corner_\d{1,2}', call.data))
+async def change_corner_type(call: types.CallbackQuery) -> None:
+    """
+    Меняет тип расположения прямоугольников, редактирует сообщение с их выбором (8а)
+    :param call: запрос от сообщения этапа 8а
+    """
+    chat_id = call.message.chat.id
+    corner_type = int(call.data.split('_')[1])
+    cover_info = covers_info[chat_id]
+    # повторное нажатие на ту же кнопку не меняет изображение, а такое редактирование сообщения вызывает ошибку
+    if cover_info['corners'] != list(CORNER_COORDS[corner_type]):
+        cover_info['corners'] = list(CORNER_COORDS[corner_type])
+        logging.info(f'{chat_id} Выбран тип расположения прямоугольников {corner_type}: {cover_info["corners"]}')
+
+        photo = await BOT.run_drawing(set_preview_corners, chat_id, cover_info['corners'])
+
+        await BOT.upload('photo', photo, lambda media: BOT.edit_message_media(
+            media=types.InputMediaPhoto(media, caption='Выбери форму боковых плашек'),
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            reply_markup=make_corner_type_markup()))
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data == 'custom_corner')
+async def process_custom_corners(call: types.CallbackQuery) -> None:
+    """
+    Этап 8б: самостоятельное составление расположения прямоугольников.\n
+    Переход к сохранению расположения прямоугольников (8в)
+    :param call: запрос от сообщения с выбором расположения прямоугольников (8а)
+    """
+    chat_id = call.message.chat.id
+    await BOT.delete_message(chat_id, call.message.message_id)
+
+    cover_info = covers_info[chat_id]
+    photo = await BOT.run_drawing(show_preview_digits, chat_id)
+
+    await BOT.upload('photo', photo, lambda media: BOT.send_photo(
+        chat_id,
+        photo=media,
+        caption='Выбери прямоугольники, которые будут перекрашены',
+        reply_markup=make_interface_markup(CUSTOM_CORNER_PREFIX, cover_info['corners'])))
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data == f'{CUSTOM_CORNER_PREFIX}_random')
+async def draw_random_corners(call: types.CallbackQuery) -> None:
+    """
+    Рисует на изображении прямоугольники в случайном порядке,
+    сохраняет данные о состоянии прямоугольников
+    :param call: запрос от сообщения с самостоятельным расположением прямоугольников (8б)
+    """
+    chat_id = call.message.chat.id
+    cover_info = covers_info[chat_id]
+    random_corners = [randint(0, 1) for _ in range(RECTANGLE_NUM * 2)]
+    logging.info(f'{chat_id} Сгенерированы случайное расположение прямоугольников: {random_corners}')
+
+    photo = await BOT.run_drawing(redraw_preview_rectangles, chat_id, dict(enumerate(random_corners)), cover_info)
+
+    await edit_custom_message(call, cover_info['corners'], photo)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: re.fullmatch(CUSTOM_CORNER_PREFIX+r'_\d{1,2}_\d', call.data))
+async def change_custom_corner(call: types.CallbackQuery) -> None:
+    """
+    Обрабатывает запрос на перерисовывание прямоугольника,
+    редактирует сообщение этапа 8б
+    :param call: запрос от сообщения этапа 8б
+    """
+    chat_id = call.message.chat.id
+    splitted_data = call.data.split('_')
+    coord = int(splitted_data[1])
+    color_state = int(splitted_data[2])
+
+    cover_info = covers_info[chat_id]
+    photo = await BOT.run_drawing(redraw_preview_rectangles, chat_id, {coord: color_state}, cover_info)
+
+    await edit_custom_message(call, cover_info['corners'], photo)
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data in ('corner_ready', f'{CUSTOM_CORNER_PREFIX}_ready'))
+async def save_corner_forms(call: types.CallbackQuery) -> None:
+    """
+    Этап 8в: сохранение расположения прямоугольников.\n
+    Переход к выбору расположения копирайт-надписи (9а)
+    :param call: запрос от сообщения этапа 8а / 8б
+    """
+    chat_id = call.message.chat.id
+    logging.info(f'{chat_id} Итоговое расположение прямоугольников: {covers_info[chat_id]["corners"]}')
+    await BOT.delete_message(chat_id, call.message.message_id)
+    await process_copyright_sign(call)
+
+
+async def process_copyright_sign(call: types.CallbackQuery) -> None:
+    """
+    Этап 9а: обработка расположения копирайт-надписи.\n
+    Переход к сохранению копирайт-надписи (9б)
+    :param call: запрос от сообщения прошлого этапа (8а / 8б)
+    """
+    chat_id = call.message.chat.id
+    cover_info = covers_info[chat_id]
+    photo = await BOT.run_drawing(show_preview_digits, chat_id)
+
+    await BOT.upload('photo', photo, lambda media: BOT.send_photo(
+        chat_id,
+        photo=media,
+        caption='Выбери место, куда поставить надпись «© ЛАЙВ РАБОТАЕТ»',
+        reply_markup=make_interface_markup(COPYRIGHT_SIGN_PREFIX, cover_info['corners'], False, False)))
+
+
+@HANDLERS.callback_query_handler(func=lambda call: re.fullmatch(COPYRIGHT_SIGN_PREFIX+r'_\d{1,2}', call.data))
+async def save_copyright_coord(call: types.CallbackQuery) -> None:
+    """
+    Этап 9б: сохранение расположения копирайт-надписи.\n
+    Переход к предварительному показу информации об обложке (10)
+    :param call: запрос от сообщения этапа 9а
+    """
+    chat_id = call.message.chat.id
+    await BOT.delete_message(chat_id, call.message.message_id)
+    coord = int(call.data.split('_')[1])
+    covers_info[chat_id]['copyright_sign'] = coord
+    logging.info(f'{chat_id} Выбрано расположение копирайт-надписи: {coord}')
+    await show_info(call)
+
+
+async def show_info(call: types.CallbackQuery) -> None:
+    """
+    Этап 10: предварительный показ информации об обложке.\n
+    Переход к экспорту обложки (11)
+    :param call: запрос от сообщения этапа 9б
+    """
+    chat_id = call.message.chat.id
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton('Приступить', callback_data='create-pic'))
+    msg_list = []
+    for k, v in covers_info[chat_id].items():
+        msg_list.append(f'{k}: {v}')
+        msg_list.append('\n\n')
+    await BOT.send_message(
+        chat_id,
+        text=f'Итоговая информация:\n\n{"".join(msg_list)}\n\nПриступить к сбору обложки?',
+        reply_markup=markup
+    )
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data == 'create-pic')
+async def create_pic(call: types.CallbackQuery) -> None:
+    """
+    «Собирает» обложку, сохраняет её и отправляет сообщение экспортом (11)
+    :param call: запрос от сообщения этапа 10
+    """
+    chat_id = call.message.chat.id
+    cover_info = covers_info[chat_id]
+    await BOT.delete_message(chat_id, call.message.message_id)
+    result_pic = await BOT.run_drawing(RENDER.create_pic, cover_info)
+
+    result_pic_path = make_result_pic_path(chat_id)
+    with open(result_pic_path, 'wb') as file:
+        file.write(result_pic)
+    logging.info(f'{chat_id} Сохранена итоговая картинка: {result_pic_path}')
+    await send_preview(chat_id)
+
+
+async def send_preview(chat_id: int) -> None:
+    """
+    Этап 11: экспорт обложки.\n
+    Переход к экспорту в формате png (12)
+    :param chat_id: айди чата
+    """
+    markup = types.InlineKeyboardMarkup()
+    markup.row(types.InlineKeyboardButton('Экспорт .png', callback_data='export_png'))
+    markup.row(types.InlineKeyboardButton('Собрать новую обложку', callback_data='restart'))
+
+    with open(make_result_pic_path(chat_id), 'rb') as file:
+        result_pic = file.read()
+    await BOT.upload('photo', result_pic, lambda photo: BOT.send_photo(
+        chat_id,
+        photo=photo,
+        caption='Готово! Выбери формат экспорта',
+        reply_markup=markup))
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data.startswith('export'))
+async def export_png(call: types.CallbackQuery) -> None:
+    """
+    Этап 12: экспорт в формате png.\n
+    Переход к подготовке перед перезапуском (13)
+    :param call: запрос от сообщения этапа 11
+    """
+    if call.data == 'export_png':
+        chat_id = call.message.chat.id
+        markup = types.InlineKeyboardMarkup()
+        markup.row(types.InlineKeyboardButton('Собрать новую обложку', callback_data='restart'))
+        result_pic_path = make_result_pic_path(chat_id)
+        with open(result_pic_path, 'rb') as file:
+            result_pic = file.read()
+        await BOT.upload('photo', result_pic, lambda photo: BOT.edit_message_media(
+            media=types.InputMediaPhoto(photo, caption='Готово! Выбери формат экспорта'),
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            reply_markup=markup))
+        await BOT.upload('document', result_pic,
+                         lambda document: BOT.send_document(chat_id, document=document),
+                         os.path.basename(result_pic_path))
+        logging.info(f'{chat_id} Отправлен png-файл: {result_pic_path}')
+
+
+@HANDLERS.callback_query_handler(func=lambda call: call.data == 'restart')
+async def restart(call: types.CallbackQuery) -> None:
+    """
+    Этап 13: подготовка перед перезапуском.\n
+    Переход к обработке фотографии (1а)
+    :param call: запрос от сообщения этапа 11
+    """
+    chat_id = call.message.chat.id
+    logging.info(f'{chat_id} Подготовка перед перезапуском')
+    await BOT.delete_message(call.message.chat.id, call.message.message_id)
+    await process_photo(call.message)
+
+
+NEXT_STEP_HANDLERS: Dict[str, Callable] = {
+    handler.__name__: handler
+    for handler in (check_photo, check_title, save_upper_title, save_lower_title, check_other_color, save_other_color)
+}
+# ключ – имя обработчика следующего сообщения, значение – функция; по именам восстанавливаются состояния чатов
@@ -0,0 +1,131 @@
+"""
+storage.py
+"""
+import logging
+import threading
+from typing import Set
+from static import *
+from photo import drop_prepared_photo
+
+
+class PhotoStorage:
+    """
+    Хранилище загруженных фотографий по содержимому: файл называется sha256 своих байтов,
+    поэтому одна и та же фотография из разных чатов хранится, декодируется и анализируется один раз.\n
+    Для каждой фотографии запоминаются чаты, которые её используют; когда чатов не остаётся,
+    файл и производные данные (уменьшенные копии, результаты анализа) удаляются.
+    По ``file_unique_id`` из Telegram уже сохранённая фотография находится без скачивания
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: директория для фотографий
+        """
+        self.path = path
+        self.references: Dict[str, Set[int]] = dict()
+        # ключ – путь к фотографии, значение – айди чатов, которые её используют
+        self.chat_photos: Dict[int, str] = dict()
+        # ключ – айди чата, значение – путь к фотографии чата
+        self.unique_ids: Dict[str, str] = dict()
+        # ключ – file_unique_id документа, значение – путь к фотографии
+        self.lock = threading.RLock()
+
+    def make_path(self, digest: str, extension: str) -> str:
+        """
+        Создаёт путь к фотографии в хранилище
+        :param digest: sha256 содержимого
+        :param extension: расширение файла
+        :return: путь к фотографии
+        """
+        return os.path.join(self.path, f'{digest}.{extension}')
+
+    def acquire_existing(self, chat_id: int, file_unique_id: str) -> str | None:
+        """
+        Находит сохранённую фотографию по ``file_unique_id`` и отдаёт её чату, чтобы не скачивать файл заново
+        :param chat_id: айди чата
+        :param file_unique_id: постоянный идентификатор файла в Telegram
+        :return: путь к фотографии; ``None``, если такой файл ещё не загружался
+        """
+        with self.lock:
+            photo_path = self.unique_ids.get(file_unique_id)
+            if photo_path is None or not os.path.exists(photo_path):
+                return None
+            self.acquire(chat_id, photo_path)
+            return photo_path
+
+    def add(self, chat_id: int, file_path: str, digest: str, file_unique_id: str | None = None) -> str:
+        """
+        Переносит скачанную фотографию в хранилище и отдаёт её чату.
+        Если такая фотография уже хранится, скачанный файл удаляется
+        :param chat_id: айди чата
+        :param file_path: путь к скачанному файлу
+        :param digest: sha256 содержимого
+        :param file_unique_id: постоянный идентификатор файла в Telegram
+        :return: путь к фотографии в хранилище
+        """
+        photo_path = self.make_path(digest, file_path.rsplit('.', 1)[-1])
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            if os.path.exists(photo_path):
+                os.remove(file_path)
+                logging.info(f'{chat_id} Фотография уже хранится: {photo_path}')
+            else:
+                os.replace(file_path, photo_path)
+            if file_unique_id is not None:
+                self.unique_ids[file_unique_id] = photo_path
+            self.acquire(chat_id, photo_path)
+        return photo_path
+
+    def acquire(self, chat_id: int, photo_path: str) -> None:
+        """
+        Отдаёт фотографию чату; предыдущая фотография чата освобождается
+        :param chat_id: айди чата
+        :param photo_path: путь к фотографии
+        """
+        with self.lock:
+            if self.chat_photos.get(chat_id) not in (None, photo_path):
+                self.release(chat_id)
+            self.chat_photos[chat_id] = photo_path
+            self.references.setdefault(photo_path, set()).add(chat_id)
+
+    def release(self, chat_id: int) -> None:
+        """
+        Освобождает фотографию чата; если фотографию больше никто не использует, удаляет её
+        :param chat_id: айди чата
+        """
+        with self.lock:
+            photo_path = self.chat_photos.pop(chat_id, None)
+            if photo_path is None:
+                return
+            chats = self.references.get(photo_path, set())
+            chats.discard(chat_id)
+            if chats:
+                return
+            self.references.pop(photo_path, None)
+            for file_unique_id in [key for key, value in self.unique_ids.items() if value == photo_path]:
+                del self.unique_ids[file_unique_id]
+            if os.path.exists(photo_path):
+                os.remove(photo_path)
+                logging.warning(f'{chat_id} Удалена фотография: {photo_path}')
+            drop_prepared_photo(photo_path)
+
+    def is_referenced(self, file_name: str) -> bool:
+        """
+        Определяет, используется ли файл хранилища каким-либо чатом
+        :param file_name: имя файла в директории хранилища
+        :return: ``True``, если используется. ``False`` – в обратном случае
+        """
+        with self.lock:
+            return os.path.join(self.path, file_name) in self.references
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Возвращает количество хранимых фотографий и чатов, которые их используют
+        :return: словарь со счётчиками ``photos`` и ``references``
+        """
+        with self.lock:
+            return {'photos':     len(self.references),
+                    'references': sum(map(len, self.references.values()))}
+
+
+PHOTOS: PhotoStorage = PhotoStorage(PHOTO_STORAGE_PATH)
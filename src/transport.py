@@ -0,0 +1,186 @@
+"""
+transport.py
+"""
+import io
+import asyncio
+import functools
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from telebot import types
+from typing import Any, Awaitable, Callable, Coroutine
+from static import *
+from upload import upload, upload_async, FileKind
+from download import download_photo, download_photo_async
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """
+    Выполняет корутину шага без цикла событий. Подходит только для корутин,
+    которые ждут методы ``SyncTransport`` (они выполняются сразу и не отдают управление)
+    :param coroutine: корутина
+    :return: результат корутины
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError('Шаг бота ждёт цикл событий, но выполняется синхронным транспортом')
+
+
+@functools.lru_cache(maxsize=None)
+def to_sync(step: Callable[..., Coroutine]) -> Callable:
+    """
+    Оборачивает шаг бота в обычную функцию для синхронного клиента (``TeleBot``).
+    Обёртка одна на шаг и сохраняет его имя: по нему замеряется время шага и сохраняются состояния чатов
+    :param step: асинхронная функция шага
+    :return: функция, которая выполняет шаг через ``run_sync()``
+    """
+    @functools.wraps(step)
+    def sync_step(*args, **kwargs) -> Any:
+        return run_sync(step(*args, **kwargs))
+    return sync_step
+
+
+class Transport(ABC):
+    """
+    Связь шагов бота (steps.py) с клиентом бота.\n
+    Шаги написаны один раз как корутины и ждут методы транспорта: синхронный транспорт выполняет их сразу
+    в потоке обработчика, асинхронный – в цикле событий, а работу с изображениями отдаёт пулу потоков
+    """
+
+    @abstractmethod
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """
+        Вызывает метод Bot API у клиента бота
+        :param method: название метода клиента (например, ``send_message``)
+        :param args: позиционные аргументы метода
+        :param kwargs: именованные аргументы метода
+        :return: результат метода
+        """
+
+    # методы Bot API, которые вызывают шаги
+    async def send_message(self, *args, **kwargs) -> types.Message:
+        return await self.call('send_message', *args, **kwargs)
+
+    async def send_photo(self, *args, **kwargs) -> types.Message:
+        return await self.call('send_photo', *args, **kwargs)
+
+    async def send_document(self, *args, **kwargs) -> types.Message:
+        return await self.call('send_document', *args, **kwargs)
+
+    async def edit_message_media(self, *args, **kwargs) -> types.Message | bool:
+        return await self.call('edit_message_media', *args, **kwargs)
+
+    async def delete_message(self, *args, **kwargs) -> bool:
+        return await self.call('delete_message', *args, **kwargs)
+
+    async def get_file(self, *args, **kwargs) -> types.File:
+        return await self.call('get_file', *args, **kwargs)
+
+    @abstractmethod
+    async def run_drawing(self, func: Callable, *args) -> Any:
+        """
+        Выполняет работу с изображениями и шрифтами
+        :param func: функция
+        :param args: аргументы функции
+        :return: результат функции
+        """
+
+    @abstractmethod
+    async def upload(self, kind: FileKind, content: bytes,
+                     send: Callable[[str | io.BytesIO], Awaitable[types.Message | bool]],
+                     file_name: str | None = None) -> types.Message | bool:
+        """
+        Отправляет файл через ``upload()`` / ``upload_async()``
+        :param kind: тип файла: ``photo`` – фотография, ``document`` – документ
+        :param content: содержимое файла
+        :param send: функция, которая отправляет файл через методы транспорта (принимает file_id или буфер)
+        :param file_name: имя файла, которое увидит пользователь
+        :return: результат ``send``
+        """
+
+    @abstractmethod
+    async def download_photo(self, file_path: str, path_without_extension: str) -> Tuple[str, str]:
+        """
+        Скачивает фотографию через ``download_photo()`` / ``download_photo_async()``
+        :param file_path: путь к файлу, который вернул ``get_file()``
+        :param path_without_extension: путь для сохранения; расширение добавляется по формату файла
+        :return: путь к сохранённой фотографии и sha256 её содержимого
+        """
+
+    @abstractmethod
+    def register_next_step_handler(self, message: types.Message, callback: Callable[..., Coroutine],
+                                   *args) -> None:
+        """
+        Регистрирует шаг, который обработает следующее сообщение чата (как ``TeleBot.register_next_step_handler()``)
+        :param message: сообщение, из которого берётся айди чата
+        :param callback: асинхронная функция шага
+        :param args: дополнительные аргументы шага
+        """
+
+
+class SyncTransport(Transport):
+    """
+    Транспорт для ``TeleBot``: методы выполняются сразу, шаги вызываются через ``to_sync()``
+    """
+
+    def __init__(self, bot: 'TeleBot') -> None:
+        """
+        :param bot: клиент бота
+        """
+        self.bot = bot
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        return getattr(self.bot, method)(*args, **kwargs)
+
+    async def run_drawing(self, func: Callable, *args) -> Any:
+        return func(*args)
+
+    async def upload(self, kind: FileKind, content: bytes,
+                     send: Callable[[str | io.BytesIO], Awaitable[types.Message | bool]],
+                     file_name: str | None = None) -> types.Message | bool:
+        return upload(kind, content, lambda media: run_sync(send(media)), file_name)
+
+    async def download_photo(self, file_path: str, path_without_extension: str) -> Tuple[str, str]:
+        return download_photo(self.bot.token, file_path, path_without_extension)
+
+    def register_next_step_handler(self, message: types.Message, callback: Callable[..., Coroutine],
+                                   *args) -> None:
+        self.bot.register_next_step_handler(message, to_sync(callback), *args)
+
+
+class AsyncTransport(Transport):
+    """
+    Транспорт для ``AsyncTeleBot``: методы клиента ждутся в цикле событий, работа с изображениями
+    выполняется в пуле потоков, обработчики следующего сообщения хранятся в словаре (см. async_main.py)
+    """
+
+    def __init__(self, bot: 'AsyncTeleBot', executor: Executor,
+                 next_steps: Dict[int, List[Tuple[Callable[..., Coroutine], Tuple]]]) -> None:
+        """
+        :param bot: клиент бота
+        :param executor: пул потоков для работы с изображениями и шрифтами
+        :param next_steps: словарь, где ключ – айди чата, значение – обработчики следующего сообщения и их аргументы
+        """
+        self.bot = bot
+        self.executor = executor
+        self.next_steps = next_steps
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        return await getattr(self.bot, method)(*args, **kwargs)
+
+    async def run_drawing(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def upload(self, kind: FileKind, content: bytes,
+                     send: Callable[[str | io.BytesIO], Awaitable[types.Message | bool]],
+                     file_name: str | None = None) -> types.Message | bool:
+        return await upload_async(kind, content, send, file_name)
+
+    async def download_photo(self, file_path: str, path_without_extension: str) -> Tuple[str, str]:
+        return await download_photo_async(self.bot.token, file_path, path_without_extension)
+
+    def register_next_step_handler(self, message: types.Message, callback: Callable[..., Coroutine],
+                                   *args) -> None:
+        self.next_steps.setdefault(message.chat.id, list()).append((callback, args))
@@ -0,0 +1,145 @@
+"""
+upload.py
+"""
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from telebot import types, apihelper
+from typing import Awaitable, Callable, Literal
+from static import *
+from metrics import METRICS
+
+
+FileKind = Literal['photo', 'document']
+
+file_ids: OrderedDict[Tuple[str, str], str] = OrderedDict()
+# ключ – тип файла и sha256 содержимого, значение – file_id, который вернул Telegram
+file_ids_lock: threading.Lock = threading.Lock()
+
+
+def get_file_id(kind: FileKind, digest: str) -> str | None:
+    """
+    Возвращает file_id уже загруженного файла
+    :param kind: тип файла: ``photo`` – фотография, ``document`` – документ
+    :param digest: sha256 содержимого файла
+    :return: file_id; ``None``, если такой файл ещё не загружался
+    """
+    with file_ids_lock:
+        file_id = file_ids.get((kind, digest))
+        if file_id is not None:
+            file_ids.move_to_end((kind, digest))
+        return file_id
+
+
+def remember_file_id(kind: FileKind, digest: str, message: types.Message | bool) -> None:
+    """
+    Сохраняет file_id файла из сообщения, которое вернул Telegram
+    :param kind: тип файла: ``photo`` – фотография, ``document`` – документ
+    :param digest: sha256 содержимого файла
+    :param message: отправленное или отредактированное сообщение
+    """
+    if not isinstance(message, types.Message):
+        return
+    if kind == 'photo' and message.photo:
+        file_id = message.photo[-1].file_id
+    elif kind == 'document' and message.document:
+        file_id = message.document.file_id
+    else:
+        return
+    with file_ids_lock:
+        file_ids[(kind, digest)] = file_id
+        while len(file_ids) > FILE_ID_CACHE_SIZE:
+            file_ids.popitem(last=False)
+
+
+def forget_file_id(kind: FileKind, digest: str) -> None:
+    """
+    Удаляет file_id, который Telegram не принял
+    :param kind: тип файла: ``photo`` – фотография, ``document`` – документ
+    :param digest: sha256 содержимого файла
+    """
+    with file_ids_lock:
+        file_ids.pop((kind, digest), None)
+
+
+def is_file_id_rejected(error: apihelper.ApiTelegramException) -> bool:
+    """
+    Определяет, что Telegram не принял file_id, а не отклонил запрос по другой причине
+    (например, сообщение не изменилось или превышен лимит запросов)
+    :param error: ошибка Telegram API (синхронного или асинхронного клиента)
+    :return: ``True``, если file_id не принят. ``False`` – в обратном случае
+    """
+    description = error.description.lower()
+    return error.error_code == 400 and any(part in description for part in FILE_ID_ERRORS)
+
+
+def make_file(content: bytes, file_name: str | None) -> io.BytesIO:
+    """
+    Создаёт файл для загрузки
+    :param content: содержимое файла
+    :param file_name: имя файла, которое увидит пользователь
+    :return: буфер с содержимым
+    """
+    file = io.BytesIO(content)
+    if file_name is not None:
+        file.name = file_name
+    return file
+
+
+def upload(kind: FileKind, content: bytes, send: Callable[[str | io.BytesIO], types.Message | bool],
+           file_name: str | None = None) -> types.Message | bool:
+    """
+    Отправляет файл: если файл с таким же содержимым уже загружался, передаёт его file_id, иначе загружает файл
+    :param kind: тип файла: ``photo`` – фотография, ``document`` – документ
+    :param content: содержимое файла
+    :param send: функция, которая отправляет файл (принимает file_id или буфер), например,
+        ``lambda photo: BOT.send_photo(chat_id, photo=photo)``
+    :param file_name: имя файла, которое увидит пользователь
+    :return: результат ``send``
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    file_id = get_file_id(kind, digest)
+    if file_id is not None:
+        try:
+            with METRICS.timer('phase_seconds', phase='send_file_id'):
+                return send(file_id)
+        except apihelper.ApiTelegramException as error:
+            if not is_file_id_rejected(error):
+                raise
+            logging.warning(f'file_id не принят, файл загружается заново: {error}')
+            forget_file_id(kind, digest)
+    with METRICS.timer('phase_seconds', phase='upload'):
+        message = send(make_file(content, file_name))
+    remember_file_id(kind, digest, message)
+    return message
+
+
+async def upload_async(kind: FileKind, content: bytes,
+                       send: Callable[[str | io.BytesIO], Awaitable[types.Message | bool]],
+                       file_name: str | None = None) -> types.Message | bool:
+    """
+    То же, что ``upload()``, для асинхронного бота
+    :param kind: тип файла: ``photo`` – фотография, ``document`` – документ
+    :param content: содержимое файла
+    :param send: асинхронная функция, которая отправляет файл (принимает file_id или буфер)
+    :param file_name: имя файла, которое увидит пользователь
+    :return: результат ``send``
+    """
+    from telebot import asyncio_helper  # только для асинхронного бота: требует aiohttp
+    digest = hashlib.sha256(content).hexdigest()
+    file_id = get_file_id(kind, digest)
+    if file_id is not None:
+        try:
+            with METRICS.timer('phase_seconds', phase='send_file_id'):
+                return await send(file_id)
+        except asyncio_helper.ApiTelegramException as error:
+            if not is_file_id_rejected(error):
+                raise
+            logging.warning(f'file_id не принят, файл загружается заново: {error}')
+            forget_file_id(kind, digest)
+    with METRICS.timer('phase_seconds', phase='upload'):
+        message = await send(make_file(content, file_name))
+    remember_file_id(kind, digest, message)
+    return message
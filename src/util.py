@@ -1,25 +1,22 @@
 """
 util.py
 """
-import wget
-import zipfile
-from telebot import types
+import io
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Literal
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFont
 from static import *
+from fonts import FONTS, get_title_font, get_min_width
+from measure import is_wider
+from geometry import Geometry, FULL_GEOMETRY
+from metrics import METRICS
 
 
-def download_font(font_url: str) -> None:
-    """
-    Скачивает шрифт по заданной ссылке
-    :param font_url: ссылка для скачивания шрифта
-    """
-    if not os.path.exists(FONT_PATH):
-        filename = wget.download(font_url)
-
-        with zipfile.ZipFile(filename, 'r') as file:
-            file.extractall(os.getcwd())
-        os.remove(filename)
+title_layouts: OrderedDict[Tuple[str, str, int], Dict] = OrderedDict()
+# ключ – текст, тип заголовка и масштаб, значение – параметры надписи и области для подложки третьей строки
+title_layouts_lock: threading.Lock = threading.Lock()
 
 
 def rgb_to_hex(rgb: Tuple[int, int, int]) -> str:
@@ -82,17 +79,6 @@ def hex_to_hsl(hex_code: str) -> Tuple[int, float, float]:
     return rgb_to_hsl(hex_to_rgb(hex_code))
 
 
-def find_avg_rgb(path_to_image: str) -> Tuple[int, int, int]:
-    """
-    Определяет средний цвет изображения
-    :param path_to_image: путь к изображению
-    :return: средний цвет изображения, цветовое значение RGB
-    """
-    image = Image.open(path_to_image).convert('RGBA')
-    resized = image.resize((1, 1), Image.Resampling.LANCZOS)
-    return resized.load()[0, 0][:3]
-
-
 def rgb_to_greyscale_hex(rgb: Tuple[int, int, int]) -> str:
     """
     Конвертирует цвет из RGB в HEX в оттенках серого
@@ -105,22 +91,32 @@ def rgb_to_greyscale_hex(rgb: Tuple[int, int, int]) -> str:
 
 def create_gradient(hex_code: str, size: Tuple[int, int], reverse: bool = False) -> Image.Image:
     """
-    Создаёт чёрно-белый градиент по заданному цвету и размеру
+    Создаёт чёрно-белый градиент по заданному цвету и размеру.\n
+    Градиенты кэшируются, возвращаемое изображение нельзя изменять
     :param hex_code: цветовое значение HEX
     :param size: размер возвращаемого изображения
     :param reverse: если ложно, градиент от чёрного к светлому (и наоборот)
     :return: изображение с градиентом
     """
+    return make_gradient(max(hex_to_rgb(hex_code)), size, reverse)
+
+
+@lru_cache(maxsize=GRADIENT_CACHE_SIZE)
+def make_gradient(brightness: int, size: Tuple[int, int], reverse: bool) -> Image.Image:
+    """
+    Создаёт чёрно-белый градиент: строка пикселей рассчитывается один раз и растягивается на всю высоту
+    :param brightness: яркость самого светлого края градиента
+    :param size: размер возвращаемого изображения
+    :param reverse: если ложно, градиент от чёрного к светлому (и наоборот)
+    :return: изображение с градиентом
+    """
     width, height = size
-    image = Image.new('L', (width, height))
-    brightness = max(hex_to_rgb(hex_code))
-    draw = ImageDraw.Draw(image)
-    for i in range(1, width):
-        color = int(brightness * (i / width))
-        draw.line((i, 0, i, height), fill=color)
+    if not width or not height:
+        return Image.new('L', size)
+    ramp = bytes(int(brightness * (i / width)) for i in range(width))
     if reverse:
-        image = image.rotate(180)
-    return image
+        ramp = ramp[::-1]
+    return Image.frombytes('L', (width, 1), ramp).resize((width, height), Image.Resampling.NEAREST)
 
 
 def isbright(hex_code: str) -> bool:
@@ -142,45 +138,153 @@ def define_fill(background_col: str) -> Tuple[int, int, int]:
     return (0, 0, 0) if isbright(background_col) else (255, 255, 255)
 
 
-def calculate_coords_rectangle(i: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+def calculate_coords_rectangle(i: int, geometry: Geometry = FULL_GEOMETRY) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     """
     Рассчитывает координаты боковых прямоугольников по порядковому номеру прямоугольника
     :param i: порядковый номер прямоугольника
+    :param geometry: размеры обложки для нужного масштаба
     :return: координаты прямоугольника в формате ``((x1, y1), (x2, y2))``
     """
+    width, height = geometry.rectangle_size
     if i < RECTANGLE_NUM:
-        x1y1 = (0, max(0, RECTANGLE_HEIGHT * i))
-        x2y2 = (RECTANGLE_WIDTH - 1, min(PIC_HEIGHT - 1, RECTANGLE_HEIGHT * (i + 1) - 1))
+        x1y1 = (0, max(0, height * i))
+        x2y2 = (width - 1, min(geometry.pic_height - 1, height * (i + 1) - 1))
     else:
-        x1y1 = (PIC_WIDTH - RECTANGLE_WIDTH, max(0, RECTANGLE_HEIGHT * (i - RECTANGLE_NUM)))
-        x2y2 = (PIC_WIDTH - 1, min(PIC_HEIGHT - 1, RECTANGLE_HEIGHT * (i - RECTANGLE_NUM + 1) - 1))
+        x1y1 = (geometry.pic_width - width, max(0, height * (i - RECTANGLE_NUM)))
+        x2y2 = (geometry.pic_width - 1, min(geometry.pic_height - 1, height * (i - RECTANGLE_NUM + 1) - 1))
     return x1y1, x2y2
 
 
-def pick_title_font(text: str, font: ImageFont.FreeTypeFont) -> ImageFont.FreeTypeFont:
+def pick_title_font(text: str, font: ImageFont.FreeTypeFont,
+                    geometry: Geometry = FULL_GEOMETRY) -> ImageFont.FreeTypeFont:
     """
     Подбирает ширину заголовочного шрифта в зависимости от ширины текста.\n
     Если надпись слишком широкая, возвращает тот же шрифт
     :param text: заголовочный текст
     :param font: вариативный шрифт с осью ширины
+    :param geometry: размеры обложки для нужного масштаба
     :return: шрифт с настроенной осью ширины
     """
     if '\n' in text:
         text = find_longest_line(text)
-    if not iswide(text, font) or istoowide(text, font):
+    if not iswide(text, font, geometry) or istoowide(text, font, geometry=geometry):
         return font
-    else:
-        draw = ImageDraw.Draw(Image.new(mode='RGBA', size=(1000, 1000)))
-        font_condensed = font.font_variant()
-        condensed_font_axes = TITLE_FONT_AXES[:]
-        while draw.textlength(text, font_condensed) > PIC_HEIGHT:
-            condensed_font_axes[WIDTH_AXES_INDEX] -= 1
-            font_condensed.set_variation_by_axes(condensed_font_axes)
+
+    draw = ImageDraw.Draw(Image.new(mode='RGBA', size=(1000, 1000)))
+    font_condensed = FONTS.make_font(font.size)
+    if draw.textlength(text, font_condensed) <= geometry.pic_height:
+        return FONTS.get_font(font.size)
+
+    # ширина текста не убывает с ростом оси ширины, поэтому наибольшее подходящее значение ищется делением пополам
+    condensed_font_axes = TITLE_FONT_AXES[:]
+    low, high = get_min_width(), TITLE_FONT_AXES[WIDTH_AXES_INDEX] - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        condensed_font_axes[WIDTH_AXES_INDEX] = middle
+        font_condensed.set_variation_by_axes(condensed_font_axes)
+        if draw.textlength(text, font_condensed) > geometry.pic_height:
+            high = middle - 1
         else:
-            return font_condensed
+            low = middle
+    condensed_font_axes[WIDTH_AXES_INDEX] = low
+    return FONTS.get_font(font.size, condensed_font_axes)
 
 
-def pick_title_params(text: str, title_type: Literal['upper', 'lower']) -> Dict:
+def get_title_layout(text: str, title_type: Literal['upper', 'lower'],
+                     geometry: Geometry = FULL_GEOMETRY) -> Dict:
+    """
+    Возвращает вёрстку заголовка из кэша, при необходимости рассчитывает её.
+    Названия мероприятий и имена фотографов часто повторяются, поэтому вёрстка хранится
+    в кэше на ``TITLE_LAYOUT_CACHE_SIZE`` заголовков
+    :param text: заголовочный текст
+    :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param geometry: размеры обложки для нужного масштаба
+    :return: словарь с параметрами надписи (``params``) и областями для подложки третьей строки (``bboxes``)
+    """
+    key = (text, title_type, geometry.multiplier)
+    with title_layouts_lock:
+        layout = title_layouts.get(key)
+        if layout is not None:
+            title_layouts.move_to_end(key)
+            METRICS.inc('title_layout_lookups', result='hit')
+            return layout
+
+    METRICS.inc('title_layout_lookups', result='miss')
+    with METRICS.timer('phase_seconds', phase='title_fit'):
+        layout = {'params': make_title_params(text, title_type, geometry), 'bboxes': None}
+    with title_layouts_lock:
+        title_layouts[key] = layout
+        while len(title_layouts) > TITLE_LAYOUT_CACHE_SIZE:
+            title_layouts.popitem(last=False)
+    return layout
+
+
+def pick_title_params(text: str, title_type: Literal['upper', 'lower'],
+                      geometry: Geometry = FULL_GEOMETRY) -> Dict:
+    """
+    Возвращает параметры надписи из кэша вёрсток заголовков.
+    Параметры копируются, потому что цвет надписи сохраняется в них позже
+    :param text: заголовочный текст
+    :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param geometry: размеры обложки для нужного масштаба
+    :return: словарь с параметрами
+    """
+    return dict(get_title_layout(text, title_type, geometry)['params'])
+
+
+def pack_cover_info(cover_info: Dict) -> Dict:
+    """
+    Готовит параметры обложки к передаче в другой процесс:
+    шрифты в параметрах надписей заменяются на размер и значения осей
+    :param cover_info: параметры обложки
+    :return: копия параметров обложки без экземпляров шрифта
+    """
+    packed = dict(cover_info)
+    for key in ('upper_title_params', 'lower_title_params'):
+        params = cover_info.get(key)
+        if params and 'font' in params:
+            packed[key] = params | {'font': FONTS.describe(params['font'])}
+    return packed
+
+
+def unpack_cover_info(packed: Dict) -> Dict:
+    """
+    Восстанавливает параметры обложки, подготовленные ``pack_cover_info()``
+    :param packed: параметры обложки со шрифтами в виде размера и значений осей
+    :return: параметры обложки со шрифтами текущего потока
+    """
+    cover_info = dict(packed)
+    for key in ('upper_title_params', 'lower_title_params'):
+        params = packed.get(key)
+        if params and isinstance(params.get('font'), tuple):
+            cover_info[key] = params | {'font': FONTS.get_font(*params['font'])}
+    return cover_info
+
+
+def find_upper_rectangle_bboxes(text: str, geometry: Geometry = FULL_GEOMETRY) \
+        -> Tuple[Tuple[int, int, int, int], Tuple[int, int, int, int]]:
+    """
+    Рассчитывает области текста, по которым рисуется подложка третьей строки верхнего заголовка.
+    Результат сохраняется в кэше вёрсток заголовков
+    :param text: трёхстрочный верхний заголовок
+    :param geometry: размеры обложки для нужного масштаба
+    :return: область третьей строки по ширине и область первых двух строк по высоте
+    """
+    layout = get_title_layout(text, 'upper', geometry)
+    if layout['bboxes'] is None:
+        params = layout['params']
+        font = FONTS.localize(params['font'])
+        draw = ImageDraw.Draw(Image.new(mode='RGBA', size=(1, 1)))
+        splitted_text = text.split('\n')
+        bbox = draw.textbbox(text='X\nX\n' + splitted_text[-1].strip(), xy=params['xy'], font=font,
+                             spacing=params['spacing'], anchor='ms', align='center')
+        bbox_bottom = draw.textbbox(text='\n'.join(splitted_text[:2]) + '\nX', xy=params['xy'], font=font,
+                                    spacing=params['spacing'], anchor='ms', align='center')
+        layout['bboxes'] = (bbox, bbox_bottom)
+    return layout['bboxes']
+
+
+def make_title_params(text: str, title_type: Literal['upper', 'lower'], geometry: Geometry = FULL_GEOMETRY) -> Dict:
     """
     Устанавливает параметры надписи в зависимости от расположения текста,
     присутствия в нём символов с диакритическими знаками, количества строк.
@@ -188,13 +292,17 @@ def pick_title_params(text: str, title_type: Literal['upper', 'lower']) -> Dict:
     Параметры сохраняются в словарь с информацией об обложке
     :param text: заголовочный текст
     :param title_type: тип заголовка: ``upper`` – верхний, ``lower`` – нижний
+    :param geometry: размеры обложки для нужного масштаба
     :return: словарь с параметрами
     """
+    multiplier = geometry.multiplier
+    pic_width, pic_height = geometry.pic_size
+    title_font = get_title_font(geometry.title_font_size)
     params = {
         'xy':      (0, 0),
         'text':    text,
-        'font':    TITLE_FONT,
-        'spacing': -5 * MULTIPLIER,
+        'font':    title_font,
+        'spacing': -5 * multiplier,
         'fill':    None,
         'align':   'center',
         'anchor':  'ms',
@@ -204,37 +312,33 @@ def pick_title_params(text: str, title_type: Literal['upper', 'lower']) -> Dict:
     diacritics_first = diacritics_in_lines[0]
     diacritics_other = any(diacritics_in_lines[1:])
 
-    summand_for_lower = PIC_HEIGHT - RECTANGLE_HEIGHT if title_type == 'lower' else 0
+    summand_for_lower = pic_height - geometry.rectangle_height if title_type == 'lower' else 0
     if len(lines) == 1:
-        params['xy'] = (PIC_WIDTH / 2, RECTANGLE_HEIGHT) if title_type == 'upper' else (PIC_WIDTH / 2, PIC_HEIGHT)
-        params['font'] = pick_title_font(text, TITLE_FONT)
+        params['xy'] = (pic_width / 2, geometry.rectangle_height) if title_type == 'upper' \
+            else (pic_width / 2, pic_height)
+        params['font'] = pick_title_font(text, title_font, geometry)
         return params
     elif not any(diacritics_in_lines):
-        params['xy'] = (PIC_WIDTH / 2, TITLE_FONT_SIZE_PIXELS + summand_for_lower)
-        params['font'] = pick_title_font(text, TITLE_FONT)
+        params['xy'] = (pic_width / 2, geometry.title_font_size_pixels + summand_for_lower)
+        params['font'] = pick_title_font(text, title_font, geometry)
         return params
 
     if diacritics_first and not diacritics_other:
-        font_size = int(68 * MULTIPLIER)
-        font_size_pixels = 48.5 * MULTIPLIER
-        params['xy'] = (PIC_WIDTH / 2, font_size_pixels + 12.5 * MULTIPLIER + summand_for_lower)
-        params['spacing'] = -4.5 * MULTIPLIER
+        font_size = int(68 * multiplier)
+        font_size_pixels = 48.5 * multiplier
+        params['xy'] = (pic_width / 2, font_size_pixels + 12.5 * multiplier + summand_for_lower)
+        params['spacing'] = -4.5 * multiplier
     elif not diacritics_first and diacritics_other:
-        font_size = int(68 * MULTIPLIER)
-        font_size_pixels = 48.5 * MULTIPLIER
-        params['xy'] = (PIC_WIDTH / 2, font_size_pixels + summand_for_lower)
-        params['spacing'] = 8.25 * MULTIPLIER
+        font_size = int(68 * multiplier)
+        font_size_pixels = 48.5 * multiplier
+        params['xy'] = (pic_width / 2, font_size_pixels + summand_for_lower)
+        params['spacing'] = 8.25 * multiplier
     else:
-        font_size = int(62 * MULTIPLIER)
-        font_size_pixels = 44 * MULTIPLIER
-        params['xy'] = (PIC_WIDTH / 2, font_size_pixels + 12 * MULTIPLIER + summand_for_lower)
-        params['spacing'] = 6 * MULTIPLIER
-    font = ImageFont.truetype(
-        font=FONT_PATH,
-        size=font_size,
-        encoding='unic')
-    font.set_variation_by_axes(TITLE_FONT_AXES)
-    params['font'] = pick_title_font(text, font)
+        font_size = int(62 * multiplier)
+        font_size_pixels = 44 * multiplier
+        params['xy'] = (pic_width / 2, font_size_pixels + 12 * multiplier + summand_for_lower)
+        params['spacing'] = 6 * multiplier
+    params['font'] = pick_title_font(text, get_title_font(font_size), geometry)
     return params
 
 
@@ -248,122 +352,50 @@ def find_longest_line(text: str) -> str:
     return max(lines, key=len)
 
 
-def istoowide(text: str, font: ImageFont.FreeTypeFont, min_width: int = MIN_WIDTH) -> bool:
+def istoowide(text: str, font: ImageFont.FreeTypeFont, min_width: int | None = None,
+              geometry: Geometry = FULL_GEOMETRY) -> bool:
     """
     Определяет, является ли текст, набранный данным шрифтом, слишком широким
     :param text: заголовочный текст
     :param font: заголовочный вариативный шрифт с осью ширины
-    :param min_width: минимальная ширина вариативного шрифта
+    :param min_width: минимальная ширина вариативного шрифта; ``None`` – минимум оси ширины
+    :param geometry: размеры обложки для нужного масштаба
     :return: ``True``, если при минимальном значении ширины у шрифта ``iswide()`` возвращает ``True``. ``False`` – в
     обратном случае
     """
     if '\n' in text:
         text = find_longest_line(text)
-    font_condensed = font.font_variant()
     condensed_font_axes = TITLE_FONT_AXES[:]
-    condensed_font_axes[WIDTH_AXES_INDEX] = min_width
-    font_condensed.set_variation_by_axes(condensed_font_axes)
-    if iswide(text, font_condensed):
+    condensed_font_axes[WIDTH_AXES_INDEX] = min_width if min_width is not None else get_min_width()
+    font_condensed = FONTS.get_font(font.size, condensed_font_axes)
+    if iswide(text, font_condensed, geometry):
         return True
     return False
 
 
-def iswide(text: str, font: ImageFont.FreeTypeFont) -> bool:
+def iswide(text: str, font: ImageFont.FreeTypeFont, geometry: Geometry = FULL_GEOMETRY) -> bool:
     """
-    Определяет, превышает ли ширина текста, набранная данным шрифтом, ширину изображения
+    Определяет, превышает ли ширина текста, набранная данным шрифтом, ширину изображения.
+    Ширина оценивается по таблицам ширин символов, FreeType вызывается только вблизи предела
     :param text: заголовочный текст
     :param font: заголовочный шрифт
+    :param geometry: размеры обложки для нужного масштаба
     :return: ``True``, если заданное условие выполняется. ``False`` – в обратном случае
     """
-    draw = ImageDraw.Draw(Image.new(mode='RGBA', size=(1000, 1000)))
-    if draw.textlength(text, font) >= PHOTO_WIDTH:
-        return True
-    return False
+    return is_wider(text, font, geometry.photo_width)
 
 
-def calculate_copyright_xy(i: int) -> Tuple[int, int]:
+def calculate_copyright_xy(i: int, geometry: Geometry = FULL_GEOMETRY) -> Tuple[int, int]:
     """
     Рассчитывает координаты копирайт-надписи по порядковому номеру, на которой она находится
     :param i: порядковый номер прямоугольника, на котором располагается надпись
+    :param geometry: размеры обложки для нужного масштаба
     :return: координаты надписи в формате ``(x, y)``
     """
     if i < RECTANGLE_NUM:
         x = 0
-        y = RECTANGLE_HEIGHT * (i + 1)
+        y = geometry.rectangle_height * (i + 1)
     else:
-        x = RECTANGLE_WIDTH * (RECTANGLE_NUM - 1)
-        y = RECTANGLE_HEIGHT * (i - RECTANGLE_NUM + 1)
-    return x, y + (6 * MULTIPLIER)
-
-
-def make_corner_type_markup() -> types.InlineKeyboardMarkup:
-    """
-    Создаёт Inline-клавиатуру для выбора типа расположения прямоугольников
-    """
-    markup = types.InlineKeyboardMarkup(row_width=4)
-    corner_btns = [types.InlineKeyboardButton(str(i), callback_data='corner_'+str(i)) for i in CORNER_COORDS.keys()]
-    other_corner_btn = types.InlineKeyboardButton('Собрать самому', callback_data='custom_corner')
-    ready_btn = types.InlineKeyboardButton('Готово', callback_data=f'corner_ready')
-    markup.row(other_corner_btn)
-    markup.add(*corner_btns)
-    markup.row(ready_btn)
-    return markup
-
-
-def make_interface_markup(prefix: str, corners: List[int],
-                          add_random: bool = True, add_ready: bool = True) -> types.InlineKeyboardMarkup:
-    """
-    Создаёт Inline-клавиатуру для редактирования расположения прямоугольников
-    :param prefix: префикс, который будет передаваться в callback_data у кнопок
-    :param corners: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
-    :param add_random: если истинно, добавляет кнопку «Рандом»
-    :param add_ready: если истинно, добавляет кнопку «Готово»
-    :return: Inline-клавиатура
-    """
-    markup = types.InlineKeyboardMarkup(row_width=6)
-    for i in range(RECTANGLE_NUM):
-        col_state_left, col_state_right = (f'_{corners[i]}',
-                                           f'_{corners[i+RECTANGLE_NUM]}') if prefix == CUSTOM_CORNER_PREFIX else ('',
-                                                                                                                   '')
-        row = [types.InlineKeyboardButton(str(i+1), callback_data=f'{prefix}_{str(i)}' + col_state_left)]
-        for j in range(4):
-            row.append(types.InlineKeyboardButton('⬛', callback_data='_'))
-        row.append(types.InlineKeyboardButton(str(i+RECTANGLE_NUM+1),
-                                              callback_data=f'{prefix}_{str(i+RECTANGLE_NUM)}'+col_state_right))
-        markup.add(*row)
-
-    if add_random:
-        random_btn = types.InlineKeyboardButton('Рандом', callback_data=f'{prefix}_random')
-        markup.row(random_btn)
-    if add_ready:
-        ready_btn = types.InlineKeyboardButton('Готово', callback_data=f'{prefix}_ready')
-        markup.row(ready_btn)
-    return markup
-
-
-def make_photo_bg_markup() -> types.InlineKeyboardMarkup:
-    """
-    Создаёт Inline-клавиатуру для выбора фона фотографии
-    :return: Inline-клавиатура
-    """
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    btn_white = types.InlineKeyboardButton('Белый', callback_data=f'bg_white')
-    btn_black = types.InlineKeyboardButton('Серый', callback_data=f'bg_grey')
-    btn_gradient_white = types.InlineKeyboardButton('Чёрно-белый градиент', callback_data=f'bg_grad-white')
-    btn_gradient_grey = types.InlineKeyboardButton('Чёрно-серый градиент', callback_data=f'bg_grad-grey')
-    markup.add(btn_white, btn_black, btn_gradient_white, btn_gradient_grey)
-    return markup
-
-
-def edit_custom_message(call: types.CallbackQuery, corners: List[int]) -> None:
-    """
-    Изменяет сообщение о редактировании расположения прямоугольников
-    :param call: запрос, по которому определяется сообщение для редактирования
-    :param corners: список состояний прямоугольников (закрашен – 1, не закрашен – 0)
-    """
-    preview_pic_path = PATH_TO_SAVE + str(call.message.chat.id) + '_' + PREVIEW_PIC_POSTFIX
-    BOT.edit_message_media(media=types.InputMediaPhoto(open(preview_pic_path, 'rb'),
-                                                       caption='Выбери прямоугольники, которые будут перекрашены'),
-                           chat_id=call.message.chat.id,
-                           message_id=call.message.message_id,
-                           reply_markup=make_interface_markup(CUSTOM_CORNER_PREFIX, corners))
+        x = geometry.rectangle_width * (RECTANGLE_NUM - 1)
+        y = geometry.rectangle_height * (i - RECTANGLE_NUM + 1)
+    return x, y + int(6 * geometry.multiplier)
@@ -0,0 +1,151 @@
+"""
+webhook.py
+"""
+import hmac
+import json
+import queue
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from typing import Callable
+from static import *
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """
+    Принимает обновления от Telegram: проверяет путь и секретный токен, кладёт обновление в очередь
+    """
+    server: 'WebhookHTTPServer'
+
+    def do_POST(self) -> None:
+        """
+        Обрабатывает POST-запрос с обновлением в формате json
+        """
+        webhook = self.server.webhook
+        if self.path != webhook.path:
+            self.send_error(404)
+            return
+        secret_token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        # http.server декодирует заголовки как latin-1, обратное кодирование возвращает исходные байты
+        if not hmac.compare_digest(secret_token.encode('latin-1'), webhook.secret_token):
+            logging.warning(f'Webhook: неверный секретный токен от {self.client_address[0]}')
+            self.send_error(403)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_error(411)
+            return
+        if length < 0:
+            self.send_error(400)
+            return
+        if length > WEBHOOK_MAX_BODY_SIZE:
+            self.send_error(413)
+            return
+        try:
+            update = types.Update.de_json(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            logging.warning(f'Webhook: не удалось разобрать обновление от {self.client_address[0]}')
+            self.send_error(400)
+            return
+
+        if not webhook.put(update):
+            # Telegram повторит запрос позже
+            self.send_error(503)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f'Webhook: {self.address_string()} {format % args}')
+
+
+class WebhookHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP-сервер, у которого есть ссылка на ``WebhookServer``
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], webhook: 'WebhookServer') -> None:
+        self.webhook = webhook
+        super().__init__(address, WebhookRequestHandler)
+
+
+class WebhookServer:
+    """
+    Приём обновлений через webhook.\n
+    HTTP-сервер кладёт обновления в очередь и сразу отвечает Telegram.
+    Один поток разбирает очередь по порядку и передаёт обновления обработчикам бота,
+    параллельность задаётся количеством потоков бота.
+    Количество обновлений, которые ждут в очереди или обрабатываются, ограничено:
+    место освобождается, когда бот закончил обработку обновления, а при превышении сервер отвечает 503
+    """
+
+    def __init__(self, process_update: Callable[[types.Update, Callable[[], None]], None], host: str, port: int,
+                 path: str, secret_token: str | None, queue_size: int = WEBHOOK_QUEUE_SIZE) -> None:
+        """
+        :param process_update: функция, которая передаёт обновление обработчикам и вызывает переданную ей функцию,
+            когда обработка закончена (например, ``BOT.enqueue_update``)
+        :param host: адрес, на котором слушает сервер
+        :param port: порт
+        :param path: путь, на который Telegram присылает обновления
+        :param secret_token: секретный токен из ``set_webhook()``. Без него любой, кто знает адрес,
+            может присылать боту обновления, поэтому сервер не создаётся (``ValueError``)
+        :param queue_size: сколько обновлений может одновременно ждать или обрабатываться;
+            дальше сервер отвечает 503
+        """
+        if not secret_token:
+            raise ValueError('Webhook: не задан секретный токен (переменная окружения WEBHOOK_SECRET_TOKEN)')
+        self.process_update = process_update
+        self.path = path
+        self.secret_token = secret_token.encode()
+        self.updates: queue.Queue[types.Update | None] = queue.Queue()
+        self.in_flight = threading.BoundedSemaphore(max(queue_size, 1))
+        self.http_server = WebhookHTTPServer((host, port), self)
+        self.dispatcher = threading.Thread(target=self.dispatch, name='WebhookDispatcher', daemon=True)
+
+    def put(self, update: types.Update) -> bool:
+        """
+        Кладёт обновление в очередь
+        :param update: обновление
+        :return: ``True``, если обновление принято. ``False`` – если обрабатывается слишком много обновлений
+        """
+        if not self.in_flight.acquire(blocking=False):
+            logging.warning(f'Webhook: очередь заполнена, обновление {update.update_id} отклонено')
+            return False
+        self.updates.put(update)
+        return True
+
+    def dispatch(self) -> None:
+        """
+        Передаёт обновления из очереди обработчикам бота, пока не получит ``None``
+        """
+        while (update := self.updates.get()) is not None:
+            try:
+                self.process_update(update, self.in_flight.release)
+            except Exception:
+                logging.exception(f'Webhook: ошибка при обработке обновления {update.update_id}')
+                self.in_flight.release()
+
+    def serve_forever(self) -> None:
+        """
+        Запускает разбор очереди и HTTP-сервер, блокирует поток до остановки
+        """
+        self.dispatcher.start()
+        host, port = self.http_server.server_address[:2]
+        logging.info(f'Webhook: сервер слушает {host}:{port}{self.path}')
+        try:
+            self.http_server.serve_forever()
+        finally:
+            self.http_server.server_close()
+            self.updates.put(None)
+            self.dispatcher.join()
+
+    def shutdown(self) -> None:
+        """
+        Останавливает сервер, вызывается из другого потока
+        """
+        self.http_server.shutdown()
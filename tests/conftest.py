@@ -0,0 +1,38 @@
+"""
+conftest.py
+"""
+import os
+import sys
+import random
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from static import *  # noqa: E402  пути в static.py считаются от текущей директории, как у бота
+
+
+@pytest.fixture(scope='session')
+def font() -> str:
+    """
+    Путь к файлу шрифта. Шрифт скачивается ботом при первом запуске в его рабочую директорию,
+    поэтому тесты с отрисовкой текста запускаются из неё, а без шрифта пропускаются
+    :return: путь к файлу шрифта
+    """
+    if not os.path.exists(FONT_PATH):
+        pytest.skip(f'нет файла шрифта {FONT_PATH}: запустите тесты из рабочей директории бота')
+    return FONT_PATH
+
+
+@pytest.fixture
+def photo_path(tmp_path) -> str:
+    """
+    Фотография 3:2 с шумом, чтобы у прямоугольников и надписей был неоднородный фон
+    :return: путь к фотографии в png
+    """
+    rng = random.Random(0)
+    photo = Image.new('RGB', (300, 200))
+    photo.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(300 * 200)])
+    path = str(tmp_path / 'photo.png')
+    photo.save(path)
+    return path
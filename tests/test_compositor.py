@@ -0,0 +1,105 @@
+"""
+test_compositor.py
+"""
+import copy
+import random
+import pytest
+from PIL import Image, ImageDraw
+from static import *
+from geometry import Geometry, FULL_GEOMETRY, PREVIEW_GEOMETRY
+from compositor import PreviewCompositor
+from drawing import draw_preview_base, draw_corners, draw_copyright, redraw_rectangle
+from fonts import get_info_font
+from util import calculate_coords_rectangle, define_fill
+
+
+def make_cover_info(photo_path: str) -> Dict:
+    cover_info = copy.deepcopy(COVER_BASE_INFO)
+    cover_info.update(photo=photo_path, upper_color='#94FCFF', lower_color='#5E00A2',
+                      left_color='#F06C00', right_color='#FFFA00')
+    return cover_info
+
+
+def flatten(base: Image.Image, cover_info: Dict, geometry: Geometry, digits: bool,
+            copyright_sign: bool) -> Image.Image:
+    """
+    Рисует превью так, как его рисовали до слоёв: прямоугольники, цифры и копирайт поверх фона одним холстом
+    """
+    image = base.copy()
+    draw = ImageDraw.Draw(image)
+    draw_corners(draw, cover_info, geometry)
+    if digits:
+        for i, state in enumerate(cover_info['corners']):
+            (x1, y1), _ = calculate_coords_rectangle(i, geometry)
+            bg_color = (cover_info['left_color'] if i < RECTANGLE_NUM else cover_info['right_color']) \
+                if state else '#000000'
+            draw.text(xy=(x1 + geometry.rectangle_width / 2, y1 + geometry.rectangle_height / 2),
+                      text=str(i + 1),
+                      font=get_info_font(geometry.info_font_size),
+                      fill=define_fill(bg_color),
+                      align='center',
+                      anchor='mm')
+    if copyright_sign:
+        draw_copyright(draw, cover_info, geometry)
+    return image
+
+
+def assert_same_pixels(image: Image.Image, expected: Image.Image) -> None:
+    assert (image.mode, image.size) == (expected.mode, expected.size)
+    # getbbox() у RGBA смотрит только на альфа-канал, поэтому сравниваются сами пиксели
+    assert image.tobytes() == expected.tobytes()
+
+
+@pytest.fixture(params=[PREVIEW_GEOMETRY, FULL_GEOMETRY], ids=['preview', 'full'])
+def geometry(request) -> Geometry:
+    return request.param
+
+
+def test_corner_types_match_flattened(photo_path, geometry):
+    cover_info = make_cover_info(photo_path)
+    base = draw_preview_base(cover_info, geometry)
+    compositor = PreviewCompositor(base, cover_info['left_color'], cover_info['right_color'], geometry)
+    for corners in CORNER_COORDS.values():
+        cover_info['corners'] = list(corners)
+        compositor.set_corners(cover_info['corners'])
+        assert_same_pixels(compositor.image, flatten(base, cover_info, geometry, False, False))
+
+
+def test_toggles_with_digits_match_flattened(photo_path, geometry, font):
+    rng = random.Random(1)
+    cover_info = make_cover_info(photo_path)
+    base = draw_preview_base(cover_info, geometry)
+    compositor = PreviewCompositor(base, cover_info['left_color'], cover_info['right_color'], geometry)
+    cover_info['corners'] = list(CORNER_COORDS[3])
+    compositor.set_corners(cover_info['corners'])
+    compositor.show_digits()
+    assert_same_pixels(compositor.image, flatten(base, cover_info, geometry, True, False))
+    for _ in range(20):
+        coord = rng.randrange(RECTANGLE_NUM * 2)
+        redraw_rectangle(coord, cover_info['corners'][coord], compositor, cover_info)
+        assert_same_pixels(compositor.image, flatten(base, cover_info, geometry, True, False))
+
+
+def test_copyright_follows_corner_state(photo_path, geometry, font):
+    cover_info = make_cover_info(photo_path)
+    base = draw_preview_base(cover_info, geometry)
+    compositor = PreviewCompositor(base, cover_info['left_color'], cover_info['right_color'], geometry)
+    for coord in (0, RECTANGLE_NUM - 1, RECTANGLE_NUM, RECTANGLE_NUM * 2 - 1):
+        cover_info['copyright_sign'] = coord
+        compositor.set_copyright_sign(coord)
+        for state in (1, 0):
+            redraw_rectangle(coord, 1 - state, compositor, cover_info)
+            assert_same_pixels(compositor.image, flatten(base, cover_info, geometry, False, True))
+
+
+def test_restored_compositor_matches(photo_path, tmp_path, font):
+    cover_info = make_cover_info(photo_path)
+    cover_info['corners'] = list(CORNER_COORDS[5])
+    cover_info['copyright_sign'] = 2
+    base = draw_preview_base(cover_info)
+    compositor = PreviewCompositor(base, cover_info['left_color'], cover_info['right_color'], PREVIEW_GEOMETRY)
+    compositor.set_corners(cover_info['corners'])
+    compositor.set_copyright_sign(cover_info['copyright_sign'])
+    state = compositor.dump(str(tmp_path / 'base.png'))
+    restored = PreviewCompositor.restore(str(tmp_path / 'base.png'), state)
+    assert_same_pixels(restored.image, compositor.image)
@@ -0,0 +1,109 @@
+"""
+test_dispatch.py
+"""
+import time
+import random
+import asyncio
+import threading
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from static import *
+from dispatch import ChatSerialTeleBot
+from async_main import SessionMiddleware
+
+
+CHATS: List[int] = [101, 102, 103]
+MESSAGES_PER_CHAT: int = 10
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> types.Update:
+    return types.Update.de_json({
+        'update_id': update_id,
+        'message':   {'message_id': update_id,
+                      'date':       0,
+                      'chat':       {'id': chat_id, 'type': 'private'},
+                      'from':       {'id': chat_id, 'is_bot': False, 'first_name': 'Тест'},
+                      'text':       text},
+    })
+
+
+def make_updates() -> List[types.Update]:
+    """
+    Сообщения нескольких чатов вперемешку; текст сообщения – его номер в чате
+    """
+    return [make_update(i * len(CHATS) + j, chat_id, str(i))
+            for i in range(MESSAGES_PER_CHAT) for j, chat_id in enumerate(CHATS)]
+
+
+def assert_serial_per_chat(events: List[Tuple[int, str, str]]) -> None:
+    """
+    Проверяет, что сообщения каждого чата обработаны по порядку и их обработчики не пересекались
+    :param events: записи ``(айди чата, 'start' или 'end', текст сообщения)`` в порядке событий
+    """
+    for chat_id in CHATS:
+        chat_events = [(kind, text) for event_chat_id, kind, text in events if event_chat_id == chat_id]
+        assert chat_events == [(kind, str(i)) for i in range(MESSAGES_PER_CHAT) for kind in ('start', 'end')]
+
+
+def test_chat_serial_telebot_keeps_chat_order():
+    bot = ChatSerialTeleBot('1:a', num_threads=4)
+    events = []
+    events_lock = threading.Lock()
+    # первые сообщения всех чатов ждут друг друга: если бы чаты обрабатывались по очереди, барьер бы сломался
+    barrier = threading.Barrier(len(CHATS), timeout=5)
+    rng = random.Random(13)
+
+    @bot.message_handler(content_types=['text'])
+    def handle(message: types.Message) -> None:
+        with events_lock:
+            events.append((message.chat.id, 'start', message.text))
+        if message.text == '0':
+            barrier.wait()
+        time.sleep(rng.random() / 100)
+        with events_lock:
+            events.append((message.chat.id, 'end', message.text))
+
+    processed = []
+    bot.add_chat_update_listener(processed.append)
+    done = threading.Semaphore(0)
+    updates = make_updates()
+    for update in updates:
+        bot.enqueue_update(update, done.release)
+    try:
+        for _ in updates:
+            assert done.acquire(timeout=10)
+    finally:
+        bot.worker_pool.close()
+
+    assert not barrier.broken
+    assert_serial_per_chat(events)
+    assert sorted(processed) == sorted(CHATS * MESSAGES_PER_CHAT)
+    assert bot.chat_queues == dict()
+
+
+def test_session_middleware_keeps_chat_order():
+    bot = AsyncTeleBot('1:a')
+    session_middleware = SessionMiddleware()
+    bot.setup_middleware(session_middleware)
+    events = []
+    first_messages = set()
+    rng = random.Random(13)
+
+    @bot.message_handler(content_types=['text'])
+    async def handle(message: types.Message) -> None:
+        events.append((message.chat.id, 'start', message.text))
+        if message.text == '0':
+            first_messages.add(message.chat.id)
+            # обработчики разных чатов выполняются одновременно
+            while len(first_messages) < len(CHATS):
+                await asyncio.sleep(0.001)
+        await asyncio.sleep(rng.random() / 100)
+        events.append((message.chat.id, 'end', message.text))
+
+    async def run() -> None:
+        await asyncio.wait_for(bot.process_new_updates(make_updates()), timeout=10)
+
+    asyncio.run(run())
+    assert_serial_per_chat(events)
+    assert session_middleware.active_chats == dict()
+    assert session_middleware.chat_locks == dict()
@@ -0,0 +1,56 @@
+"""
+test_photo.py
+"""
+import pytest
+from PIL import Image
+from static import *
+import photo
+from photo import PhotoTooLargeError, PhotoAspectRatioError, prepare_photo, get_scaled_photo
+
+
+def save_photo(tmp_path, size: Tuple[int, int], name: str = 'photo.png') -> str:
+    path = str(tmp_path / name)
+    Image.new('RGB', size, (120, 40, 200)).save(path)
+    return path
+
+
+@pytest.mark.parametrize('size', [(1, 1), (1, 2), (3, 1)])
+def test_tiny_photo_is_scaled(tmp_path, size):
+    prepared_photo = prepare_photo(save_photo(tmp_path, size))
+    assert prepared_photo['size'] == size
+    assert prepared_photo['scaled'][PHOTO_HEIGHT].height == PHOTO_HEIGHT
+    assert get_scaled_photo(prepared_photo, 1).size[0] >= 1
+
+
+@pytest.mark.parametrize('size', [(2000, 100), (30, 600)])
+def test_stretched_photo_is_rejected(tmp_path, size):
+    with pytest.raises(PhotoAspectRatioError):
+        prepare_photo(save_photo(tmp_path, size))
+
+
+def test_large_png_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(photo, 'PHOTO_MAX_PIXELS', 500 * 500)
+    with pytest.raises(PhotoTooLargeError):
+        prepare_photo(save_photo(tmp_path, (600, 600)))
+
+
+def test_large_jpeg_is_reduced_while_decoding(tmp_path, monkeypatch):
+    # jpeg уменьшается при декодировании, поэтому предел пикселей проверяется для уменьшенного размера
+    monkeypatch.setattr(photo, 'PHOTO_MAX_PIXELS', 1500 * 1000)
+    prepared_photo = prepare_photo(save_photo(tmp_path, (3000, 2000), 'photo.jpg'))
+    assert prepared_photo['size'] == (3000, 2000)
+    assert prepared_photo['scaled'][PHOTO_HEIGHT].height == PHOTO_HEIGHT
+
+
+def test_decompression_bomb_is_rejected(tmp_path, monkeypatch):
+    path = save_photo(tmp_path, (300, 200))
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 100)
+    with pytest.raises(PhotoTooLargeError):
+        prepare_photo(path)
+
+
+def test_broken_file_raises_os_error(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'not a photo')
+    with pytest.raises(OSError):
+        prepare_photo(str(path))
@@ -0,0 +1,100 @@
+"""
+test_session.py
+"""
+import copy
+import json
+import pytest
+from collections import OrderedDict
+from typing import Callable
+from static import *
+import state
+from fonts import FONTS
+from photo import get_photo_analysis
+from session import (SessionStore, MemorySessionStore, SQLiteSessionStore, SessionWriter,
+                     dump_session, load_session, encode_next_steps, decode_next_steps)
+from steps import NEXT_STEP_HANDLERS, check_title, check_other_color, save_upper_title, save_other_color
+from util import pack_cover_info, unpack_cover_info, pick_title_params
+
+
+def make_cover_info(photo_path: str) -> Dict:
+    cover_info = copy.deepcopy(COVER_BASE_INFO)
+    cover_info.update(photo=photo_path,
+                      photo_analysis=get_photo_analysis(photo_path),
+                      upper_title='ВЫШКА\nКОНЦЕРТ',
+                      upper_title_params=pick_title_params('ВЫШКА\nКОНЦЕРТ', 'upper'),
+                      lower_title='Фото: Иван Иванов',
+                      lower_title_params=pick_title_params('Фото: Иван Иванов', 'lower'),
+                      corners=list(CORNER_COORDS[4]),
+                      copyright_sign=3)
+    return cover_info
+
+
+NEXT_STEPS: List[Tuple[Callable, Tuple]] = [(check_title, ('upper', save_upper_title)),
+                                            (check_other_color, ('upper_', save_other_color))]
+
+
+def test_session_round_trip(photo_path, font):
+    cover_info = make_cover_info(photo_path)
+    packed = pack_cover_info(cover_info)
+    data = dump_session(packed, [10, 11], encode_next_steps(NEXT_STEPS))
+
+    session = load_session(data)
+    # кортежи (шрифты, координаты и цвета надписей) восстанавливаются, а не остаются списками
+    assert session['cover_info'] == packed
+    assert session['ids_to_delete'] == [10, 11]
+    assert decode_next_steps(session['next_steps'], NEXT_STEP_HANDLERS) == NEXT_STEPS
+
+    unpacked = unpack_cover_info(session['cover_info'])
+    for key in ('upper_title_params', 'lower_title_params'):
+        assert FONTS.describe(unpacked[key]['font']) == FONTS.describe(cover_info[key]['font'])
+        assert unpacked[key] | {'font': None} == cover_info[key] | {'font': None}
+    assert unpacked | {'upper_title_params': None, 'lower_title_params': None} == \
+        cover_info | {'upper_title_params': None, 'lower_title_params': None}
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+def test_writer_keeps_last_state(kind, tmp_path):
+    store = MemorySessionStore() if kind == 'memory' else SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'))
+    writer = SessionWriter(store)
+    writer.put(1, 'первое')
+    writer.put(2, 'второе')
+    writer.put(1, 'последнее')
+    writer.flush()
+    assert store.load_all() == {1: 'последнее', 2: 'второе'}
+
+    writer.put(2, None)
+    writer.put(3, 'третье')
+    writer.close()
+    if kind == 'sqlite':
+        store = SQLiteSessionStore(store.path)
+    assert store.load_all() == {1: 'последнее', 3: 'третье'}
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_load_sessions_skips_broken_chats(photo_path, font, monkeypatch):
+    store = MemorySessionStore()
+    good = dump_session(pack_cover_info(make_cover_info(photo_path)), [5], encode_next_steps(NEXT_STEPS))
+    broken_step = json.loads(good)
+    broken_step['next_steps'][0][0] = 'unknown_step'
+    broken_ids = json.loads(good)
+    del broken_ids['ids_to_delete']
+    store.write({1: good, 2: json.dumps(broken_step), 3: json.dumps(broken_ids), 4: '{"cover_info":'})
+    acquired = []
+    monkeypatch.setattr(state.SESSIONS, 'store', store)
+    monkeypatch.setattr(state.PHOTOS, 'acquire', lambda chat_id, path: acquired.append((chat_id, path)))
+    monkeypatch.setattr(state, 'covers_info', dict())
+    monkeypatch.setattr(state, 'ids_to_delete', dict())
+    monkeypatch.setattr(state, 'last_activity', OrderedDict())
+
+    next_steps = state.load_sessions(NEXT_STEP_HANDLERS)
+
+    # у сломанных чатов не остаётся частично восстановленного состояния
+    assert next_steps == {1: NEXT_STEPS}
+    assert list(state.covers_info) == [1]
+    assert state.ids_to_delete == {1: [5]}
+    assert acquired == [(1, photo_path)]
+    assert list(state.last_activity) == [1]
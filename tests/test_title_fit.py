@@ -0,0 +1,54 @@
+"""
+test_title_fit.py
+"""
+import random
+import pytest
+from PIL import Image, ImageDraw
+from static import *
+from geometry import Geometry, FULL_GEOMETRY, PREVIEW_GEOMETRY
+from fonts import FONTS, FontKey, get_title_font
+from util import pick_title_font, find_longest_line, iswide, istoowide
+
+
+def pick_title_font_linearly(text: str, size: int, geometry: Geometry) -> FontKey:
+    """
+    Подбирает ширину шрифта так, как до деления пополам: уменьшает ось ширины на единицу,
+    пока надпись не поместится
+    :return: размер и значения осей подобранного шрифта
+    """
+    font = get_title_font(size)
+    if '\n' in text:
+        text = find_longest_line(text)
+    if not iswide(text, font, geometry) or istoowide(text, font, geometry=geometry):
+        return FONTS.describe(font)
+    draw = ImageDraw.Draw(Image.new(mode='RGBA', size=(1000, 1000)))
+    font_condensed = FONTS.make_font(size)
+    if draw.textlength(text, font_condensed) <= geometry.pic_height:
+        return size, None
+    condensed_font_axes = TITLE_FONT_AXES[:]
+    while draw.textlength(text, font_condensed) > geometry.pic_height:
+        condensed_font_axes[WIDTH_AXES_INDEX] -= 1
+        font_condensed.set_variation_by_axes(condensed_font_axes)
+    return size, tuple(condensed_font_axes)
+
+
+def make_titles() -> List[str]:
+    rng = random.Random(8)
+    alphabet = 'АБВГДЕЖЗИКЛМНОПРСТУФХЦЧШЩЭЮЯабвгдежзиклмнопрстуфхцчшщэюя ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    titles = [''.join(rng.choice(alphabet) for _ in range(length)).strip() or 'А'
+              for length in range(4, 60) for _ in range(3)]
+    titles += ['Ш' * length for length in range(4, 40)]
+    titles += ['ВЫШКА\nНОВОГОДНИЙ КОНЦЕРТ СТУДЕНТОВ', 'День открытых дверей\nфакультета']
+    return titles
+
+
+@pytest.mark.parametrize('geometry', [PREVIEW_GEOMETRY, FULL_GEOMETRY], ids=['preview', 'full'])
+def test_bisection_matches_linear_search(geometry, font):
+    condensed = 0
+    for text in make_titles():
+        expected = pick_title_font_linearly(text, geometry.title_font_size, geometry)
+        picked = pick_title_font(text, get_title_font(geometry.title_font_size), geometry)
+        assert FONTS.describe(picked) == expected, text
+        condensed += expected[1] is not None and expected[1] != tuple(TITLE_FONT_AXES)
+    # среди заголовков есть те, для которых ширина подбирается
+    assert condensed > 0
@@ -0,0 +1,109 @@
+"""
+test_webhook.py
+"""
+import json
+import queue
+import threading
+import http.client
+import pytest
+from typing import Callable, Iterator
+from telebot import types
+from static import *
+from webhook import WebhookServer
+
+PATH: str = '/webhook'
+SECRET_TOKEN: str = 'secret-token_1'
+BODY: bytes = json.dumps({'update_id': 1}).encode()
+
+
+class Webhook:
+    """
+    Запущенный сервер и обновления, которые он передал боту
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self.updates: queue.Queue[Tuple[types.Update, Callable[[], None]]] = queue.Queue()
+        self.server = WebhookServer(lambda update, on_done: self.updates.put((update, on_done)),
+                                    '127.0.0.1', 0, PATH, SECRET_TOKEN, queue_size)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def post(self, body: bytes = BODY, secret_token: str | bytes | None = SECRET_TOKEN, path: str = PATH,
+             length: int | None = None) -> int:
+        """
+        Отправляет запрос серверу
+        :param length: заголовок ``Content-Length``; ``None`` – длина ``body``
+        :return: код ответа
+        """
+        connection = http.client.HTTPConnection(*self.server.http_server.server_address[:2], timeout=5)
+        try:
+            connection.putrequest('POST', path)
+            connection.putheader('Content-Type', 'application/json')
+            connection.putheader('Content-Length', str(len(body) if length is None else length))
+            if secret_token is not None:
+                connection.putheader('X-Telegram-Bot-Api-Secret-Token', secret_token)
+            connection.endheaders(body if length is None else None)
+            return connection.getresponse().status
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.thread.join(timeout=5)
+
+
+@pytest.fixture
+def webhook() -> Iterator[Webhook]:
+    webhook = Webhook(queue_size=WEBHOOK_QUEUE_SIZE)
+    yield webhook
+    webhook.close()
+
+
+@pytest.mark.parametrize('secret_token', [None, ''])
+def test_secret_token_is_required(secret_token):
+    with pytest.raises(ValueError):
+        WebhookServer(lambda update, on_done: on_done(), '127.0.0.1', 0, PATH, secret_token)
+
+
+def test_accepts_update_with_secret_token(webhook):
+    assert webhook.post() == 200
+    update, on_done = webhook.updates.get(timeout=5)
+    assert update.update_id == 1
+    on_done()
+
+
+@pytest.mark.parametrize('secret_token', [None, 'wrong', SECRET_TOKEN + 'x', 'sécret'.encode('latin-1')],
+                         ids=['missing', 'wrong', 'longer', 'non-ascii'])
+def test_rejects_wrong_secret_token(webhook, secret_token):
+    assert webhook.post(secret_token=secret_token) == 403
+    assert webhook.updates.empty()
+
+
+def test_rejects_unknown_path(webhook):
+    assert webhook.post(path='/other') == 404
+
+
+def test_rejects_large_body(webhook):
+    assert webhook.post(length=WEBHOOK_MAX_BODY_SIZE + 1) == 413
+    assert webhook.updates.empty()
+
+
+def test_rejects_negative_length(webhook):
+    assert webhook.post(length=-1) == 400
+
+
+def test_rejects_broken_json(webhook):
+    assert webhook.post(body=b'{"update_id":') == 400
+
+
+def test_overloaded_until_update_is_processed():
+    webhook = Webhook(queue_size=1)
+    try:
+        assert webhook.post() == 200
+        _, on_done = webhook.updates.get(timeout=5)
+        # бот ещё не закончил обработку: Telegram повторит запрос позже
+        assert webhook.post() == 503
+        on_done()
+        assert webhook.post() == 200
+    finally:
+        webhook.close()